@@ -0,0 +1,173 @@
+import bisect
+import datetime
+import heapq
+import itertools
+from .models import Repeat
+from .triggers import next_occurrence
+
+# 时间前进超过这么久才为已缓存的会话补算新进入范围的触发时间
+AGENDA_REFRESH = datetime.timedelta(hours=1)
+
+# 比任何提醒ID都大，作为二分查找时同一时间的上界
+_MAX_ID = "\uffff"
+
+
+class Agenda:
+    """按会话缓存未来若干天内的触发时间
+
+    每个会话第一次被查询时计算它的提醒在范围内的全部触发时间（已按缓存的节假日数据筛选），
+    按时间排序保存；之后添加和删除提醒只增删对应的条目，查询时丢弃已经过去的条目，
+    时间前进超过 AGENDA_REFRESH 后补算新进入范围的部分。查询前 k 条只需 O(k)。
+    间隔重复的提醒触发次数太多，不预先展开，只记录提醒ID，查询时按需逐个计算后合并。
+    触发时间只用提醒的触发信息计算，延迟加载时不读取分片；需要提醒内容时对查询结果调用 hydrate()。
+    """
+
+    def __init__(self, store, calendar=None, days: int = 7):
+        self.store = store
+        self.calendar = calendar  # HolidayManager，用于跳过不符合节假日类型的日期
+        self.horizon = datetime.timedelta(days=max(1, int(days)))
+        self._sessions = {}  # 会话ID -> [已计算到的时间, [(触发时间, 提醒ID), ...], {间隔提醒ID}]
+        self._session_of = {}  # 提醒ID -> 会话ID，只记录已缓存的会话
+
+    def _occurrences(self, reminder, after: datetime.datetime, until: datetime.datetime) -> list:
+        '''(after, until] 之间的触发时间'''
+        times = []
+        fire_at = next_occurrence(reminder, after, self.calendar)
+        while fire_at is not None and fire_at <= until:
+            times.append(fire_at)
+            fire_at = next_occurrence(reminder, fire_at, self.calendar)
+        return times
+
+    def _iter_occurrences(self, reminder_id: str, after: datetime.datetime, until: datetime.datetime):
+        '''逐个计算间隔提醒在 (after, until] 之间的 (触发时间, 提醒ID)'''
+        reminder = self.store.lookup(reminder_id)
+        if reminder is None:
+            return
+        fire_at = next_occurrence(reminder, after, self.calendar)
+        while fire_at is not None and fire_at <= until:
+            yield fire_at, reminder_id
+            fire_at = next_occurrence(reminder, fire_at, self.calendar)
+
+    def _cached(self, session: str, now: datetime.datetime) -> list:
+        '''会话的缓存，必要时计算、清理和补算'''
+        until = now + self.horizon
+        cached = self._sessions.get(session)
+        if cached is None:
+            entries = []
+            intervals = set()
+            for reminder in self.store.peek(session):
+                self._session_of[reminder.id] = session
+                if reminder.repeat is Repeat.INTERVAL:
+                    intervals.add(reminder.id)
+                    continue
+                entries.extend((fire_at, reminder.id) for fire_at in self._occurrences(reminder, now, until))
+            entries.sort()
+            cached = self._sessions[session] = [until, entries, intervals]
+            return cached
+        entries = cached[1]
+        del entries[:bisect.bisect_left(entries, (now,))]
+        if until - cached[0] >= AGENDA_REFRESH:
+            for reminder in self.store.peek(session):
+                if reminder.repeat is not Repeat.INTERVAL:
+                    entries.extend((fire_at, reminder.id) for fire_at in self._occurrences(reminder, cached[0], until))
+            entries.sort()
+            cached[0] = until
+        return cached
+
+    def _entries(self, session: str, now: datetime.datetime, until: datetime.datetime = None):
+        '''会话在 [now, until]（默认整个缓存范围）内按时间排序的 (触发时间, 提醒ID) 迭代器'''
+        cached = self._cached(session, now)
+        until = cached[0] if until is None else min(until, cached[0])
+        entries = cached[1][:bisect.bisect_right(cached[1], (until, _MAX_ID))]
+        if not cached[2]:
+            return iter(entries)
+        # 查询时刻本身的触发也包含在内，与预先展开的条目一致
+        start = now - datetime.timedelta(microseconds=1)
+        return heapq.merge(entries, *(self._iter_occurrences(reminder_id, start, until) for reminder_id in cached[2]))
+
+    def add(self, session: str, reminder):
+        '''新增提醒，未缓存的会话在查询时再计算'''
+        cached = self._sessions.get(session)
+        if cached is None:
+            return
+        self._session_of[reminder.id] = session
+        if reminder.repeat is Repeat.INTERVAL:
+            cached[2].add(reminder.id)
+            return
+        for fire_at in self._occurrences(reminder, datetime.datetime.now(), cached[0]):
+            bisect.insort(cached[1], (fire_at, reminder.id))
+
+    def remove(self, reminder_id: str):
+        session = self._session_of.pop(reminder_id, None)
+        cached = self._sessions.get(session)
+        if cached is not None:
+            cached[1][:] = [entry for entry in cached[1] if entry[1] != reminder_id]
+            cached[2].discard(reminder_id)
+
+    def invalidate(self, session: str):
+        '''丢弃一个会话的缓存（其他进程修改了它的提醒），下次查询时重新计算'''
+        cached = self._sessions.pop(session, None)
+        if cached is None:
+            return
+        for reminder_id in [rid for rid, owner in self._session_of.items() if owner == session]:
+            del self._session_of[reminder_id]
+
+    def clear(self):
+        '''数据被整体重新加载后丢弃所有缓存'''
+        self._sessions = {}
+        self._session_of = {}
+
+    def _resolve(self, items):
+        '''把提醒ID换成提醒，已删除的提醒跳过'''
+        result = []
+        for item in items:
+            reminder = self.store.lookup(item[-1])
+            if reminder is not None:
+                result.append(item[:-1] + (reminder,))
+        return result
+
+    async def hydrate(self, items: list):
+        '''读取查询结果中的提醒所在会话的完整内容，只涉及返回的这些提醒'''
+        for session in {item[-1].session for item in items}:
+            await self.store.hydrate(session)
+
+    def upcoming(self, session: str, within: datetime.timedelta = None, limit: int = None) -> list:
+        '''会话在 within 内（默认整个缓存范围）按时间排序的 [(触发时间, 提醒)]'''
+        now = datetime.datetime.now()
+        entries = self._entries(session, now, None if within is None else now + within)
+        return self._resolve(list(itertools.islice(entries, limit)))
+
+    def next_times(self, session: str) -> dict:
+        '''会话中每个提醒在缓存范围内的下一次触发时间 {提醒ID: 触发时间}'''
+        now = datetime.datetime.now()
+        cached = self._cached(session, now)
+        result = {}
+        for fire_at, reminder_id in cached[1]:
+            result.setdefault(reminder_id, fire_at)
+        for reminder_id in cached[2]:
+            for fire_at, _ in self._iter_occurrences(reminder_id, now, cached[0]):
+                result[reminder_id] = fire_at
+                break
+        return result
+
+    def upcoming_all(self, within: datetime.timedelta, limit: int = None) -> list:
+        '''所有会话在 within 内按时间排序的 [(触发时间, 会话ID, 提醒)]，首次调用时计算全部会话'''
+        now = datetime.datetime.now()
+
+        def tagged(session):
+            for fire_at, reminder_id in self._entries(session, now, now + within):
+                yield fire_at, session, reminder_id
+
+        streams = [tagged(session) for session, _ in self.store.iter_sessions()]
+        return self._resolve(list(itertools.islice(heapq.merge(*streams), limit)))
+
+
+def format_agenda(items: list) -> str:
+    '''把 [(触发时间, 提醒)] 格式化为按时间排列的多行文本'''
+    lines = []
+    for fire_at, reminder in items:
+        label = "任务" if reminder.is_task else "提醒"
+        # 间隔提醒可能在整分钟之间触发
+        when = fire_at.strftime('%m-%d %H:%M:%S' if fire_at.second else '%m-%d %H:%M')
+        lines.append(f"- {when} {label}：{reminder.text}")
+    return "\n".join(lines)
@@ -0,0 +1,72 @@
+import datetime
+import json
+import os
+from astrbot.api import logger
+from .models import DATETIME_FORMAT
+from .triggers import next_occurrence
+
+# 补发策略：off 不补发，once 每条提醒补发一次，all 每次错过都补发，digest 每个会话汇总成一条消息
+CATCHUP_POLICIES = ("off", "once", "all", "digest")
+
+# 每条提醒最多计算的错过次数（all 策略最多补发这么多次）
+MAX_MISSED_PER_REMINDER = 10
+
+# 补发的截止时间（秒），从开始补发算起：排在正常到期的提醒之后执行，
+# 排队到接近截止时间仍未开始的补发不再调用 LLM，只发送简单消息
+CATCHUP_DEADLINE = 600
+
+# 运行期间记录存活时间的间隔（秒）
+HEARTBEAT_INTERVAL = 15
+
+LAST_ALIVE_FILE = "last_alive.json"
+
+
+def load_last_alive(path: str):
+    '''读取上次记录的存活时间，没有记录时返回 None'''
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return datetime.datetime.strptime(json.load(f)["last_alive"], "%Y-%m-%d %H:%M:%S")
+    except Exception as e:
+        logger.error(f"读取存活时间失败: {e}")
+        return None
+
+
+def save_last_alive(path: str, when: datetime.datetime):
+    # 分区模式下多个进程写同一个文件，临时文件按进程区分
+    tmp_file = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump({"last_alive": when.strftime("%Y-%m-%d %H:%M:%S")}, f)
+    os.replace(tmp_file, path)
+
+
+def compute_missed(sessions, since: datetime.datetime, until: datetime.datetime, calendar=None) -> list:
+    '''批量计算 (since, until] 之间错过的触发时间
+
+    sessions 为 (会话ID, 提醒列表) 的序列，返回 [(会话ID, 提醒, [错过的触发时间, ...])]。
+    节假日类型按已缓存的节假日数据筛选。
+    '''
+    missed = []
+    for session, reminders in sessions:
+        for reminder in reminders:
+            if reminder.dt is None:
+                continue
+            times = []
+            fire_at = next_occurrence(reminder, since, calendar)
+            while fire_at is not None and fire_at <= until and len(times) < MAX_MISSED_PER_REMINDER:
+                times.append(fire_at)
+                fire_at = next_occurrence(reminder, fire_at, calendar)
+            if times:
+                missed.append((session, reminder, times))
+    return missed
+
+
+def format_digest(entries: list) -> str:
+    '''把一个会话中错过的 (提醒, [触发时间]) 汇总成一条消息'''
+    lines = ["机器人离线期间错过了以下提醒/任务："]
+    for reminder, times in entries:
+        label = "任务" if reminder.is_task else "提醒"
+        count = f"（共错过 {len(times)} 次）" if len(times) > 1 else ""
+        lines.append(f"- {times[-1].strftime(DATETIME_FORMAT)} {label}：{reminder.text}{count}")
+    return "\n".join(lines)
@@ -2,15 +2,19 @@ import datetime
 from astrbot.api.event import AstrMessageEvent
 from astrbot.api.star import Context
 from astrbot.api import logger
-from apscheduler.schedulers.base import JobLookupError
-from .utils import filter_thinking_content, parse_datetime, save_reminder_data
+from .utils import filter_thinking_content, parse_datetime
+from .models import MIN_INTERVAL_SECONDS, Interval, Reminder, is_valid_repeat
+from .agenda import format_agenda
+
+REPEAT_HELP = ("重复类型错误，可选值：daily,weekly,monthly,yearly，"
+               "或间隔重复 every_<间隔>[_for_<持续时间>][_<HH:MM>-<HH:MM>]，单位为 s/m/h，"
+               f"如 every_15m_09:00-18:00、every_30s_for_5m（最短间隔 {MIN_INTERVAL_SECONDS} 秒）")
 
 class ReminderCommands:
     def __init__(self, star_instance):
         self.star = star_instance
         self.context = star_instance.context
-        self.reminder_data = star_instance.reminder_data
-        self.data_file = star_instance.data_file
+        self.store = star_instance.store
         self.scheduler_manager = star_instance.scheduler_manager
         self.unique_session = star_instance.unique_session
         self.tools = star_instance.tools
@@ -28,11 +32,18 @@ class ReminderCommands:
         else:
             msg_origin = raw_msg_origin
             
-        reminders = self.reminder_data.get(msg_origin, [])
+        reminders = self.store.get(msg_origin)
         if not reminders:
             yield event.plain_result("当前没有设置任何提醒或任务。")
             return
             
+        # 下一次触发时间取自日程缓存
+        next_times = self.scheduler_manager.agenda.next_times(msg_origin)
+        
+        def next_str(r):
+            fire_at = next_times.get(r.id)
+            return f"，下次: {fire_at.strftime('%m-%d %H:%M')}" if fire_at else ""
+            
         provider = self.context.get_using_provider()
         if provider:
             try:
@@ -42,9 +53,9 @@ class ReminderCommands:
                 
                 for r in reminders:
                     if r.get("is_task", False):
-                        task_items.append(f"- {r['text']} (时间: {r['datetime']})")
+                        task_items.append(f"- {r['text']} (时间: {r['datetime']}{next_str(r)})")
                     else:
-                        reminder_items.append(f"- {r['text']} (时间: {r['datetime']})")
+                        reminder_items.append(f"- {r['text']} (时间: {r['datetime']}{next_str(r)})")
                 
                 # 构建提示
                 prompt = "请帮我整理并展示以下提醒和任务列表，用自然的语言表达：\n"
@@ -75,12 +86,12 @@ class ReminderCommands:
                 if reminders_list:
                     reminder_str += "\n提醒：\n"
                     for i, reminder in enumerate(reminders_list):
-                        reminder_str += f"{i+1}. {reminder['text']} - {reminder['datetime']}\n"
+                        reminder_str += f"{i+1}. {reminder['text']} - {reminder['datetime']}{next_str(reminder)}\n"
                 
                 if tasks_list:
                     reminder_str += "\n任务：\n"
                     for i, task in enumerate(tasks_list):
-                        reminder_str += f"{len(reminders_list)+i+1}. {task['text']} - {task['datetime']}\n"
+                        reminder_str += f"{len(reminders_list)+i+1}. {task['text']} - {task['datetime']}{next_str(task)}\n"
                 
                 reminder_str += "\n使用 /rmd rm <序号> 删除提醒或任务"
                 yield event.plain_result(reminder_str)
@@ -94,12 +105,12 @@ class ReminderCommands:
             if reminders_list:
                 reminder_str += "\n提醒：\n"
                 for i, reminder in enumerate(reminders_list):
-                    reminder_str += f"{i+1}. {reminder['text']} - {reminder['datetime']}\n"
+                    reminder_str += f"{i+1}. {reminder['text']} - {reminder['datetime']}{next_str(reminder)}\n"
             
             if tasks_list:
                 reminder_str += "\n任务：\n"
                 for i, task in enumerate(tasks_list):
-                    reminder_str += f"{len(reminders_list)+i+1}. {task['text']} - {task['datetime']}\n"
+                    reminder_str += f"{len(reminders_list)+i+1}. {task['text']} - {task['datetime']}{next_str(task)}\n"
             
             reminder_str += "\n使用 /rmd rm <序号> 删除提醒或任务"
             yield event.plain_result(reminder_str)
@@ -121,7 +132,7 @@ class ReminderCommands:
         else:
             msg_origin = raw_msg_origin
             
-        reminders = self.reminder_data.get(msg_origin, [])
+        reminders = self.store.get(msg_origin)
         if not reminders:
             yield event.plain_result("没有设置任何提醒或任务。")
             return
@@ -131,17 +142,12 @@ class ReminderCommands:
             return
             
         # 获取要删除的提醒或任务
-        job_id = f"reminder_{msg_origin}_{index-1}"
+        removed = reminders[index - 1]
         
-        # 尝试删除调度任务
-        try:
-            self.scheduler_manager.remove_job(job_id)
-            logger.info(f"Successfully removed job: {job_id}")
-        except JobLookupError:
-            logger.error(f"Job not found: {job_id}")
-            
-        removed = reminders.pop(index - 1)
-        await save_reminder_data(self.data_file, self.reminder_data)
+        # 按提醒ID删除调度任务
+        self.scheduler_manager.remove_reminder_job(removed)
+        
+        await self.store.remove(msg_origin, removed)
         
         is_task = removed.get("is_task", False)
         item_type = "任务" if is_task else "提醒"
@@ -185,7 +191,8 @@ class ReminderCommands:
             # 改进的参数处理逻辑：尝试调整星期和重复类型参数
             if week and week.lower() not in week_map:
                 # 星期格式错误，尝试将其作为repeat处理
-                if week.lower() in ["daily", "weekly", "monthly", "yearly"] or week.lower() in ["workday", "holiday"]:
+                if (week.lower() in ["daily", "weekly", "monthly", "yearly"] or week.lower() in ["workday", "holiday"]
+                        or Interval.parse(week.lower()) is not None):
                     # week参数实际上可能是repeat参数
                     if repeat:
                         # 如果repeat也存在，则将week和repeat作为组合
@@ -209,8 +216,8 @@ class ReminderCommands:
 
             # 验证重复类型
             repeat_types = ["daily", "weekly", "monthly", "yearly"]
-            if repeat and repeat.lower() not in repeat_types:
-                yield event.plain_result("重复类型错误，可选值：daily,weekly,monthly,yearly")
+            if repeat and repeat.lower() not in repeat_types and Interval.parse(repeat.lower()) is None:
+                yield event.plain_result(REPEAT_HELP)
                 return
                 
             # 验证节假日类型
@@ -233,9 +240,6 @@ class ReminderCommands:
             # 获取创建者昵称
             creator_name = event.message_obj.sender.nickname if hasattr(event.message_obj, 'sender') and hasattr(event.message_obj.sender, 'nickname') else None
             
-            if msg_origin not in self.reminder_data:
-                self.reminder_data[msg_origin] = []
-            
             dt = datetime.datetime.strptime(datetime_str, "%Y-%m-%d %H:%M")
             
             # 如果指定了星期，调整到下一个符合的日期
@@ -251,24 +255,26 @@ class ReminderCommands:
             final_repeat = repeat.lower() if repeat else "none"
             if repeat and holiday_type:
                 final_repeat = f"{repeat.lower()}_{holiday_type.lower()}"
+            if not is_valid_repeat(final_repeat):
+                # 如 every_15m_workday 再加上 workday，组合后不是有效的规则
+                yield event.plain_result(f"重复类型与节假日类型的组合无效：{final_repeat}\n{REPEAT_HELP}")
+                return
             
-            item = {
-                "text": text,
-                "datetime": dt.strftime("%Y-%m-%d %H:%M"),
-                "user_name": creator_id,
-                "repeat": final_repeat,
-                "creator_id": creator_id,
-                "creator_name": creator_name,  # 添加创建者昵称
-                "is_task": False  # 明确标记为提醒，不是任务
-            }
+            item = Reminder(
+                text,
+                dt,
+                user_name=creator_id,
+                repeat=final_repeat,
+                creator_id=creator_id,
+                creator_name=creator_name,  # 添加创建者昵称
+                is_task=False  # 明确标记为提醒，不是任务
+            )
             
-            self.reminder_data[msg_origin].append(item)
+            await self.store.add(msg_origin, item)
             
             # 设置定时任务
             self.scheduler_manager.add_job(msg_origin, item, dt)
             
-            await save_reminder_data(self.data_file, self.reminder_data)
-            
             # 生成提示信息
             week_names = ['周一', '周二', '周三', '周四', '周五', '周六', '周日']
             start_str = f"从{week_names[dt.weekday()]}开始，" if week else ""
@@ -299,6 +305,8 @@ class ReminderCommands:
                 repeat_str = "每年的这一天重复，但仅工作日触发"
             elif repeat == "yearly" and holiday_type == "holiday":
                 repeat_str = "每年的这一天重复，但仅法定节假日触发"
+            elif item.interval is not None:
+                repeat_str = item.interval.describe(item.holiday)
             
             yield event.plain_result(f"已设置提醒:\n内容: {text}\n时间: {dt.strftime('%Y-%m-%d %H:%M')}\n{start_str}{repeat_str}\n\n使用 /rmd ls 查看所有提醒和任务")
             
@@ -332,7 +340,8 @@ class ReminderCommands:
             # 改进的参数处理逻辑：尝试调整星期和重复类型参数
             if week and week.lower() not in week_map:
                 # 星期格式错误，尝试将其作为repeat处理
-                if week.lower() in ["daily", "weekly", "monthly", "yearly"] or week.lower() in ["workday", "holiday"]:
+                if (week.lower() in ["daily", "weekly", "monthly", "yearly"] or week.lower() in ["workday", "holiday"]
+                        or Interval.parse(week.lower()) is not None):
                     # week参数实际上可能是repeat参数
                     if repeat:
                         # 如果repeat也存在，则将week和repeat作为组合
@@ -356,8 +365,8 @@ class ReminderCommands:
 
             # 验证重复类型
             repeat_types = ["daily", "weekly", "monthly", "yearly"]
-            if repeat and repeat.lower() not in repeat_types:
-                yield event.plain_result("重复类型错误，可选值：daily,weekly,monthly,yearly")
+            if repeat and repeat.lower() not in repeat_types and Interval.parse(repeat.lower()) is None:
+                yield event.plain_result(REPEAT_HELP)
                 return
                 
             # 验证节假日类型
@@ -380,9 +389,6 @@ class ReminderCommands:
             # 获取创建者昵称
             creator_name = event.message_obj.sender.nickname if hasattr(event.message_obj, 'sender') and hasattr(event.message_obj.sender, 'nickname') else None
             
-            if msg_origin not in self.reminder_data:
-                self.reminder_data[msg_origin] = []
-            
             dt = datetime.datetime.strptime(datetime_str, "%Y-%m-%d %H:%M")
             
             # 如果指定了星期，调整到下一个符合的日期
@@ -398,24 +404,26 @@ class ReminderCommands:
             final_repeat = repeat.lower() if repeat else "none"
             if repeat and holiday_type:
                 final_repeat = f"{repeat.lower()}_{holiday_type.lower()}"
+            if not is_valid_repeat(final_repeat):
+                # 如 every_15m_workday 再加上 workday，组合后不是有效的规则
+                yield event.plain_result(f"重复类型与节假日类型的组合无效：{final_repeat}\n{REPEAT_HELP}")
+                return
             
-            item = {
-                "text": text,
-                "datetime": dt.strftime("%Y-%m-%d %H:%M"),
-                "user_name": "用户",  # 任务模式下不需要特别指定用户名
-                "repeat": final_repeat,
-                "creator_id": creator_id,
-                "creator_name": creator_name,  # 添加创建者昵称
-                "is_task": True  # 明确标记为任务
-            }
+            item = Reminder(
+                text,
+                dt,
+                user_name="用户",  # 任务模式下不需要特别指定用户名
+                repeat=final_repeat,
+                creator_id=creator_id,
+                creator_name=creator_name,  # 添加创建者昵称
+                is_task=True  # 明确标记为任务
+            )
             
-            self.reminder_data[msg_origin].append(item)
+            await self.store.add(msg_origin, item)
             
             # 设置定时任务
             self.scheduler_manager.add_job(msg_origin, item, dt)
             
-            await save_reminder_data(self.data_file, self.reminder_data)
-            
             # 生成提示信息
             week_names = ['周一', '周二', '周三', '周四', '周五', '周六', '周日']
             start_str = f"从{week_names[dt.weekday()]}开始，" if week else ""
@@ -446,12 +454,51 @@ class ReminderCommands:
                 repeat_str = "每年的这一天重复，但仅工作日触发"
             elif repeat == "yearly" and holiday_type == "holiday":
                 repeat_str = "每年的这一天重复，但仅法定节假日触发"
+            elif item.interval is not None:
+                repeat_str = item.interval.describe(item.holiday)
             
             yield event.plain_result(f"已设置任务:\n内容: {text}\n时间: {dt.strftime('%Y-%m-%d %H:%M')}\n{start_str}{repeat_str}\n\n使用 /rmd ls 查看所有提醒和任务")
             
         except Exception as e:
             yield event.plain_result(f"设置任务时出错：{str(e)}")
 
+    async def show_stats(self, event: AstrMessageEvent):
+        '''查看提醒执行队列的状态'''
+        stats = self.scheduler_manager.executor.stats()
+        platforms = "，".join(f"{k} {v}" for k, v in stats["running_by_platform"].items()) or "无"
+        text = (
+            "提醒执行队列状态：\n"
+            f"排队中：{stats['queued']}\n"
+            f"执行中：{stats['running']}（{platforms}）\n"
+            f"已提交：{stats['submitted']}，已完成：{stats['completed']}，失败：{stats['failed']}，"
+            f"接近截止时间改发简单消息：{stats['fallbacks']}\n"
+            f"平均等待：{stats['avg_wait']:.2f} 秒，最长等待：{stats['max_wait']:.2f} 秒"
+        )
+        drift = self.scheduler_manager.drift.stats()
+        timer, handoff = drift["timer"], drift["handoff"]
+        text += (f"\n触发延迟：平均 {timer['avg']:.2f} 秒，最大 {timer['max']:.2f} 秒（{timer['count']} 次）")
+        if handoff["count"]:
+            text += f"，移交主循环平均 {handoff['avg']:.2f} 秒，最大 {handoff['max']:.2f} 秒"
+        if len(self.scheduler_manager.ticker):
+            text += f"\n间隔重复的提醒/任务：{len(self.scheduler_manager.ticker)} 个"
+        upcoming = self.scheduler_manager.agenda.upcoming_all(datetime.timedelta(hours=24))
+        text += f"\n未来 24 小时内所有会话共将触发 {len(upcoming)} 次"
+        lease = self.scheduler_manager.lease
+        if lease is not None:
+            owned = "，".join(str(p) for p in sorted(self.scheduler_manager.owned_partitions)) or "无"
+            text += f"\n当前进程（{lease.owner}）持有分区：{owned}（共 {lease.partitions} 个）"
+        yield event.plain_result(text)
+
+    async def show_agenda(self, event: AstrMessageEvent, hours: int = 24):
+        '''按时间列出当前会话接下来一段时间内将要触发的提醒和任务'''
+        msg_origin = self.tools.get_session_id(event.unified_msg_origin, event.get_sender_id())
+        items = self.scheduler_manager.agenda.upcoming(msg_origin, datetime.timedelta(hours=hours))
+        if not items:
+            yield event.plain_result(f"未来 {hours} 小时内没有将要触发的提醒或任务。")
+            return
+        await self.scheduler_manager.agenda.hydrate(items)
+        yield event.plain_result(f"未来 {hours} 小时内将要触发的提醒和任务：\n" + format_agenda(items))
+
     async def show_help(self, event: AstrMessageEvent):
         '''显示帮助信息'''
         help_text = """提醒与任务功能指令说明：
@@ -468,6 +515,8 @@ class ReminderCommands:
    - /rmd add 交房租 8:05 fri monthly (从周五开始每月)
    - /rmd add 上班打卡 8:30 daily workday (每个工作日，法定节假日不触发)
    - /rmd add 休息提醒 9:00 daily holiday (每个法定节假日触发)
+   - /rmd add 喝水 9:00 every_15m_09:00-18:00 workday (工作日9点到18点每15分钟)
+   - /rmd add 起床 7:00 every_30s_for_5m (7点起每30秒一次，持续5分钟)
 
 2. 添加任务：
    /rmd task <内容> <时间> [开始星期] [重复类型] [--holiday_type=...]
@@ -478,6 +527,8 @@ class ReminderCommands:
 
 3. 查看提醒和任务：
    /rmd ls - 列出所有提醒和任务
+   /rmd agenda [小时数] - 按时间列出接下来将要触发的提醒和任务（默认24小时）
+   /rmd stats - 查看提醒执行队列的排队数量和等待时间
 
 4. 删除提醒或任务：
    /rmd rm <序号> - 删除指定提醒或任务，注意任务序号是提醒序号继承，比如提醒有两个，任务1的序号就是3（llm会自动重编号）
@@ -496,6 +547,8 @@ class ReminderCommands:
    - weekly: 每周重复
    - monthly: 每月重复
    - yearly: 每年重复
+   - every_<间隔>[_for_<持续时间>][_<HH:MM>-<HH:MM>]: 按固定间隔重复，单位为 s/m/h，
+     可限定持续时间或每天的时间窗口，如 every_15m、every_30s_for_5m、every_1h_09:00-18:00
 
 7. 节假日类型：
    - workday: 仅工作日触发（法定节假日不触发）
@@ -0,0 +1,172 @@
+import asyncio
+import datetime
+import heapq
+import itertools
+from astrbot.api import logger
+from .timer_thread import STAGE_TIMER
+from .triggers import MISFIRE_GRACE_TIME, next_occurrence
+
+
+class HeapDispatcher:
+    """基于最小堆的提醒分发器
+
+    所有提醒按下一次触发时间放在同一个堆中，只用一个定时器等待堆顶；
+    提醒触发后才计算它的下一次触发时间并重新入堆。
+    添加为 O(log n)，删除只从字典中移除，堆中的旧条目在弹出时跳过。
+    """
+
+    # 定时器最长等待时间，避免系统时间调整后长时间不触发
+    MAX_SLEEP = 300
+
+    def __init__(self, callback, calendar=None, lead=None, coalesce_missed=False):
+        self.callback = callback  # 协程函数 callback([(session, reminder, fire_at), ...])，同时到期的提醒和各自设定的触发时间一起传入
+        self._heap = []  # (触发时间, 序号, 提醒ID)
+        self._entries = {}  # 提醒ID -> (会话ID, 提醒, 当前有效的序号, 触发时间)
+        self._seq = itertools.count()
+        self._timer = None
+        self._timer_at = None
+        self._stopped = False
+        self.calendar = calendar  # HolidayManager，用于跳过不符合节假日类型的日期
+        self.lead = lead  # lead(reminder) -> timedelta，提前触发的时间
+        self.drift = None  # DriftMonitor，记录定时器实际唤醒时间与堆顶触发时间的偏差
+        # 定时器晚于触发时间唤醒时，错过的多次触发只执行一次，下一次从当前时间算起（用于高频的间隔提醒）
+        self.coalesce_missed = coalesce_missed
+        # on_finished(session, reminder)：提醒没有下一次触发时间、离开分发器时调用
+        self.on_finished = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, session: str, reminder, after: datetime.datetime = None) -> bool:
+        '''加入提醒，没有下一次触发时间时返回 False'''
+        fire_at = self._next(reminder, after or datetime.datetime.now())
+        if fire_at is None:
+            self._entries.pop(reminder.id, None)
+            self._finished(session, reminder)
+            return False
+        self._push(session, reminder, fire_at)
+        if self._timer_at is None or fire_at < self._timer_at:
+            self._arm()
+        return True
+
+    def add_many(self, items, after: datetime.datetime = None) -> int:
+        '''批量加入 (会话ID, 提醒)，最后只重新设置一次定时器，返回加入的数量'''
+        after = after or datetime.datetime.now()
+        added = 0
+        for session, reminder in items:
+            fire_at = self._next(reminder, after)
+            if fire_at is None:
+                self._entries.pop(reminder.id, None)
+                self._finished(session, reminder)
+                continue
+            self._push(session, reminder, fire_at)
+            added += 1
+        if added:
+            self._arm()
+        return added
+
+    def remove(self, reminder_id: str) -> bool:
+        '''移除提醒，堆中的旧条目留到弹出时再丢弃'''
+        if self._entries.pop(reminder_id, None) is None:
+            return False
+        # 失效条目过多时重建堆
+        if len(self._heap) > 64 and len(self._heap) > 2 * len(self._entries):
+            self._heap = [item for item in self._heap if self._is_live(item)]
+            heapq.heapify(self._heap)
+        return True
+
+    def in_sessions(self, sessions) -> dict:
+        '''属于给定会话的提醒 {提醒ID: 会话ID}'''
+        return {reminder_id: entry[0] for reminder_id, entry in self._entries.items() if entry[0] in sessions}
+
+    def next_fire_time(self, reminder_id: str):
+        entry = self._entries.get(reminder_id)
+        return entry[3] if entry else None
+
+    def clear(self):
+        self._heap = []
+        self._entries = {}
+        self._cancel_timer()
+
+    def stop(self):
+        '''停止分发（插件重载时由新的实例调用）'''
+        self._stopped = True
+        self.clear()
+
+    def _next(self, reminder, after: datetime.datetime):
+        '''after 之后的下一次执行时间（已减去提前量）'''
+        lead = self.lead(reminder) if self.lead else None
+        if not lead:
+            return next_occurrence(reminder, after, self.calendar)
+        fire_at = next_occurrence(reminder, after + lead, self.calendar)
+        return fire_at - lead if fire_at is not None else None
+
+    def _finished(self, session: str, reminder):
+        if self.on_finished is not None:
+            try:
+                self.on_finished(session, reminder)
+            except Exception as e:
+                logger.error(f"处理已结束的提醒 {reminder.text} 时出错: {e}")
+
+    def _push(self, session: str, reminder, fire_at: datetime.datetime):
+        seq = next(self._seq)
+        self._entries[reminder.id] = (session, reminder, seq, fire_at)
+        heapq.heappush(self._heap, (fire_at, seq, reminder.id))
+
+    def _is_live(self, item) -> bool:
+        entry = self._entries.get(item[2])
+        return entry is not None and entry[2] == item[1]
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+            self._timer_at = None
+
+    def _arm(self):
+        '''按堆顶的触发时间重新设置唯一的定时器'''
+        self._cancel_timer()
+        while self._heap and not self._is_live(self._heap[0]):
+            heapq.heappop(self._heap)
+        if self._stopped or not self._heap:
+            return
+        fire_at = self._heap[0][0]
+        delay = (fire_at - datetime.datetime.now()).total_seconds()
+        self._timer_at = fire_at
+        self._timer = asyncio.get_event_loop().call_later(
+            min(max(delay, 0), self.MAX_SLEEP), self._on_timer
+        )
+
+    def _on_timer(self):
+        self._timer = None
+        self._timer_at = None
+        now = datetime.datetime.now()
+        if self.drift is not None and self._heap and self._heap[0][0] <= now:
+            self.drift.record(STAGE_TIMER, (now - self._heap[0][0]).total_seconds(), "heap")
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            item = heapq.heappop(self._heap)
+            if not self._is_live(item):
+                continue
+            fire_at, _, reminder_id = item
+            session, reminder, _, _ = self._entries.pop(reminder_id)
+            if (now - fire_at).total_seconds() > MISFIRE_GRACE_TIME:
+                logger.warning(f"提醒 {reminder.text} 错过了触发时间 {fire_at}，跳过本次执行")
+            else:
+                due.append((session, reminder, fire_at))
+            # 触发后才计算下一次触发时间
+            resume = now if self.coalesce_missed else now - datetime.timedelta(seconds=MISFIRE_GRACE_TIME)
+            next_at = self._next(reminder, max(fire_at, resume))
+            if next_at is not None:
+                self._push(session, reminder, next_at)
+            else:
+                self._finished(session, reminder)
+        if due:
+            asyncio.ensure_future(self._run(due))
+        self._arm()
+
+    async def _run(self, items: list):
+        try:
+            await self.callback(items)
+        except Exception as e:
+            logger.error(f"执行 {len(items)} 个到期提醒时出错: {e}")
@@ -0,0 +1,186 @@
+import asyncio
+import datetime
+import heapq
+import itertools
+import time
+from astrbot.api import logger
+
+# 默认的各平台并发上限，未列出的平台只受总并发数限制
+DEFAULT_PLATFORM_LIMITS = "aiocqhttp:4,gewechat:1,wechatpadpro:1,wecom:2"
+
+# 排队超过该秒数时记录警告
+SLOW_WAIT_SECONDS = 10
+
+# 开始执行时距离截止时间不足该秒数，改用备用的快速执行方式
+DEADLINE_MARGIN = 15
+
+# 优先级，数值小的先执行：提醒只需一次简短的 LLM 调用，任务可能调用工具并耗时数十秒
+PRIORITY_REMINDER = 0
+PRIORITY_TASK = 1
+
+# 插件卸载时等待正在执行的提醒结束的最长秒数，超过后取消
+DRAIN_TIMEOUT = 5
+
+
+def deadline_after(fire_at: datetime.datetime, seconds: float) -> float:
+    '''设定的触发时间 fire_at 之后 seconds 秒对应的 time.monotonic() 时间，用作 submit 的截止时间'''
+    return time.monotonic() + (fire_at - datetime.datetime.now(fire_at.tzinfo)).total_seconds() + seconds
+
+
+def parse_platform_limits(text: str) -> dict:
+    '''解析 "aiocqhttp:4,gewechat:1" 格式的平台并发配置'''
+    limits = {}
+    for part in (text or "").replace("，", ",").replace("：", ":").split(","):
+        if not part.strip():
+            continue
+        try:
+            platform, limit = part.split(":", 1)
+            limits[platform.strip()] = max(1, int(limit))
+        except ValueError:
+            logger.warning(f"无法解析平台并发配置: {part}")
+    return limits
+
+
+class _Work:
+    __slots__ = ("platform", "func", "args", "future", "queued_at", "deadline", "fallback")
+
+    def __init__(self, platform, func, args, future, deadline, fallback):
+        self.platform = platform
+        self.func = func
+        self.args = args
+        self.future = future
+        self.queued_at = time.monotonic()
+        self.deadline = deadline  # time.monotonic() 时间，None 表示没有截止时间
+        self.fallback = fallback
+
+
+class FireExecutor:
+    """提醒触发的执行队列
+
+    所有到期提醒的执行（LLM 调用和消息发送）都先进入队列，
+    同时运行的数量受总并发数和各平台并发数限制，某个平台占满时不阻塞其他平台。
+    队列按 (优先级, 截止时间, 提交顺序) 排序；开始执行时已接近截止时间的执行项
+    改为调用它的 fallback（如只发送简单消息）。
+    """
+
+    def __init__(self, max_concurrency: int = 8, platform_limits: dict = None):
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.platform_limits = platform_limits or {}
+        self._pending = []  # (优先级, 截止时间, 序号, 执行项)
+        self._seq = itertools.count()
+        self._running = 0
+        self._running_by_platform = {}
+        self._tasks = set()  # 正在执行的 asyncio.Task
+        self._paused = False  # 暂停时不启动新的执行项，已排队的留在队列中
+        # 统计
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.fallbacks = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def submit(self, platform: str, func, args: tuple = (), priority: int = PRIORITY_REMINDER,
+               deadline: float = None, fallback=None) -> asyncio.Future:
+        '''把一次执行放入队列，返回执行结束时完成的 Future
+
+        deadline 为 time.monotonic() 时间；fallback 与 func 参数相同，接近截止时间时代替 func 执行。
+        '''
+        future = asyncio.get_event_loop().create_future()
+        work = _Work(platform, func, args, future, deadline, fallback)
+        sort_deadline = deadline if deadline is not None else float("inf")
+        heapq.heappush(self._pending, (priority, sort_deadline, next(self._seq), work))
+        self.submitted += 1
+        self._pump()
+        return future
+
+    def _pump(self):
+        '''按队列顺序启动有空闲名额的执行项，所在平台已满的留在队列中'''
+        if self._paused:
+            return
+        blocked = []
+        while self._pending and self._running < self.max_concurrency:
+            entry = heapq.heappop(self._pending)
+            work = entry[-1]
+            limit = self.platform_limits.get(work.platform)
+            if limit is not None and self._running_by_platform.get(work.platform, 0) >= limit:
+                blocked.append(entry)
+                continue
+            self._start(work)
+        for entry in blocked:
+            heapq.heappush(self._pending, entry)
+
+    def _start(self, work: _Work):
+        self._running += 1
+        self._running_by_platform[work.platform] = self._running_by_platform.get(work.platform, 0) + 1
+        wait = time.monotonic() - work.queued_at
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        if wait > SLOW_WAIT_SECONDS:
+            logger.warning(f"平台 {work.platform} 的提醒排队 {wait:.1f} 秒后才开始执行，当前队列长度 {len(self._pending)}")
+        func = work.func
+        if (work.fallback is not None and work.deadline is not None
+                and work.deadline - time.monotonic() < DEADLINE_MARGIN):
+            logger.warning(f"平台 {work.platform} 的提醒即将超过截止时间，改用简单消息发送")
+            self.fallbacks += 1
+            func = work.fallback
+        task = asyncio.ensure_future(self._run(work, func))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, work: _Work, func):
+        try:
+            result = await func(*work.args)
+        except asyncio.CancelledError:
+            self.failed += 1
+            work.future.cancel()
+            raise
+        except Exception as e:
+            self.failed += 1
+            if not work.future.done():
+                work.future.set_exception(e)
+        else:
+            self.completed += 1
+            if not work.future.done():
+                work.future.set_result(result)
+        finally:
+            self._running -= 1
+            self._running_by_platform[work.platform] -= 1
+            self._pump()
+
+    async def drain(self, timeout: float = DRAIN_TIMEOUT) -> int:
+        '''暂停启动新的执行项并等待正在执行的结束，超时后取消仍在执行的，返回取消的数量
+
+        插件卸载时在关闭数据存储之前调用，避免执行到一半的提醒写入已关闭的存储；
+        队列中尚未开始的执行项保留，由接手的新实例调用 resume 后继续执行。
+        '''
+        self._paused = True
+        if not self._tasks:
+            return 0
+        _, running = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for task in running:
+            task.cancel()
+        if running:
+            logger.warning(f"{len(running)} 个提醒/任务在 {timeout} 秒内没有执行完，已取消")
+            await asyncio.gather(*running, return_exceptions=True)
+        return len(running)
+
+    def resume(self):
+        '''恢复启动执行项（重载后的新实例接手队列时调用）'''
+        self._paused = False
+        self._pump()
+
+    def stats(self) -> dict:
+        '''队列长度、运行数量和排队等待时间'''
+        started = self.submitted - len(self._pending)
+        return {
+            "queued": len(self._pending),
+            "running": self._running,
+            "running_by_platform": {k: v for k, v in self._running_by_platform.items() if v},
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "fallbacks": self.fallbacks,
+            "avg_wait": self.total_wait / started if started else 0.0,
+            "max_wait": self.max_wait,
+        }
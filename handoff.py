@@ -0,0 +1,88 @@
+import asyncio
+import hashlib
+import json
+import os
+import sys
+from apscheduler.jobstores.base import JobLookupError
+from astrbot.api import logger
+
+# 旧实例卸载后，重载的新实例在这么多秒内没有接手，停止旧实例的调度，丢弃交接的状态并释放持有的分区
+HANDOFF_TIMEOUT = 10
+
+
+def _source_fingerprint() -> str:
+    '''插件源码的指纹，代码更新后的重载不接手旧实例的状态'''
+    digest = hashlib.md5()
+    plugin_dir = os.path.dirname(os.path.abspath(__file__))
+    for name in sorted(os.listdir(plugin_dir)):
+        if name.endswith(".py"):
+            stat = os.stat(os.path.join(plugin_dir, name))
+            digest.update(f"{name}:{stat.st_mtime_ns}:{stat.st_size};".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def handoff_key(config) -> str:
+    '''只有代码和配置都没有变化的重载才接手旧实例的状态'''
+    payload = json.dumps(dict(config or {}), sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.md5((_source_fingerprint() + payload).encode("utf-8")).hexdigest()
+
+
+def stash_handoff(key: str, state: dict):
+    '''插件卸载时保存交给重载后实例的运行状态'''
+    sys._GLOBAL_SCHEDULER_REGISTRY['handoff'] = (key, state)
+    asyncio.get_event_loop().call_later(HANDOFF_TIMEOUT, _expire, state)
+
+
+def take_handoff(key: str):
+    '''取出旧实例留下的运行状态，代码或配置有变化时返回 None'''
+    entry = sys._GLOBAL_SCHEDULER_REGISTRY.get('handoff')
+    sys._GLOBAL_SCHEDULER_REGISTRY['handoff'] = None
+    if entry is None:
+        return None
+    old_key, state = entry
+    if old_key != key:
+        logger.info("插件代码或配置已变化，重新加载提醒数据并注册定时任务")
+        _discard(state, release=False)  # 新实例会以同一个持有者续租
+        return None
+    return state
+
+
+def _expire(state: dict):
+    entry = sys._GLOBAL_SCHEDULER_REGISTRY.get('handoff')
+    if entry is None or entry[1] is not state:
+        return
+    sys._GLOBAL_SCHEDULER_REGISTRY['handoff'] = None
+    logger.info("插件已卸载，停止调度并丢弃交接的运行状态")
+    _stop_scheduling(state)
+    _discard(state, release=True)
+
+
+def _stop_scheduling(state: dict):
+    '''没有新实例接手时停止旧实例留下的分发器和定时任务，卸载后不再触发提醒'''
+    registry = sys._GLOBAL_SCHEDULER_REGISTRY
+    for key in ("dispatcher", "ticker"):
+        dispatcher = state.get(key)
+        if dispatcher is not None:
+            dispatcher.stop()
+        registry[key] = None
+    scheduler = registry.get('scheduler')
+    if scheduler is not None:
+        for job in scheduler.get_jobs():
+            if job.id.startswith("reminder_"):
+                try:
+                    scheduler.remove_job(job.id)
+                except JobLookupError:
+                    pass
+    registry['manager'] = None
+
+
+def _discard(state: dict, release: bool):
+    lease = state.get("lease")
+    if lease is None:
+        return
+    try:
+        if release:
+            lease.release()
+        lease.close()
+    except Exception as e:
+        logger.error(f"释放分区失败: {e}")
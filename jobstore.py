@@ -0,0 +1,120 @@
+import pickle
+import sqlite3
+from apscheduler.job import Job
+from apscheduler.jobstores.base import BaseJobStore, ConflictingIdError, JobLookupError
+from apscheduler.util import datetime_to_utc_timestamp, utc_timestamp_to_datetime
+from astrbot.api import logger
+
+JOBSTORE_FILE = "jobs.db"
+
+
+class SQLiteJobStore(BaseJobStore):
+    """保存在本地 SQLite 文件中的 APScheduler 任务存储
+
+    每个任务只保存入口函数的引用、参数（提醒类型、会话ID、提醒ID或分钟桶ID）和触发器，
+    不保存提醒内容；重启后任务按保存的下次执行时间继续，不需要重新注册。
+    与 APScheduler 自带的 SQLAlchemyJobStore 格式相同，但只依赖标准库的 sqlite3。
+    """
+
+    def __init__(self, db_file: str, pickle_protocol: int = pickle.HIGHEST_PROTOCOL):
+        super().__init__()
+        self.db_file = db_file
+        self.pickle_protocol = pickle_protocol
+        # 调度器启动前就需要读取任务，连接在创建时打开
+        self.conn = sqlite3.connect(db_file, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS apscheduler_jobs (
+                id TEXT PRIMARY KEY,
+                next_run_time REAL,
+                job_state BLOB NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_next_run_time ON apscheduler_jobs(next_run_time);
+        """)
+        self.conn.commit()
+
+    def lookup_job(self, job_id):
+        row = self.conn.execute("SELECT job_state FROM apscheduler_jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._reconstitute_job(row[0]) if row else None
+
+    def get_due_jobs(self, now):
+        timestamp = datetime_to_utc_timestamp(now)
+        return self._get_jobs("next_run_time <= ?", (timestamp,))
+
+    def get_next_run_time(self):
+        row = self.conn.execute(
+            "SELECT next_run_time FROM apscheduler_jobs WHERE next_run_time IS NOT NULL "
+            "ORDER BY next_run_time LIMIT 1"
+        ).fetchone()
+        return utc_timestamp_to_datetime(row[0]) if row else None
+
+    def get_all_jobs(self):
+        jobs = self._get_jobs()
+        self._fix_paused_jobs_sorting(jobs)
+        return jobs
+
+    def add_job(self, job):
+        try:
+            with self.conn:
+                self.conn.execute(
+                    "INSERT INTO apscheduler_jobs (id, next_run_time, job_state) VALUES (?, ?, ?)",
+                    (job.id, datetime_to_utc_timestamp(job.next_run_time), self._dump(job))
+                )
+        except sqlite3.IntegrityError:
+            raise ConflictingIdError(job.id)
+
+    def update_job(self, job):
+        with self.conn:
+            cursor = self.conn.execute(
+                "UPDATE apscheduler_jobs SET next_run_time = ?, job_state = ? WHERE id = ?",
+                (datetime_to_utc_timestamp(job.next_run_time), self._dump(job), job.id)
+            )
+        if cursor.rowcount == 0:
+            raise JobLookupError(job.id)
+
+    def remove_job(self, job_id):
+        with self.conn:
+            cursor = self.conn.execute("DELETE FROM apscheduler_jobs WHERE id = ?", (job_id,))
+        if cursor.rowcount == 0:
+            raise JobLookupError(job_id)
+
+    def remove_all_jobs(self):
+        with self.conn:
+            self.conn.execute("DELETE FROM apscheduler_jobs")
+
+    def shutdown(self):
+        self.conn.close()
+
+    def _dump(self, job) -> bytes:
+        return pickle.dumps(job.__getstate__(), self.pickle_protocol)
+
+    def _reconstitute_job(self, job_state):
+        job_state = pickle.loads(job_state)
+        job_state["jobstore"] = self
+        job = Job.__new__(Job)
+        job.__setstate__(job_state)
+        job._scheduler = self._scheduler
+        job._jobstore_alias = self._alias
+        return job
+
+    def _get_jobs(self, condition: str = None, params: tuple = ()):
+        sql = "SELECT id, job_state FROM apscheduler_jobs"
+        if condition:
+            sql += " WHERE " + condition
+        sql += " ORDER BY next_run_time"
+        jobs = []
+        failed_job_ids = []
+        for job_id, job_state in self.conn.execute(sql, params).fetchall():
+            try:
+                jobs.append(self._reconstitute_job(job_state))
+            except Exception as e:
+                logger.error(f"无法恢复定时任务 {job_id}，将其删除: {e}")
+                failed_job_ids.append(job_id)
+        if failed_job_ids:
+            with self.conn:
+                self.conn.executemany("DELETE FROM apscheduler_jobs WHERE id = ?", [(i,) for i in failed_job_ids])
+        return jobs
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} (db_file={self.db_file})>"
@@ -0,0 +1,121 @@
+import hashlib
+import math
+import os
+import socket
+import sqlite3
+import time
+
+LEASE_FILE = "leases.db"
+
+# 租约有效期（秒），持有者超过这么久没有续租，分区可以被其他进程接管
+LEASE_TTL = 30
+
+# 续租间隔（秒），应明显小于租约有效期
+LEASE_RENEW_INTERVAL = 10
+
+
+def partition_of(session: str, partitions: int) -> int:
+    '''会话所属的分区，同一会话在所有进程中得到相同的结果'''
+    return int(hashlib.md5(session.encode("utf-8")).hexdigest()[:8], 16) % partitions
+
+
+class LeaseCoordinator:
+    """多个进程通过同一个 SQLite 文件分配会话分区
+
+    每个进程定期续租：记录自己仍然存活，续期已持有的分区，
+    按存活进程数计算应持有的分区数，多出的释放、不足的接管空闲或已过期的分区。
+    进程崩溃后它的租约在 LEASE_TTL 秒后过期，由其他进程接管。
+    """
+
+    def __init__(self, db_file: str, partitions: int, ttl: float = LEASE_TTL, owner: str = None):
+        self.db_file = db_file
+        self.partitions = max(1, int(partitions))
+        self.ttl = ttl
+        # 同一进程内重载插件时持有者不变，可以直接续期原来的租约
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+        # 多个进程同时写入，由 SQLite 的文件锁保证续租的原子性
+        self.conn = sqlite3.connect(db_file, timeout=10, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS leases (
+                partition INTEGER PRIMARY KEY,
+                owner TEXT,
+                expires REAL NOT NULL DEFAULT 0,
+                renewed REAL NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS workers (
+                owner TEXT PRIMARY KEY,
+                seen REAL NOT NULL
+            );
+        """)
+
+    def renew(self):
+        '''续租并重新平衡，返回 (持有的分区集合, {接管的分区: 原持有者最后续租或释放的时间})
+
+        释放到接管之间没有进程调度该分区，接管方需要补发这段时间错过的提醒。
+        '''
+        now = time.time()
+        taken_over = {}
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.execute("INSERT OR REPLACE INTO workers (owner, seen) VALUES (?, ?)", (self.owner, now))
+            self.conn.execute("DELETE FROM workers WHERE seen < ?", (now - self.ttl,))
+            live = self.conn.execute("SELECT COUNT(*) FROM workers").fetchone()[0]
+            target = math.ceil(self.partitions / max(1, live))
+
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO leases (partition) VALUES (?)", [(p,) for p in range(self.partitions)]
+            )
+            # 分区数调小后多出的分区不再使用
+            self.conn.execute("DELETE FROM leases WHERE partition >= ?", (self.partitions,))
+            self.conn.execute(
+                "UPDATE leases SET expires = ?, renewed = ? WHERE owner = ?", (now + self.ttl, now, self.owner)
+            )
+            owned = [row[0] for row in self.conn.execute(
+                "SELECT partition FROM leases WHERE owner = ? ORDER BY partition", (self.owner,)
+            )]
+
+            if len(owned) > target:
+                # 有新进程加入，主动释放多出的分区；记录释放时间，接管方从这里开始补发
+                for partition in owned[target:]:
+                    self.conn.execute(
+                        "UPDATE leases SET owner = NULL, expires = 0, renewed = ? WHERE partition = ?",
+                        (now, partition)
+                    )
+                owned = owned[:target]
+            elif len(owned) < target:
+                free = self.conn.execute(
+                    "SELECT partition, owner, renewed FROM leases WHERE owner IS NULL OR expires < ? "
+                    "ORDER BY partition LIMIT ?", (now, target - len(owned))
+                ).fetchall()
+                for partition, previous_owner, renewed in free:
+                    self.conn.execute(
+                        "UPDATE leases SET owner = ?, expires = ?, renewed = ? WHERE partition = ?",
+                        (self.owner, now + self.ttl, now, partition)
+                    )
+                    owned.append(partition)
+                    # renewed 为 0 表示从未被持有；过期或已释放的分区都要补发 renewed 之后错过的提醒
+                    if renewed > 0 and previous_owner != self.owner:
+                        taken_over[partition] = renewed
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return set(owned), taken_over
+
+    def release(self):
+        '''释放持有的全部分区（插件卸载或重载时），其他进程可立即接管并从释放时间开始补发'''
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.execute(
+                "UPDATE leases SET owner = NULL, expires = 0, renewed = ? WHERE owner = ?", (now, self.owner)
+            )
+            self.conn.execute("DELETE FROM workers WHERE owner = ?", (self.owner,))
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def close(self):
+        self.conn.close()
@@ -4,8 +4,10 @@ from astrbot.api.message_components import *
 from astrbot.api.event.filter import command, command_group
 from astrbot.api import logger, AstrBotConfig
 import os
-from .utils import load_reminder_data
+from .storage import create_reminder_store
 from .scheduler import ReminderScheduler
+from .handoff import handoff_key, stash_handoff, take_handoff
+from .fire_executor import DEFAULT_PLATFORM_LIMITS, parse_platform_limits
 from .tools import ReminderTools
 from .commands import ReminderCommands
 
@@ -24,11 +26,36 @@ class SmartReminder(Star):
         os.makedirs(os.path.join(data_dir, "reminders"), exist_ok=True)
         self.data_file = os.path.join(data_dir, "reminders", "reminder_data.json")
         
-        # 初始化数据存储
-        self.reminder_data = load_reminder_data(self.data_file)
+        # 代码和配置都没有变化的重载直接接手旧实例的运行状态，不重新读取数据和注册定时任务
+        self.handoff_key = handoff_key(self.config)
+        handoff = take_handoff(self.handoff_key)
+        if handoff is not None:
+            self.store = handoff["store"]
+            self.store.reopen()
+        else:
+            # 初始化数据存储（JSON 快照 + 追加日志，或 SQLite）
+            self.store = create_reminder_store(os.path.dirname(self.data_file), self.config)
+            self.store.load()
         
         # 初始化调度器
-        self.scheduler_manager = ReminderScheduler(context, self.reminder_data, self.data_file, self.unique_session)
+        self.scheduler_manager = ReminderScheduler(
+            context, self.store, self.unique_session, self.config.get("scheduler_engine", "apscheduler"),
+            coalesce=self.config.get("coalesce_minute", False),
+            fire_concurrency=self.config.get("fire_concurrency", 8),
+            platform_limits=parse_platform_limits(self.config.get("platform_concurrency", DEFAULT_PLATFORM_LIMITS)),
+            state_dir=os.path.dirname(self.data_file),
+            catchup_policies={
+                "reminder": self.config.get("catchup_reminder", "digest"),
+                "task": self.config.get("catchup_task", "digest"),
+            },
+            spread_seconds=self.config.get("spread_seconds", 0),
+            task_lead_seconds=self.config.get("task_lead_seconds", 0),
+            jobstore=self.config.get("scheduler_jobstore", "memory"),
+            shard_partitions=self.config.get("shard_partitions", 0),
+            agenda_days=self.config.get("agenda_days", 7),
+            timer_thread=self.config.get("scheduler_thread", False),
+            handoff=handoff
+        )
         
         # 初始化工具
         self.tools = ReminderTools(self)
@@ -39,6 +66,12 @@ class SmartReminder(Star):
         # 记录配置信息
         logger.info(f"智能提醒插件启动成功，会话隔离：{'启用' if self.unique_session else '禁用'}")
 
+    async def terminate(self):
+        '''插件卸载或重载时记录存活时间，等正在执行的提醒结束后关闭数据存储，把运行状态留给重载后的实例'''
+        await self.scheduler_manager.shutdown()
+        await self.store.close()
+        stash_handoff(self.handoff_key, self.scheduler_manager.handoff_state())
+
     @filter.llm_tool(name="set_reminder")
     async def set_reminder(self, event, text: str, datetime_str: str, user_name: str = "用户", repeat: str = None, holiday_type: str = None):
         '''设置一个提醒，到时间后会提醒用户
@@ -47,7 +80,7 @@ class SmartReminder(Star):
             text(string): 提醒内容
             datetime_str(string): 提醒时间，格式为 %Y-%m-%d %H:%M
             user_name(string): 提醒对象名称，默认为"用户"
-            repeat(string): 重复类型，可选值：daily(每天)，weekly(每周)，monthly(每月)，yearly(每年)，none(不重复)
+            repeat(string): 重复类型，可选值：daily(每天)，weekly(每周)，monthly(每月)，yearly(每年)，none(不重复)，或按间隔重复 every_<间隔>[_for_<持续时间>][_<HH:MM>-<HH:MM>]（单位 s/m/h，如 every_15m_09:00-18:00 表示每天9点到18点每15分钟，every_30s_for_5m 表示从设定时间起每30秒一次持续5分钟）
             holiday_type(string): 可选，节假日类型：workday(仅工作日执行)，holiday(仅法定节假日执行)
         '''
         return await self.tools.set_reminder(event, text, datetime_str, user_name, repeat, holiday_type)
@@ -59,7 +92,7 @@ class SmartReminder(Star):
         Args:
             text(string): 任务内容，AI将执行的操作，如果是调用其他llm函数，请告诉ai（比如，请调用llm函数，内容是...）
             datetime_str(string): 任务执行时间，格式为 %Y-%m-%d %H:%M
-            repeat(string): 重复类型，可选值：daily(每天)，weekly(每周)，monthly(每月)，yearly(每年)，none(不重复)
+            repeat(string): 重复类型，可选值：daily(每天)，weekly(每周)，monthly(每月)，yearly(每年)，none(不重复)，或按间隔重复 every_<间隔>[_for_<持续时间>][_<HH:MM>-<HH:MM>]（单位 s/m/h，如 every_15m_09:00-18:00 表示每天9点到18点每15分钟，every_30s_for_5m 表示从设定时间起每30秒一次持续5分钟）
             holiday_type(string): 可选，节假日类型：workday(仅工作日执行)，holiday(仅法定节假日执行)
         '''
         return await self.tools.set_task(event, text, datetime_str, repeat, holiday_type)
@@ -108,6 +141,15 @@ class SmartReminder(Star):
             all(string): 可选，是否删除所有任务，可选值：yes/no，默认no
         '''
         return await self.tools.delete_reminder(event, content, time, weekday, repeat_type, date, all, "yes", "no")
+
+    @filter.llm_tool(name="list_upcoming")
+    async def list_upcoming(self, event, hours: int = 24):
+        '''查看当前会话接下来一段时间内将要触发的提醒和任务，按时间排序
+        
+        Args:
+            hours(number): 可选，查看未来多少小时内的提醒和任务，默认24
+        '''
+        return await self.tools.list_upcoming(event, hours)
         
     # 命令组必须定义在主类中
     @command_group("rmd")
@@ -159,6 +201,18 @@ class SmartReminder(Star):
         async for result in self.commands.add_task(event, text, time_str, week, repeat, holiday_type):
             yield result
 
+    @rmd.command("agenda")
+    async def show_agenda(self, event: AstrMessageEvent, hours: int = 24):
+        '''查看接下来一段时间内将要触发的提醒和任务'''
+        async for result in self.commands.show_agenda(event, hours):
+            yield result
+
+    @rmd.command("stats")
+    async def show_stats(self, event: AstrMessageEvent):
+        '''查看提醒执行队列的状态'''
+        async for result in self.commands.show_stats(event):
+            yield result
+
     @rmd.command("help")
     async def show_help(self, event: AstrMessageEvent):
         '''显示帮助信息'''
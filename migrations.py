@@ -0,0 +1,76 @@
+import datetime
+from astrbot.api import logger
+from .models import DATETIME_FORMAT, new_reminder_id
+
+# 当前的数据格式版本，与数据一起保存：
+# JSON 快照写在 __meta__ 中，分片存储写在 manifest.json 中，SQLite 使用 PRAGMA user_version。
+# 1: 旧格式，可能存在只有时分的时间（如 "14:50"），没有提醒ID
+# 2: 时间统一为 %Y-%m-%d %H:%M，每条提醒都有ID
+SCHEMA_VERSION = 2
+
+
+class MigrationReport:
+    """一次迁移的统计"""
+
+    def __init__(self, from_version: int):
+        self.from_version = from_version
+        self.total = 0
+        self.upgraded = 0
+        self.dropped = 0
+
+    def log(self, source: str):
+        logger.info(
+            f"{source} 已从版本 {self.from_version} 升级到 {SCHEMA_VERSION}："
+            f"共 {self.total} 条，升级 {self.upgraded} 条，丢弃 {self.dropped} 条"
+        )
+
+
+def _upgrade_v1(record: dict, now: datetime.datetime):
+    '''补全只有时分的时间、分配ID，无法解析时间的记录返回 None'''
+    record = dict(record)
+    datetime_str = record.get("datetime")
+    if not datetime_str or not isinstance(datetime_str, str):
+        return None
+    if ":" in datetime_str and len(datetime_str.split(":")) == 2 and "-" not in datetime_str:
+        # 处理只有时分格式的时间（如"14:50"），时间已过则设置为明天
+        try:
+            hour, minute = map(int, datetime_str.split(":"))
+            dt = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        except ValueError:
+            return None
+        if dt < now:
+            dt += datetime.timedelta(days=1)
+        record["datetime"] = dt.strftime(DATETIME_FORMAT)
+    else:
+        try:
+            datetime.datetime.strptime(datetime_str, DATETIME_FORMAT)
+        except ValueError:
+            return None
+    if not record.get("id"):
+        record["id"] = new_reminder_id()
+    return record
+
+
+# 版本 n 升级到 n+1 的步骤
+UPGRADE_STEPS = {
+    1: _upgrade_v1,
+}
+
+
+def upgrade_records(records, version: int, report: MigrationReport, now: datetime.datetime = None):
+    '''逐条把记录升级到当前版本（生成器），无法升级的记录被丢弃并计入报告'''
+    now = now or datetime.datetime.now()
+    for record in records:
+        report.total += 1
+        upgraded = record
+        for step in range(version, SCHEMA_VERSION):
+            upgraded = UPGRADE_STEPS[step](upgraded, now)
+            if upgraded is None:
+                break
+        if upgraded is None:
+            report.dropped += 1
+            logger.warning(f"丢弃无法升级的提醒: {record}")
+            continue
+        if upgraded != record:
+            report.upgraded += 1
+        yield upgraded
@@ -0,0 +1,327 @@
+import datetime
+import re
+import sys
+import uuid
+from enum import Enum
+
+DATETIME_FORMAT = "%Y-%m-%d %H:%M"
+
+
+class Repeat(Enum):
+    '''重复类型'''
+    NONE = "none"
+    DAILY = "daily"
+    WEEKLY = "weekly"
+    MONTHLY = "monthly"
+    YEARLY = "yearly"
+    INTERVAL = "interval"  # 按固定间隔重复，间隔和时间窗口见 Interval
+
+
+class HolidayType(Enum):
+    '''节假日类型，ANY 表示不限制'''
+    ANY = ""
+    WORKDAY = "workday"
+    HOLIDAY = "holiday"
+
+
+# 数据文件中的 repeat 字符串与 (重复类型, 节假日类型) 的双向映射
+_REPEAT_NAMES = {}
+for _repeat in Repeat:
+    if _repeat is Repeat.INTERVAL:
+        continue
+    _REPEAT_NAMES[(_repeat, HolidayType.ANY)] = _repeat.value
+    if _repeat is not Repeat.NONE:
+        for _holiday in (HolidayType.WORKDAY, HolidayType.HOLIDAY):
+            _REPEAT_NAMES[(_repeat, _holiday)] = f"{_repeat.value}_{_holiday.value}"
+_REPEAT_MODES = {name: mode for mode, name in _REPEAT_NAMES.items()}
+
+# 间隔重复允许的最短间隔（秒）
+MIN_INTERVAL_SECONDS = 10
+
+_UNITS = (("h", 3600, "小时"), ("m", 60, "分钟"), ("s", 1, "秒"))
+_UNIT_SECONDS = {unit: seconds for unit, seconds, _ in _UNITS}
+_INTERVAL_PATTERN = re.compile(
+    r"every_(\d+)([smh])(?:_for_(\d+)([smh]))?(?:_(\d{1,2}):(\d{2})-(\d{1,2}):(\d{2}))?(?:_(workday|holiday))?"
+)
+
+
+def _format_seconds(seconds: int) -> str:
+    for unit, size, _ in _UNITS:
+        if seconds % size == 0:
+            return f"{seconds // size}{unit}"
+
+
+def _describe_seconds(seconds: int) -> str:
+    for _, size, label in _UNITS:
+        if seconds % size == 0:
+            return f"{seconds // size} {label}"
+
+
+class Interval:
+    """间隔重复的规则
+
+    数据文件中的 repeat 写作 every_<间隔>[_for_<持续时间>][_<HH:MM>-<HH:MM>][_<节假日类型>]，
+    单位为 s/m/h，如 every_15m_09:00-18:00_workday（工作日 9 点到 18 点每 15 分钟）、
+    every_30s_for_5m（从设定时间起每 30 秒一次，持续 5 分钟）。
+    没有时间窗口时从提醒时间起按间隔触发；有时间窗口时每天从窗口开始按间隔触发，
+    窗口结束时间不触发，提醒时间只决定从哪一天开始。
+    """
+
+    __slots__ = ("seconds", "duration", "window")
+
+    def __init__(self, seconds: int, duration: int = None, window: tuple = None):
+        self.seconds = seconds
+        self.duration = duration  # 持续秒数，None 表示一直重复
+        self.window = window  # (开始 datetime.time, 结束 datetime.time)，None 表示全天
+
+    @classmethod
+    def parse(cls, text: str):
+        '''解析 repeat 字符串，返回 (Interval, HolidayType)，格式不正确时返回 None'''
+        match = _INTERVAL_PATTERN.fullmatch(text or "")
+        if match is None:
+            return None
+        count, unit, duration, duration_unit, start_h, start_m, end_h, end_m, holiday = match.groups()
+        seconds = int(count) * _UNIT_SECONDS[unit]
+        if seconds < MIN_INTERVAL_SECONDS:
+            return None
+        if duration is not None:
+            duration = int(duration) * _UNIT_SECONDS[duration_unit]
+            if duration <= 0:
+                return None
+        window = None
+        if start_h is not None:
+            try:
+                window = (datetime.time(int(start_h), int(start_m)), datetime.time(int(end_h), int(end_m)))
+            except ValueError:
+                return None
+            if window[0] >= window[1]:
+                # 不支持跨过零点的窗口
+                return None
+        return cls(seconds, duration, window), HolidayType(holiday or "")
+
+    @property
+    def name(self) -> str:
+        '''不含节假日类型的 repeat 字符串'''
+        name = f"every_{_format_seconds(self.seconds)}"
+        if self.duration:
+            name += f"_for_{_format_seconds(self.duration)}"
+        if self.window:
+            name += f"_{self.window[0].strftime('%H:%M')}-{self.window[1].strftime('%H:%M')}"
+        return name
+
+    def describe(self, holiday: "HolidayType" = None) -> str:
+        '''中文说明，如 "每 15 分钟重复（每天 09:00-18:00），仅工作日触发"'''
+        text = f"每 {_describe_seconds(self.seconds)}重复"
+        if self.window:
+            text += f"（每天 {self.window[0].strftime('%H:%M')}-{self.window[1].strftime('%H:%M')}）"
+        if self.duration:
+            text += f"，持续 {_describe_seconds(self.duration)}"
+        if holiday is HolidayType.WORKDAY:
+            text += "，仅工作日触发"
+        elif holiday is HolidayType.HOLIDAY:
+            text += "，仅法定节假日触发"
+        return text
+
+
+# 有独立属性的字段，其余字段原样保存在 extra 中
+FIELDS = ("id", "text", "datetime", "user_name", "repeat", "creator_id", "creator_name", "is_task")
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def new_reminder_id() -> str:
+    return uuid.uuid4().hex
+
+
+def is_valid_repeat(repeat: str) -> bool:
+    '''repeat 字符串（含节假日类型后缀）是否为支持的重复规则'''
+    return repeat in _REPEAT_MODES or Interval.parse(repeat) is not None
+
+
+class Reminder:
+    """一条提醒或任务
+
+    时间在创建时解析一次，之后直接使用 dt；重复类型保存为枚举，
+    会话、平台和创建者字符串经过驻留，大量提醒共享同一个对象。
+    每条提醒在创建时分配一个不变的 id，定时任务ID和索引都以它为键。
+    通过 from_dict / to_dict 与数据文件中的格式无损转换，
+    同时支持 reminder["text"]、reminder.get(...) 等字典式访问。
+    """
+
+    __slots__ = ("id", "text", "dt", "user_name", "repeat", "holiday", "interval", "creator_id", "creator_name",
+                 "is_task", "session", "platform", "extra", "_raw")
+
+    def __init__(self, text: str, dt: datetime.datetime, user_name: str = "用户", repeat: str = "none",
+                 creator_id: str = None, creator_name: str = None, is_task: bool = False,
+                 session: str = None, extra: dict = None, id: str = None):
+        self.id = id or new_reminder_id()
+        self.text = text
+        self.dt = dt
+        self.user_name = user_name
+        self.creator_id = _intern(creator_id)
+        self.creator_name = _intern(creator_name)
+        self.is_task = bool(is_task)
+        self.extra = extra or None
+        self._raw = None  # 无法解析的原始字段值，保存时原样写回
+        self.set_repeat(repeat)
+        self.bind(session)
+
+    def bind(self, session: str):
+        '''设置所属会话'''
+        self.session = _intern(session)
+        self.platform = _intern(session.split(":", 1)[0]) if session else None
+
+    def update_from(self, other: "Reminder"):
+        '''用另一条提醒的内容覆盖当前对象，对象本身（以及引用它的定时任务）保持不变'''
+        for name in ("id", "text", "dt", "user_name", "repeat", "holiday", "interval", "creator_id", "creator_name",
+                     "is_task", "extra", "_raw"):
+            setattr(self, name, getattr(other, name))
+
+    def set_repeat(self, repeat: str):
+        mode = _REPEAT_MODES.get(repeat or "none")
+        self.interval = None
+        if mode is None and isinstance(repeat, str):
+            parsed = Interval.parse(repeat)
+            if parsed is not None:
+                self.interval, holiday = parsed
+                mode = (Repeat.INTERVAL, holiday)
+        if mode is None:
+            # 未知的重复类型，保留原值
+            self.repeat, self.holiday = Repeat.NONE, HolidayType.ANY
+            self._set_raw("repeat", repeat)
+        else:
+            self.repeat, self.holiday = mode
+            self._set_raw("repeat", None)
+
+    def set_datetime(self, dt: datetime.datetime):
+        self.dt = dt
+        self._set_raw("datetime", None)
+
+    def _set_raw(self, key: str, value):
+        if value is not None:
+            if self._raw is None:
+                self._raw = {}
+            self._raw[key] = value
+        elif self._raw is not None:
+            self._raw.pop(key, None)
+            if not self._raw:
+                self._raw = None
+
+    @property
+    def repeat_name(self) -> str:
+        '''数据文件中的 repeat 字符串，如 daily_workday'''
+        if self._raw is not None and "repeat" in self._raw:
+            return self._raw["repeat"]
+        if self.repeat is Repeat.INTERVAL:
+            name = self.interval.name
+            return f"{name}_{self.holiday.value}" if self.holiday is not HolidayType.ANY else name
+        return _REPEAT_NAMES[(self.repeat, self.holiday)]
+
+    @property
+    def datetime_str(self):
+        if self._raw is not None and "datetime" in self._raw:
+            return self._raw["datetime"]
+        return self.dt.strftime(DATETIME_FORMAT) if self.dt is not None else None
+
+    @property
+    def once(self) -> bool:
+        '''是否为一次性提醒（未知的重复类型不算）'''
+        return self.repeat is Repeat.NONE and (self._raw is None or "repeat" not in self._raw)
+
+    @classmethod
+    def from_dict(cls, data, session: str = None) -> "Reminder":
+        '''从数据文件中的字典创建'''
+        if isinstance(data, cls):
+            if session is not None:
+                data.bind(session)
+            return data
+        value = data.get("datetime")
+        try:
+            dt = datetime.datetime.strptime(value, DATETIME_FORMAT)
+        except (TypeError, ValueError):
+            dt = None
+        extra = {k: v for k, v in data.items() if k not in FIELDS}
+        reminder = cls(
+            data.get("text"),
+            dt,
+            user_name=data.get("user_name"),
+            repeat=data.get("repeat", "none"),
+            creator_id=data.get("creator_id"),
+            creator_name=data.get("creator_name"),
+            is_task=data.get("is_task", False),
+            session=session,
+            extra=extra,
+            id=data.get("id"),
+        )
+        if dt is None and value is not None:
+            reminder._set_raw("datetime", value)
+        return reminder
+
+    def to_dict(self) -> dict:
+        '''转换为数据文件中的字典格式'''
+        data = {
+            "id": self.id,
+            "text": self.text,
+            "datetime": self.datetime_str,
+            "user_name": self.user_name,
+            "repeat": self.repeat_name,
+            "creator_id": self.creator_id,
+            "creator_name": self.creator_name,
+            "is_task": self.is_task,
+        }
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    # 字典式访问，兼容按字段名读取提醒的代码
+    def __getitem__(self, key):
+        if key == "text":
+            return self.text
+        if key == "id":
+            return self.id
+        if key == "datetime":
+            return self.datetime_str
+        if key == "repeat":
+            return self.repeat_name
+        if key == "is_task":
+            return self.is_task
+        if key in ("user_name", "creator_id", "creator_name"):
+            return getattr(self, key)
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            value = self[key]
+        except KeyError:
+            return default
+        return default if value is None else value
+
+    def __contains__(self, key) -> bool:
+        if key in FIELDS:
+            return self[key] is not None
+        return bool(self.extra) and key in self.extra
+
+    def same_content(self, other: "Reminder") -> bool:
+        '''除 id 以外的内容是否相同，用于匹配没有 id 的旧日志记录'''
+        return self._key()[1:] == other._key()[1:]
+
+    def _key(self) -> tuple:
+        return (self.id, self.text, self.dt, self.user_name, self.repeat, self.holiday,
+                self.interval.name if self.interval else None, self.creator_id, self.creator_name, self.is_task,
+                self.extra, self._raw)
+
+    def __eq__(self, other):
+        if isinstance(other, Reminder):
+            return self._key() == other._key()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Reminder({self.to_dict()!r})"
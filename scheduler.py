@@ -1,11 +1,28 @@
+import asyncio
 import datetime
 import json
+import os
+import time
+from apscheduler.events import EVENT_JOB_SUBMITTED
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.schedulers.base import JobLookupError
+from apscheduler.schedulers.base import JobLookupError, STATE_RUNNING, STATE_PAUSED
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.date import DateTrigger
 from astrbot.api import logger
 from astrbot.api.event import MessageChain
 from astrbot.api.message_components import At, Plain
-from .utils import is_outdated, save_reminder_data, HolidayManager
+from .utils import is_outdated, HolidayManager
+from .models import Repeat, HolidayType, Reminder
+from .dispatcher import HeapDispatcher
+from .agenda import Agenda
+from .jobstore import JOBSTORE_FILE, SQLiteJobStore
+from .timer_thread import SCHEDULED_FIRE_TIME, DriftMonitor, FireTimeExecutor, MainLoopExecutor, start_timer_loop
+from .lease import LEASE_FILE, LEASE_RENEW_INTERVAL, LeaseCoordinator, partition_of
+from .triggers import MISFIRE_GRACE_TIME, HolidayCronTrigger, LeadTrigger, next_occurrence, spread_offset
+from .fire_executor import FireExecutor, PRIORITY_REMINDER, PRIORITY_TASK, deadline_after
+from .catchup import (CATCHUP_DEADLINE, HEARTBEAT_INTERVAL, LAST_ALIVE_FILE, compute_missed, format_digest,
+                      load_last_alive, save_last_alive)
+from .storage import run_in_thread
 from .reminder_handlers import ReminderMessageHandler, TaskExecutor, ReminderExecutor, SimpleMessageSender
 
 # 使用全局注册表来保存调度器实例
@@ -13,14 +30,56 @@ from .reminder_handlers import ReminderMessageHandler, TaskExecutor, ReminderExe
 import sys
 if not hasattr(sys, "_GLOBAL_SCHEDULER_REGISTRY"):
     sys._GLOBAL_SCHEDULER_REGISTRY = {
-        'scheduler': None
+        'scheduler': None,
+        'dispatcher': None,
+        'manager': None,
+        'handoff': None,
+        'drift': None,
+        'ticker': None
     }
     logger.info("创建全局调度器注册表")
 else:
     logger.info("使用现有全局调度器注册表")
+    sys._GLOBAL_SCHEDULER_REGISTRY.setdefault('dispatcher', None)
+    sys._GLOBAL_SCHEDULER_REGISTRY.setdefault('manager', None)
+    sys._GLOBAL_SCHEDULER_REGISTRY.setdefault('handoff', None)
+    sys._GLOBAL_SCHEDULER_REGISTRY.setdefault('drift', None)
+    sys._GLOBAL_SCHEDULER_REGISTRY.setdefault('ticker', None)
+
+# 回调类型 -> 执行方法
+JOB_CALLBACKS = {
+    "reminder": "_reminder_callback",
+    "workday": "_check_and_execute_workday",
+    "holiday": "_check_and_execute_holiday",
+}
+
+
+async def run_reminder_job(kind: str, session: str, reminder_id: str):
+    '''所有提醒定时任务的入口
+
+    任务只记录回调类型、会话和提醒ID，不引用某个 ReminderScheduler 实例，
+    插件重载后保留下来的任务会交给注册表中当前的实例执行。
+    '''
+    manager = sys._GLOBAL_SCHEDULER_REGISTRY.get('manager')
+    if manager is None:
+        logger.warning(f"调度器未初始化，跳过提醒 {reminder_id}")
+        return
+    await manager.run_job(kind, session, reminder_id)
+
+
+async def run_bucket_job(bucket_id: str):
+    '''分钟合并模式下一个分钟桶的任务入口，同样不引用具体实例'''
+    manager = sys._GLOBAL_SCHEDULER_REGISTRY.get('manager')
+    if manager is None:
+        logger.warning(f"调度器未初始化，跳过 {bucket_id}")
+        return
+    await manager.run_bucket(bucket_id)
 
 class ReminderScheduler:
-    def __new__(cls, context, reminder_data, data_file, unique_session=False):
+    def __new__(cls, context, store, unique_session=False, engine="apscheduler", coalesce=False,
+                fire_concurrency=8, platform_limits=None, state_dir=None, catchup_policies=None,
+                spread_seconds=0, task_lead_seconds=0, jobstore="memory", shard_partitions=0, agenda_days=7,
+                timer_thread=False, handoff=None):
         # 使用实例属性存储初始化状态
         instance = super(ReminderScheduler, cls).__new__(cls)
         instance._first_init = True  # 首次初始化
@@ -28,264 +87,750 @@ class ReminderScheduler:
         logger.info("创建 ReminderScheduler 实例")
         return instance
     
-    def __init__(self, context, reminder_data, data_file, unique_session=False):
+    def __init__(self, context, store, unique_session=False, engine="apscheduler", coalesce=False,
+                 fire_concurrency=8, platform_limits=None, state_dir=None, catchup_policies=None,
+                 spread_seconds=0, task_lead_seconds=0, jobstore="memory", shard_partitions=0, agenda_days=7,
+                 timer_thread=False, handoff=None):
+        '''handoff 为重载前的实例交出的运行状态（见 handoff_state），传入时直接沿用，不重新注册任务'''
         self.context = context
-        self.reminder_data = reminder_data
-        self.data_file = data_file
+        self.store = store
+        if hasattr(store, "on_recovered"):
+            # 延迟加载时从分片中恢复出索引里没有的提醒，为它们注册定时任务
+            store.on_recovered = self._register_recovered
         self.unique_session = unique_session
         
+        # 分钟合并：同一触发时间的提醒共用一个定时任务（分钟桶），到期时一起执行
+        self.coalesce = coalesce
+        self._buckets = handoff["buckets"] if handoff else {}  # 分钟桶任务ID -> {提醒ID: 会话ID}
+        self._bucket_of = handoff["bucket_of"] if handoff else {}  # 提醒ID -> 分钟桶任务ID
+        # 所有到期提醒都经过执行队列，限制总并发数和各平台的并发数
+        # 重载时沿用旧实例的队列，排队和正在执行的提醒继续执行，并发上限仍然对新旧实例一起生效
+        self.executor = handoff["executor"] if handoff else FireExecutor(fire_concurrency, platform_limits)
+        self.executor.resume()
+        # 停机补发：运行期间定期记录存活时间，启动时补发这之后错过的提醒
+        self.last_alive_file = os.path.join(state_dir, LAST_ALIVE_FILE) if state_dir else None
+        self.catchup_policies = catchup_policies or {}  # {"reminder": 策略, "task": 策略}
+        self._heartbeat_task = None
+        # 进行中的补发各自的起始时间；重载时沿用同一个列表，旧实例的补发结束后仍能正确解除保留
+        self._catch_up_windows = handoff["catch_up_windows"] if handoff else []
+        # 错峰：到点后按提醒ID得到的固定秒数再执行，同一分钟的提醒分散到窗口内；任务可提前执行
+        self.spread_seconds = max(0, int(spread_seconds))
+        self.task_lead = datetime.timedelta(seconds=max(0, int(task_lead_seconds)))
+        # 错峰后一次性提醒最晚在触发时间加错峰窗口和宽限期时执行，清理过期提醒时保留到那之后
+        store.expire_grace = MISFIRE_GRACE_TIME + self.spread_seconds
+        # 多进程分区：会话按ID分到 shard_partitions 个分区，每个进程只调度租到的分区
+        self.lease = None
+        self.owned_partitions = set()
+        self._lease_expires = 0.0
+        self._lease_task = None
+        self._synced_version = None
+        if handoff and handoff["lease"] is not None:
+            self.lease = handoff["lease"]
+            self.owned_partitions = handoff["owned_partitions"]
+            self._lease_expires = handoff["lease_expires"]
+            self._synced_version = handoff["synced_version"]
+        elif shard_partitions and state_dir:
+            if not hasattr(store, "data_version"):
+                # 其他存储方式各进程各自保存一份数据，互相覆盖写入，分区后会丢失提醒
+                logger.error("分区模式需要使用 sqlite 存储方式，当前存储方式不支持多进程共享，已按不分区运行")
+            else:
+                if jobstore == "sqlite":
+                    logger.warning("分区模式下各进程注册的定时任务不同，不能共用持久化任务存储，已改用内存存储")
+                    jobstore = "memory"
+                self.lease = LeaseCoordinator(os.path.join(state_dir, LEASE_FILE), shard_partitions)
+        
         # 定义微信相关平台列表，用于特殊处理
         self.wechat_platforms = ["gewechat", "wechatpadpro", "wecom"]
         
+        # 定时任务触发时间的偏差统计，和调度器一样在重载后保留
+        self.drift = sys._GLOBAL_SCHEDULER_REGISTRY['drift']
+        new_drift = self.drift is None
+        if new_drift:
+            self.drift = sys._GLOBAL_SCHEDULER_REGISTRY['drift'] = DriftMonitor()
+        
         # 从全局注册表获取调度器，如果不存在则创建
+        # 进程启动后首次创建且使用持久化任务存储时，已保存的任务直接恢复，不再重新注册
+        self._restored_jobs = False
         if sys._GLOBAL_SCHEDULER_REGISTRY['scheduler'] is None:
-            sys._GLOBAL_SCHEDULER_REGISTRY['scheduler'] = AsyncIOScheduler()
-            logger.info("创建新的全局 AsyncIOScheduler 实例")
+            # 执行任务时记录设定的触发时间，执行队列的截止时间从它算起
+            options = {"executors": {"default": FireTimeExecutor()}}
+            if timer_thread:
+                # 计时在独立线程的事件循环中进行，主循环繁忙时到期任务也能按时取出，再交给主循环执行
+                options["event_loop"] = start_timer_loop()
+                options["executors"] = {"default": MainLoopExecutor(asyncio.get_event_loop(), self.drift)}
+                logger.info("调度器在独立线程中计时")
+                if engine == "heap":
+                    logger.warning("heap 引擎使用自己的定时器，仍在主事件循环中计时")
+            if jobstore == "sqlite" and state_dir:
+                store_file = os.path.join(state_dir, JOBSTORE_FILE)
+                scheduler = AsyncIOScheduler(jobstores={"default": SQLiteJobStore(store_file)}, **options)
+                # 调度器启动后才能读取已保存的任务，先以暂停状态启动，同步完任务后再恢复
+                scheduler.start(paused=True)
+                self._restored_jobs = True
+                logger.info(f"创建新的全局 AsyncIOScheduler 实例，任务保存在 {store_file}")
+            else:
+                if jobstore != "memory":
+                    logger.warning(f"未知的任务存储 {jobstore}，使用内存存储")
+                scheduler = AsyncIOScheduler(**options)
+                logger.info("创建新的全局 AsyncIOScheduler 实例")
+            sys._GLOBAL_SCHEDULER_REGISTRY['scheduler'] = scheduler
         else:
             logger.info("使用现有全局 AsyncIOScheduler 实例")
         
         # 使用全局注册表中的调度器
         self.scheduler = sys._GLOBAL_SCHEDULER_REGISTRY['scheduler']
+        if new_drift:
+            self.scheduler.add_listener(self.drift.job_submitted, EVENT_JOB_SUBMITTED)
         
-        # 创建节假日管理器
-        self.holiday_manager = HolidayManager()
+        # 创建节假日管理器（重载时沿用已读取的节假日缓存，定时任务的触发器也引用它）
+        self.holiday_manager = handoff["holiday_manager"] if handoff else HolidayManager()
+        # 每个会话未来若干天的触发时间，供列表、LLM 工具和统计查询
+        self.agenda = handoff["agenda"] if handoff else Agenda(store, self.holiday_manager, agenda_days)
         
-        # 如果有现有任务且是重新初始化，清理所有现有任务
-        if not getattr(self, '_first_init', True) and self.scheduler.get_jobs():
-            logger.info("检测到重新初始化，清理现有任务")
-            for job in self.scheduler.get_jobs():
-                if job.id.startswith("reminder_"):
-                    try:
-                        self.scheduler.remove_job(job.id)
-                    except JobLookupError:
-                        pass
+        # 停止重载前的分发器，避免旧实例的定时器继续触发；接手状态时沿用它，堆中的提醒不重新计算
+        old_dispatcher = sys._GLOBAL_SCHEDULER_REGISTRY.get('dispatcher')
+        if old_dispatcher is not None and not (handoff and handoff["dispatcher"] is old_dispatcher):
+            old_dispatcher.stop()
+            sys._GLOBAL_SCHEDULER_REGISTRY['dispatcher'] = None
+        
+        # heap 引擎：所有提醒共用一个最小堆和一个定时器，不为每条提醒创建 APScheduler 任务
+        self.dispatcher = None
+        if handoff and handoff["dispatcher"] is not None:
+            self.dispatcher = handoff["dispatcher"]
+            self.dispatcher.callback = self._fire_batch
+            self.dispatcher.lead = self._lead if self.task_lead else None
+            self.dispatcher.drift = self.drift
+        elif engine == "heap":
+            self.dispatcher = HeapDispatcher(self._fire_batch, self.holiday_manager,
+                                             self._lead if self.task_lead else None)
+            self.dispatcher.drift = self.drift
+            sys._GLOBAL_SCHEDULER_REGISTRY['dispatcher'] = self.dispatcher
+            logger.info("使用 heap 调度引擎")
+        elif engine != "apscheduler":
+            logger.warning(f"未知的调度引擎 {engine}，使用 apscheduler")
         
-        # 初始化任务
-        self._init_scheduler()
+        # 间隔重复的提醒不论使用哪种引擎都交给单独的分发器，每次触发不创建定时任务、不写数据文件，
+        # 节假日检查结果按天缓存
+        old_ticker = sys._GLOBAL_SCHEDULER_REGISTRY.get('ticker')
+        if handoff and handoff["ticker"] is not None:
+            self.ticker = handoff["ticker"]
+        else:
+            if old_ticker is not None:
+                old_ticker.stop()
+            self.ticker = HeapDispatcher(self._fire_ticks, self.holiday_manager, coalesce_missed=True)
+            sys._GLOBAL_SCHEDULER_REGISTRY['ticker'] = self.ticker
+        self.ticker.callback = self._fire_ticks
+        self.ticker.on_finished = self._interval_finished
+        self.ticker.lead = self._lead if self.task_lead else None
+        self.ticker.drift = self.drift
+        self._tick_days = handoff["tick_days"] if handoff else {}  # (回调类型, 日期) -> 当天是否执行
+        
+        # 已注册的任务从此由当前实例执行
+        old_manager = sys._GLOBAL_SCHEDULER_REGISTRY.get('manager')
+        if old_manager is not None and old_manager is not self:
+            old_manager._stop_heartbeat()
+            old_manager._stop_lease()
+        sys._GLOBAL_SCHEDULER_REGISTRY['manager'] = self
+        
+        if handoff:
+            # 已注册的定时任务通过注册表找到当前实例，直接沿用；重载期间没有停机，无需补发
+            logger.info(f"已接手重载前的运行状态：{self.store.count()} 个提醒/任务，定时任务保持不变")
+        else:
+            # 分区模式先租到分区，只注册自己持有的会话
+            taken_over = {}
+            if self.lease is not None:
+                started = time.time()
+                owned, taken_over = self.lease.renew()
+                self._apply_lease(started, owned)
+            
+            # 初始化任务
+            self._init_scheduler()
+            
+            # 补发停机期间错过的提醒
+            if self.last_alive_file:
+                self._start_catch_up(taken_over)
+        
+        # 开始记录存活时间
+        if self.last_alive_file:
+            self._heartbeat_task = asyncio.ensure_future(self._heartbeat_loop())
+        if self.lease is not None:
+            self._lease_task = asyncio.ensure_future(self._lease_loop())
         
         # 确保调度器运行
         if not self.scheduler.running:
             self.scheduler.start()
             logger.info("启动全局 AsyncIOScheduler")
+        elif self._restored_jobs and self.scheduler.state == STATE_PAUSED:
+            self.scheduler.resume()
+            logger.info("已恢复保存的定时任务，启动全局 AsyncIOScheduler")
         
         # 重置首次初始化标志
         self._first_init = False
     
     def _init_scheduler(self):
         '''初始化定时器'''
-        logger.info(f"开始初始化调度器，加载 {sum(len(reminders) for reminders in self.reminder_data.values())} 个提醒/任务")
+        logger.info(f"开始初始化调度器，加载 {self.store.count()} 个提醒/任务")
         
-        # 清理当前实例关联的所有任务
-        for job in self.scheduler.get_jobs():
-            if job.id.startswith("reminder_"):
-                try:
-                    self.scheduler.remove_job(job.id)
-                    logger.info(f"移除现有任务: {job.id}")
-                except JobLookupError:
-                    pass
-        
-        # 重新添加所有任务
-        for group in self.reminder_data:
-            for i, reminder in enumerate(self.reminder_data[group]):
-                if "datetime" not in reminder:
+        desired = {}
+        triggers = {}
+        pending = []
+        self._buckets = {}
+        self._bucket_of = {}
+        self._mark_synced()
+        self.agenda.clear()
+        self.ticker.clear()
+        ticks = []
+        for group, reminders in self.store.iter_sessions():
+            if not self._owns(group):
+                continue
+            for reminder in reminders:
+                if not self._schedulable(reminder):
                     continue
                 
-                # 处理不完整的时间格式问题
-                datetime_str = reminder["datetime"]
-                try:
-                    if ":" in datetime_str and len(datetime_str.split(":")) == 2 and "-" not in datetime_str:
-                        # 处理只有时分格式的时间（如"14:50"）
-                        today = datetime.datetime.now()
-                        hour, minute = map(int, datetime_str.split(":"))
-                        dt = today.replace(hour=hour, minute=minute)
-                        if dt < today:  # 如果时间已过，设置为明天
-                            dt += datetime.timedelta(days=1)
-                        # 更新reminder中的datetime为完整格式
-                        reminder["datetime"] = dt.strftime("%Y-%m-%d %H:%M")
-                        self.reminder_data[group][i] = reminder
-                    dt = datetime.datetime.strptime(reminder["datetime"], "%Y-%m-%d %H:%M")
-                except ValueError as e:
-                    logger.error(f"无法解析时间格式 '{reminder['datetime']}': {str(e)}，跳过此提醒")
+                if reminder.repeat is Repeat.INTERVAL:
+                    ticks.append((group, reminder))
                     continue
                 
-                # 判断过期
-                repeat_type = reminder.get("repeat", "none")
-                if (repeat_type == "none" or 
-                    not any(repeat_key in repeat_type for repeat_key in ["daily", "weekly", "monthly", "yearly"])) and is_outdated(reminder):
-                    logger.info(f"跳过已过期的提醒: {reminder['text']}")
+                if self.dispatcher is not None:
+                    pending.append((group, reminder))
                     continue
                 
-                # 生成唯一的任务ID，添加时间戳确保唯一性
-                timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
-                job_id = f"reminder_{group}_{i}_{timestamp}"
-                
-                # 根据重复类型设置不同的触发器
-                if reminder.get("repeat") == "daily":
-                    self.scheduler.add_job(
-                        self._reminder_callback,
-                        'cron',
-                        args=[group, reminder],
-                        hour=dt.hour,
-                        minute=dt.minute,
-                        misfire_grace_time=60,
-                        id=job_id
-                    )
-                    logger.info(f"添加每日提醒: {reminder['text']} 时间: {dt.hour}:{dt.minute} ID: {job_id}")
-                elif reminder.get("repeat") == "daily_workday":
-                    # 每个工作日重复
-                    self.scheduler.add_job(
-                        self._check_and_execute_workday,
-                        'cron',
-                        args=[group, reminder],
-                        hour=dt.hour,
-                        minute=dt.minute,
-                        misfire_grace_time=60,
-                        id=job_id
-                    )
-                    logger.info(f"添加工作日提醒: {reminder['text']} 时间: {dt.hour}:{dt.minute} ID: {job_id}")
-                elif reminder.get("repeat") == "daily_holiday":
-                    # 每个法定节假日重复
-                    self.scheduler.add_job(
-                        self._check_and_execute_holiday,
-                        'cron',
-                        args=[group, reminder],
-                        hour=dt.hour,
-                        minute=dt.minute,
-                        misfire_grace_time=60,
-                        id=job_id
-                    )
-                    logger.info(f"添加节假日提醒: {reminder['text']} 时间: {dt.hour}:{dt.minute} ID: {job_id}")
-                elif reminder.get("repeat") == "weekly":
-                    self.scheduler.add_job(
-                        self._reminder_callback,
-                        'cron',
-                        args=[group, reminder],
-                        day_of_week=dt.weekday(),
-                        hour=dt.hour,
-                        minute=dt.minute,
-                        misfire_grace_time=60,
-                        id=job_id
-                    )
-                    logger.info(f"添加每周提醒: {reminder['text']} 时间: 每周{dt.weekday()+1} {dt.hour}:{dt.minute} ID: {job_id}")
-                elif reminder.get("repeat") == "weekly_workday":
-                    # 每周的这一天，但仅工作日执行
-                    self.scheduler.add_job(
-                        self._check_and_execute_workday,
-                        'cron',
-                        args=[group, reminder],
-                        day_of_week=dt.weekday(),  # 保留这个限制，因为"每周"需要指定星期几
-                        hour=dt.hour,
-                        minute=dt.minute,
-                        misfire_grace_time=60,
-                        id=job_id
-                    )
-                    logger.info(f"添加每周工作日提醒: {reminder['text']} 时间: 每周{dt.weekday()+1} {dt.hour}:{dt.minute} ID: {job_id}")
-                elif reminder.get("repeat") == "weekly_holiday":
-                    # 每周的这一天，但仅法定节假日执行
-                    self.scheduler.add_job(
-                        self._check_and_execute_holiday,
-                        'cron',
-                        args=[group, reminder],
-                        day_of_week=dt.weekday(),
-                        hour=dt.hour,
-                        minute=dt.minute,
-                        misfire_grace_time=60,
-                        id=job_id
-                    )
-                    logger.info(f"添加每周节假日提醒: {reminder['text']} 时间: 每周{dt.weekday()+1} {dt.hour}:{dt.minute} ID: {job_id}")
-                elif reminder.get("repeat") == "monthly":
-                    self.scheduler.add_job(
-                        self._reminder_callback,
-                        'cron',
-                        args=[group, reminder],
-                        day=dt.day,
-                        hour=dt.hour,
-                        minute=dt.minute,
-                        misfire_grace_time=60,
-                        id=job_id
-                    )
-                    logger.info(f"添加每月提醒: {reminder['text']} 时间: 每月{dt.day}日 {dt.hour}:{dt.minute} ID: {job_id}")
-                elif reminder.get("repeat") == "monthly_workday":
-                    # 每月的这一天，但仅工作日执行
-                    self.scheduler.add_job(
-                        self._check_and_execute_workday,
-                        'cron',
-                        args=[group, reminder],
-                        day=dt.day,  # 保留这个限制，因为"每月"需要指定几号
-                        hour=dt.hour,
-                        minute=dt.minute,
-                        misfire_grace_time=60,
-                        id=job_id
-                    )
-                    logger.info(f"添加每月工作日提醒: {reminder['text']} 时间: 每月{dt.day}日 {dt.hour}:{dt.minute} ID: {job_id}")
-                elif reminder.get("repeat") == "monthly_holiday":
-                    # 每月的这一天，但仅法定节假日执行
-                    self.scheduler.add_job(
-                        self._check_and_execute_holiday,
-                        'cron',
-                        args=[group, reminder],
-                        day=dt.day,
-                        hour=dt.hour,
-                        minute=dt.minute,
-                        misfire_grace_time=60,
-                        id=job_id
-                    )
-                    logger.info(f"添加每月节假日提醒: {reminder['text']} 时间: 每月{dt.day}日 {dt.hour}:{dt.minute} ID: {job_id}")
-                elif reminder.get("repeat") == "yearly":
-                    self.scheduler.add_job(
-                        self._reminder_callback,
-                        'cron',
-                        args=[group, reminder],
-                        month=dt.month,
-                        day=dt.day,
-                        hour=dt.hour,
-                        minute=dt.minute,
-                        misfire_grace_time=60,
-                        id=job_id
-                    )
-                    logger.info(f"添加每年提醒: {reminder['text']} 时间: 每年{dt.month}月{dt.day}日 {dt.hour}:{dt.minute} ID: {job_id}")
-                elif reminder.get("repeat") == "yearly_workday":
-                    # 每年的这一天，但仅工作日执行
-                    self.scheduler.add_job(
-                        self._check_and_execute_workday,
-                        'cron',
-                        args=[group, reminder],
-                        month=dt.month,  # 保留这个限制，因为"每年"需要指定月份
-                        day=dt.day,      # 保留这个限制，因为"每年"需要指定日期
-                        hour=dt.hour,
-                        minute=dt.minute,
-                        misfire_grace_time=60,
-                        id=job_id
-                    )
-                    logger.info(f"添加每年工作日提醒: {reminder['text']} 时间: 每年{dt.month}月{dt.day}日 {dt.hour}:{dt.minute} ID: {job_id}")
-                elif reminder.get("repeat") == "yearly_holiday":
-                    # 每年的这一天，但仅法定节假日执行
-                    self.scheduler.add_job(
-                        self._check_and_execute_holiday,
-                        'cron',
-                        args=[group, reminder],
-                        month=dt.month,
-                        day=dt.day,
-                        hour=dt.hour,
-                        minute=dt.minute,
-                        misfire_grace_time=60,
-                        id=job_id
-                    )
-                    logger.info(f"添加每年节假日提醒: {reminder['text']} 时间: 每年{dt.month}月{dt.day}日 {dt.hour}:{dt.minute} ID: {job_id}")
-                else:
-                    self.scheduler.add_job(
-                        self._reminder_callback,
-                        'date',
-                        args=[group, reminder],
-                        run_date=dt,
-                        misfire_grace_time=60,
-                        id=job_id
-                    )
-                    logger.info(f"添加一次性提醒: {reminder['text']} 时间: {dt.strftime('%Y-%m-%d %H:%M')} ID: {job_id}")
-    
-    async def _check_and_execute_workday(self, unified_msg_origin: str, reminder: dict):
+                # 任务ID由提醒ID生成，不受列表位置影响；分钟合并时多个提醒对应同一个任务
+                job_id, func, args, trigger = self._job_spec(group, reminder, triggers)
+                desired[job_id] = (func, args, trigger)
+        
+        if self.dispatcher is not None:
+            self.dispatcher.add_many(pending)
+        if ticks:
+            logger.info(f"间隔重复的提醒/任务：{self.ticker.add_many(ticks)} 个")
+        
+        # 与已注册的任务比较，只增删改有变化的任务（heap 引擎下会移除全部 APScheduler 提醒任务）
+        self._reconcile_jobs(desired)
+        
+        if self.dispatcher is not None:
+            logger.info(f"heap 调度引擎已加载 {len(self.dispatcher)} 个提醒/任务")
+        elif self.coalesce:
+            logger.info(f"分钟合并已启用，{len(self._bucket_of)} 个提醒/任务合并为 {len(self._buckets)} 个定时任务")
+    
+    @staticmethod
+    def _schedulable(reminder: Reminder) -> bool:
+        '''提醒是否需要注册定时任务：时间无法解析和已过期的一次性提醒跳过'''
+        if "datetime" not in reminder:
+            return False
+        # 时间已在加载时解析，旧格式的数据由存储在加载时升级
+        if reminder.dt is None:
+            logger.error(f"无法解析时间格式 '{reminder['datetime']}'，跳过此提醒")
+            return False
+        if reminder.repeat is Repeat.NONE and is_outdated(reminder):
+            logger.info(f"跳过已过期的提醒: {reminder['text']}")
+            return False
+        return True
+    
+    def _mark_synced(self):
+        '''记录已同步的数据版本；分区模式下同时记录各会话当前的数据行，供之后找出其他进程修改过的会话'''
+        self._synced_version = self._data_version()
+        if self.lease is not None:
+            self.store.changed_sessions()
+    
+    def _sync_sessions(self, sessions: set):
+        '''只重新同步给定会话的定时任务（持有的分区变化，或其他进程增删了这些会话的提醒）
+
+        不再持有的会话注销全部任务；持有的会话按当前数据注销已删除的提醒、注册新增的提醒，
+        未变化的 APScheduler 任务保持注册。
+        '''
+        registered = self._registered(sessions)
+        current = {}
+        for session in sessions:
+            self.agenda.invalidate(session)
+            if not self._owns(session):
+                continue
+            for reminder in self.store.get(session):
+                if self._schedulable(reminder):
+                    current[reminder.id] = (session, reminder)
+        for reminder_id in registered.keys() - current.keys():
+            self._unregister(reminder_id)
+        kept = 0
+        for reminder_id, (session, reminder) in current.items():
+            if reminder_id in registered:
+                if (self.dispatcher is None and not self.coalesce and reminder.repeat is not Repeat.INTERVAL):
+                    job = self.scheduler.get_job(self.job_id(reminder))
+                    if job is not None and self._job_matches(job, *self._job_spec(session, reminder)[1:]):
+                        kept += 1
+                        continue
+                self._unregister(reminder_id)
+            self.add_job(session, reminder, reminder.dt)
+        logger.info(
+            f"已同步 {len(sessions)} 个会话的定时任务：注销 {len(registered.keys() - current.keys())} 个，"
+            f"注册 {len(current) - kept} 个，保持 {kept} 个"
+        )
+    
+    def _registered(self, sessions: set) -> dict:
+        '''给定会话中已注册定时任务的提醒 {提醒ID: 会话ID}'''
+        registered = self.ticker.in_sessions(sessions)
+        if self.dispatcher is not None:
+            registered.update(self.dispatcher.in_sessions(sessions))
+        elif self.coalesce:
+            for members in self._buckets.values():
+                registered.update((rid, session) for rid, session in members.items() if session in sessions)
+        else:
+            for job in self.scheduler.get_jobs():
+                if job.id.startswith("reminder_") and len(job.args) == 3 and job.args[1] in sessions:
+                    registered[job.args[2]] = job.args[1]
+        return registered
+    
+    def _unregister(self, reminder_id: str):
+        '''按提醒ID注销定时任务，不需要提醒内容（提醒可能已被其他进程删除）'''
+        self.agenda.remove(reminder_id)
+        if self.ticker.remove(reminder_id):
+            return
+        if self.dispatcher is not None:
+            self.dispatcher.remove(reminder_id)
+        elif self.coalesce:
+            self._bucket_remove(reminder_id)
+        else:
+            try:
+                self.scheduler.remove_job(f"reminder_{reminder_id}")
+            except JobLookupError:
+                pass
+    
+    def _start_catch_up(self, taken_over: dict = None, since_last_alive: bool = True):
+        '''计算错过的触发时间，按策略在后台补发
+
+        一般从上次存活时间算起；分区模式下接管的分区（原持有者崩溃或主动释放），从原持有者最后一次续租或释放的时间算起。
+        '''
+        since = load_last_alive(self.last_alive_file) if since_last_alive else None
+        windows = {}  # 起始时间 -> [(会话ID, 提醒列表)]
+        for session, reminders in self.store.iter_sessions():
+            if not self._owns(session):
+                continue
+            start = since
+            renewed = taken_over.get(partition_of(session, self.lease.partitions)) if taken_over else None
+            if renewed:
+                start = datetime.datetime.fromtimestamp(renewed)
+            if start is not None:
+                windows.setdefault(start, []).append((session, reminders))
+        now = datetime.datetime.now()
+        missed = []
+        for start, sessions in windows.items():
+            missed.extend(compute_missed(sessions, start, now, self.holiday_manager))
+        if not missed:
+            return
+        if since is not None:
+            logger.info(f"上次运行于 {since}，停机期间有 {len(missed)} 个提醒/任务错过了触发时间")
+        else:
+            logger.info(f"接管的分区中有 {len(missed)} 个提醒/任务在原进程停止后错过了触发时间")
+        # 补发结束前清理过期提醒时保留窗口内的一次性提醒，补发时还要读取和删除它们
+        retained = min(windows)
+        self._catch_up_windows.append(retained)
+        self.store.retain_since = min(self._catch_up_windows)
+        asyncio.ensure_future(self._catch_up(missed, retained))
+    
+    async def _catch_up(self, missed: list, retained: datetime.datetime):
+        '''补发并在结束后解除对窗口内一次性提醒的保留，没有其他进行中的补发时清理过期提醒'''
+        try:
+            await self._replay_missed(missed)
+        finally:
+            self._catch_up_windows.remove(retained)
+            self.store.retain_since = min(self._catch_up_windows, default=None)
+            if self.store.retain_since is None:
+                try:
+                    await self.store.compact()
+                except Exception as e:
+                    logger.error(f"补发后清理过期提醒失败: {e}")
+    
+    async def _replay_missed(self, missed: list):
+        '''按提醒/任务各自的策略补发，全部经过执行队列以免重启后集中触发'''
+        for session in {session for session, _, _ in missed}:
+            await self.store.hydrate(session)
+        
+        counts = {"off": 0, "once": 0, "all": 0, "digest": 0}
+        replays = []
+        digests = {}
+        for session, reminder, times in missed:
+            policy = self.catchup_policies.get("task" if reminder.is_task else "reminder", "off")
+            if policy not in counts:
+                policy = "off"
+            counts[policy] += 1
+            if policy == "digest":
+                digests.setdefault((session, reminder.creator_id), []).append((reminder, times))
+            elif policy != "off":
+                # 间隔重复的提醒错过多次也只补发一次
+                repeat_all = policy == "all" and reminder.repeat is not Repeat.INTERVAL
+                replays.extend([(session, reminder)] * (len(times) if repeat_all else 1))
+        logger.info(
+            f"停机补发：补发一次 {counts['once']} 个，逐次补发 {counts['all']} 个，"
+            f"汇总 {counts['digest']} 个，不补发 {counts['off']} 个"
+        )
+        
+        # 补发已经晚于触发时间，截止时间统一从开始补发算起，排在正常到期的提醒之后；
+        # 接近截止时间仍在排队的补发只发送简单消息
+        deadline = time.monotonic() + CATCHUP_DEADLINE
+        work = [
+            self.executor.submit(
+                reminder.platform,
+                self._deliver,
+                (session, reminder),
+                priority=PRIORITY_TASK if reminder.is_task else PRIORITY_REMINDER,
+                deadline=deadline,
+                fallback=self._deliver_simple
+            )
+            for session, reminder in replays
+        ]
+        work += [
+            self.executor.submit(entries[0][0].platform, self._send_digest, (session, entries), deadline=deadline)
+            for (session, _), entries in digests.items()
+        ]
+        results = await asyncio.gather(*work, return_exceptions=True)
+        failed = [result for result in results if isinstance(result, Exception)]
+        if failed:
+            logger.error(f"停机补发有 {len(failed)} 项失败: {failed[0]}")
+    
+    async def _send_digest(self, unified_msg_origin: str, entries: list):
+        '''把一个会话中错过的提醒汇总成一条消息发送'''
+        message_handler = ReminderMessageHandler(self.context, self.wechat_platforms)
+        await message_handler.send_reminder_message(unified_msg_origin, entries[0][0], format_digest(entries))
+        for reminder, _ in entries:
+            if reminder.once:
+                await self.store.remove(unified_msg_origin, reminder)
+    
+    async def _heartbeat_loop(self):
+        while True:
+            await self._save_last_alive()
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+    
+    async def _save_last_alive(self):
+        try:
+            await run_in_thread(save_last_alive, self.last_alive_file, datetime.datetime.now())
+        except Exception as e:
+            logger.error(f"记录存活时间失败: {e}")
+    
+    def _stop_heartbeat(self):
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+    
+    async def shutdown(self):
+        '''插件卸载或重载时停止记录存活时间并记录最后一次，停止续租（分区交给 handoff_state 的接收方处理），
+        等待正在执行的提醒结束（超时取消），之后才能关闭数据存储'''
+        if self._heartbeat_task is not None:
+            self._stop_heartbeat()
+            await self._save_last_alive()
+        self._stop_lease()
+        await self.executor.drain()
+    
+    def handoff_state(self) -> dict:
+        '''交给重载后实例的运行状态：数据存储、执行队列、分发器、分钟桶、节假日数据、日程缓存、分区租约和进行中的补发'''
+        return {
+            "store": self.store,
+            "executor": self.executor,
+            "dispatcher": self.dispatcher,
+            "ticker": self.ticker,
+            "tick_days": self._tick_days,
+            "buckets": self._buckets,
+            "bucket_of": self._bucket_of,
+            "holiday_manager": self.holiday_manager,
+            "agenda": self.agenda,
+            "lease": self.lease,
+            "owned_partitions": self.owned_partitions,
+            "lease_expires": self._lease_expires,
+            "synced_version": self._synced_version,
+            "catch_up_windows": self._catch_up_windows,
+        }
+    
+    def _owns(self, session: str) -> bool:
+        '''是否由当前进程调度该会话，未启用分区时总是 True'''
+        if self.lease is None:
+            return True
+        return (partition_of(session, self.lease.partitions) in self.owned_partitions
+                and time.time() < self._lease_expires)
+    
+    def _apply_lease(self, started: float, owned: set) -> set:
+        '''记录续租结果，返回新增和失去的分区'''
+        self._lease_expires = started + self.lease.ttl
+        changed = owned ^ self.owned_partitions
+        self.owned_partitions = owned
+        if changed:
+            logger.info(f"当前进程持有分区 {sorted(owned)}（共 {self.lease.partitions} 个）")
+        return changed
+    
+    def _data_version(self):
+        '''存储的数据版本，其他进程修改数据后会变化；不支持的存储方式返回 None'''
+        data_version = getattr(self.store, "data_version", None)
+        return data_version() if data_version is not None else None
+    
+    async def _lease_loop(self):
+        '''定期续租；持有的分区变化或其他进程修改了数据时重新同步定时任务'''
+        while True:
+            await asyncio.sleep(LEASE_RENEW_INTERVAL)
+            started = time.time()
+            try:
+                owned, taken_over = await run_in_thread(self.lease.renew)
+            except Exception as e:
+                logger.error(f"续租分区失败: {e}")
+                continue
+            # 只同步有变化的会话：新增或失去的分区中的会话，以及其他进程增删过提醒的会话
+            changed = self._apply_lease(started, owned)
+            sessions = set()
+            if changed:
+                sessions.update(session for session in self.store.sessions()
+                                if partition_of(session, self.lease.partitions) in changed)
+            data_version = self._data_version()
+            if data_version != self._synced_version:
+                self._synced_version = data_version
+                sessions.update(self.store.changed_sessions())
+            if sessions:
+                self._sync_sessions(sessions)
+            if taken_over:
+                self._start_catch_up(taken_over, since_last_alive=False)
+    
+    def _stop_lease(self):
+        if self._lease_task is not None:
+            self._lease_task.cancel()
+            self._lease_task = None
+    
+    def _lead(self, reminder: Reminder) -> datetime.timedelta:
+        '''提前执行的时间，只有任务会提前'''
+        return self.task_lead if reminder.is_task else datetime.timedelta(0)
+    
+    @staticmethod
+    def _job_kind(reminder: Reminder) -> str:
+        '''提醒触发时使用的回调类型'''
+        if reminder.holiday is HolidayType.WORKDAY:
+            return "workday"
+        if reminder.holiday is HolidayType.HOLIDAY:
+            return "holiday"
+        return "reminder"
+    
+    def _trigger_key(self, reminder: Reminder) -> tuple:
+        '''决定触发器的字段，字段相同的提醒可以共用一个触发器'''
+        dt = reminder.dt
+        name = reminder.repeat_name  # 包含节假日类型，如 daily_workday
+        if reminder.repeat is Repeat.DAILY:
+            key = (name, dt.hour, dt.minute)
+        elif reminder.repeat is Repeat.WEEKLY:
+            key = (name, dt.weekday(), dt.hour, dt.minute)
+        elif reminder.repeat is Repeat.MONTHLY:
+            key = (name, dt.day, dt.hour, dt.minute)
+        elif reminder.repeat is Repeat.YEARLY:
+            key = (name, dt.month, dt.day, dt.hour, dt.minute)
+        else:
+            key = ("none", dt)
+        lead = self._lead(reminder)
+        if lead:
+            # 提前执行的任务与同一时间的提醒触发时间不同
+            key += (f"lead{int(lead.total_seconds())}",)
+        return key
+    
+    @staticmethod
+    def _bucket_id(key: tuple) -> str:
+        '''分钟桶对应的定时任务ID，如 reminder_bucket_daily_workday_8_0'''
+        parts = [key[0]]
+        for value in key[1:]:
+            parts.append(value.strftime("%Y%m%d%H%M") if isinstance(value, datetime.datetime) else str(value))
+        return "reminder_bucket_" + "_".join(parts)
+    
+    def _job_spec(self, session: str, reminder: Reminder, triggers: dict = None):
+        '''提醒对应的 (任务ID, 入口函数, 任务参数, 触发器)，传入 triggers 时相同的触发器只创建一次
+
+        启用分钟合并时同时把提醒记入对应的分钟桶，返回分钟桶的任务。
+        '''
+        key = self._trigger_key(reminder)
+        if triggers is None:
+            trigger = self._build_trigger(reminder)
+        else:
+            trigger = triggers.get(key)
+            if trigger is None:
+                trigger = triggers[key] = self._build_trigger(reminder)
+        if self.coalesce:
+            bucket_id = self._bucket_id(key)
+            self._buckets.setdefault(bucket_id, {})[reminder.id] = session
+            self._bucket_of[reminder.id] = bucket_id
+            return bucket_id, run_bucket_job, (bucket_id,), trigger
+        return self.job_id(reminder), run_reminder_job, (self._job_kind(reminder), session, reminder.id), trigger
+    
+    def _build_trigger(self, reminder: Reminder):
+        dt = reminder.dt
+        timezone = self.scheduler.timezone
+        if reminder.repeat is Repeat.DAILY:
+            trigger = CronTrigger(hour=dt.hour, minute=dt.minute, timezone=timezone)
+        elif reminder.repeat is Repeat.WEEKLY:
+            trigger = CronTrigger(day_of_week=dt.weekday(), hour=dt.hour, minute=dt.minute, timezone=timezone)
+        elif reminder.repeat is Repeat.MONTHLY:
+            trigger = CronTrigger(day=dt.day, hour=dt.hour, minute=dt.minute, timezone=timezone)
+        elif reminder.repeat is Repeat.YEARLY:
+            trigger = CronTrigger(month=dt.month, day=dt.day, hour=dt.hour, minute=dt.minute, timezone=timezone)
+        else:
+            # 一次性提醒和未知的重复类型
+            trigger = DateTrigger(run_date=dt, timezone=timezone)
+        if reminder.holiday is not HolidayType.ANY and reminder.repeat is not Repeat.NONE:
+            # 计算下一次触发时间时直接跳过不符合节假日类型的日期
+            trigger = HolidayCronTrigger(trigger, reminder.holiday, self.holiday_manager)
+        lead = self._lead(reminder)
+        if lead:
+            trigger = LeadTrigger(trigger, lead)
+        return trigger
+    
+    @staticmethod
+    def _job_matches(job, func, args, trigger) -> bool:
+        '''已注册的任务是否与期望的任务一致（重载后入口函数是新模块中的同名函数）'''
+        return (getattr(job.func, "__module__", None) == __name__
+                and getattr(job.func, "__name__", None) == func.__name__
+                and tuple(job.args) == args
+                and str(job.trigger) == str(trigger))
+    
+    def _reconcile_jobs(self, desired: dict):
+        '''按任务ID比较期望的任务和已注册的任务，只处理新增、变化和多余的任务
+
+        插件重载时未变化的任务保持注册，不会出现没有任务可触发的间隙。
+        '''
+        live = {job.id: job for job in self.scheduler.get_jobs() if job.id.startswith("reminder_")}
+        now = datetime.datetime.now(self.scheduler.timezone)
+        removed = 0
+        for job_id in live.keys() - desired.keys():
+            try:
+                self.scheduler.remove_job(job_id)
+                removed += 1
+            except JobLookupError:
+                pass
+        changed = []
+        updated = 0
+        for job_id, (func, args, trigger) in desired.items():
+            job = live.get(job_id)
+            if job is not None and self._job_matches(job, func, args, trigger):
+                inner = job.trigger.trigger if isinstance(job.trigger, LeadTrigger) else job.trigger
+                if isinstance(inner, HolidayCronTrigger):
+                    # 保留的任务改用当前实例的节假日数据
+                    inner.calendar = self.holiday_manager
+                if self._restored_jobs and job.next_run_time is not None and job.next_run_time <= now:
+                    # 停机期间错过的执行由补发处理，恢复的任务从现在起计算下一次执行时间
+                    self.scheduler.modify_job(job_id, next_run_time=job.trigger.get_next_fire_time(None, now))
+                continue
+            changed.append((job_id, func, args, trigger))
+            if job is not None:
+                updated += 1
+        self._add_jobs(changed)
+        added = len(changed) - updated
+        logger.info(
+            f"定时任务同步完成：新增 {added} 个，更新 {updated} 个，移除 {removed} 个，"
+            f"保持 {len(desired) - added - updated} 个"
+        )
+    
+    def _add_jobs(self, specs: list):
+        '''批量注册 (任务ID, 入口函数, 任务参数, 触发器)
+
+        共用的触发器只计算一次下次触发时间；插入期间暂停调度器，恢复时只唤醒一次，
+        而不是每个任务唤醒一次。
+        '''
+        if not specs:
+            return
+        now = datetime.datetime.now(self.scheduler.timezone)
+        next_run_times = {}
+        pause = self.scheduler.state == STATE_RUNNING
+        if pause:
+            self.scheduler.pause()
+        try:
+            for job_id, func, args, trigger in specs:
+                key = id(trigger)
+                if key not in next_run_times:
+                    next_run_times[key] = trigger.get_next_fire_time(None, now)
+                self.scheduler.add_job(
+                    func,
+                    trigger,
+                    args=list(args),
+                    misfire_grace_time=60,
+                    id=job_id,
+                    replace_existing=True,
+                    next_run_time=next_run_times[key]
+                )
+        finally:
+            if pause:
+                self.scheduler.resume()
+    
+    async def run_job(self, kind: str, session: str, reminder_id: str):
+        '''按提醒ID找到提醒并执行对应的回调'''
+        reminder = self.store.lookup(reminder_id)
+        if reminder is None:
+            logger.warning(f"提醒 {reminder_id} 已不存在，跳过执行")
+            return
+        await getattr(self, JOB_CALLBACKS[kind])(session, reminder, SCHEDULED_FIRE_TIME.get())
+    
+    async def run_bucket(self, bucket_id: str):
+        '''执行一个分钟桶中的所有提醒'''
+        members = self._buckets.get(bucket_id)
+        if not members:
+            return
+        fire_at = SCHEDULED_FIRE_TIME.get()
+        items = []
+        for reminder_id, session in list(members.items()):
+            reminder = self.store.lookup(reminder_id)
+            if reminder is None:
+                logger.warning(f"提醒 {reminder_id} 已不存在，跳过执行")
+                self._bucket_remove(reminder_id)
+                continue
+            items.append((session, reminder, fire_at))
+        # 一次性的分钟桶触发后任务已被 APScheduler 移除
+        if self.scheduler.get_job(bucket_id) is None:
+            for reminder_id in self._buckets.pop(bucket_id, {}):
+                self._bucket_of.pop(reminder_id, None)
+        await self._fire_batch(items)
+    
+    async def _fire_ticks(self, items: list):
+        '''间隔重复的提醒到期，节假日检查结果按天缓存，同一天的后续触发不再查询'''
+        today = datetime.date.today()
+        for key in [key for key in self._tick_days if key[1] < today]:
+            del self._tick_days[key]
+        await self._fire_batch(items, self._tick_days)
+    
+    async def _fire_batch(self, items: list, day_cache: dict = None):
+        '''同时到期的一批 (会话ID, 提醒, 设定的触发时间)
+
+        当天是否为工作日/法定节假日只查询一次，然后一起放入执行队列。
+        传入 day_cache 时查询结果保存在其中，之后的批次直接使用。
+        '''
+        if not items:
+            return
+        now = datetime.datetime.now()
+        
+        def check_key(reminder):
+            # 提前执行的任务按设定的触发时间所在日期检查
+            return self._job_kind(reminder), (now + self._lead(reminder)).date()
+        
+        allowed = {}
+        for kind, day in {check_key(reminder) for _, reminder, _ in items}:
+            if kind == "reminder":
+                allowed[(kind, day)] = True
+                continue
+            if day_cache is not None and (kind, day) in day_cache:
+                allowed[(kind, day)] = day_cache[(kind, day)]
+                continue
+            check_time = datetime.datetime.combine(day, now.time())
+            if kind == "workday":
+                allowed[(kind, day)] = await self.holiday_manager.is_workday(check_time)
+                logger.info(f"日期 {day.strftime('%Y-%m-%d')} 工作日检查结果: {allowed[(kind, day)]}")
+            else:
+                allowed[(kind, day)] = await self.holiday_manager.is_holiday(check_time)
+                logger.info(f"日期 {day.strftime('%Y-%m-%d')} 法定节假日检查结果: {allowed[(kind, day)]}")
+            if day_cache is not None:
+                day_cache[(kind, day)] = allowed[(kind, day)]
+        due = [item for item in items if allowed[check_key(item[1])]]
+        if len(due) < len(items):
+            logger.info(f"跳过 {len(items) - len(due)} 个不满足节假日条件的提醒/任务")
+        
+        results = await asyncio.gather(
+            *(self._reminder_callback(session, reminder, fire_at) for session, reminder, fire_at in due),
+            return_exceptions=True
+        )
+        for (session, reminder, _), result in zip(due, results):
+            if isinstance(result, Exception):
+                logger.error(f"执行提醒 {reminder['text']} 时出错: {result}")
+    
+    async def _check_and_execute_workday(self, unified_msg_origin: str, reminder: Reminder,
+                                         fire_at: datetime.datetime = None):
         '''检查当天是否为工作日，如果是则执行提醒'''
-        today = datetime.datetime.now()
+        # 延迟加载时提醒内容可能还未读取
+        await self.store.hydrate(unified_msg_origin)
+        # 提前执行的任务按设定的触发时间所在日期检查
+        today = datetime.datetime.now() + self._lead(reminder)
         logger.info(f"检查日期 {today.strftime('%Y-%m-%d')} 是否为工作日，提醒内容: {reminder['text']}")
         
         is_workday = await self.holiday_manager.is_workday(today)
@@ -294,13 +839,17 @@ class ReminderScheduler:
         if is_workday:
             # 如果是工作日则执行提醒
             logger.info(f"确认今天是工作日，执行提醒: {reminder['text']}")
-            await self._reminder_callback(unified_msg_origin, reminder)
+            await self._reminder_callback(unified_msg_origin, reminder, fire_at)
         else:
             logger.info(f"今天不是工作日，跳过执行提醒: {reminder['text']}")
     
-    async def _check_and_execute_holiday(self, unified_msg_origin: str, reminder: dict):
+    async def _check_and_execute_holiday(self, unified_msg_origin: str, reminder: Reminder,
+                                         fire_at: datetime.datetime = None):
         '''检查当天是否为法定节假日，如果是则执行提醒'''
-        today = datetime.datetime.now()
+        # 延迟加载时提醒内容可能还未读取
+        await self.store.hydrate(unified_msg_origin)
+        # 提前执行的任务按设定的触发时间所在日期检查
+        today = datetime.datetime.now() + self._lead(reminder)
         logger.info(f"检查日期 {today.strftime('%Y-%m-%d')} 是否为法定节假日，提醒内容: {reminder['text']}")
         
         is_holiday = await self.holiday_manager.is_holiday(today)
@@ -309,16 +858,50 @@ class ReminderScheduler:
         if is_holiday:
             # 如果是法定节假日则执行提醒
             logger.info(f"确认今天是法定节假日，执行提醒: {reminder['text']}")
-            await self._reminder_callback(unified_msg_origin, reminder)
+            await self._reminder_callback(unified_msg_origin, reminder, fire_at)
         else:
             logger.info(f"今天不是法定节假日，跳过执行提醒: {reminder['text']}")
     
-    async def _reminder_callback(self, unified_msg_origin: str, reminder: dict):
-        '''提醒回调函数'''
+    async def _reminder_callback(self, unified_msg_origin: str, reminder: Reminder,
+                                 fire_at: datetime.datetime = None):
+        '''提醒回调函数，放入执行队列并等待执行完成
+
+        提醒优先于任务执行；截止时间为设定的触发时间 fire_at 加上错峰偏移和 misfire_grace_time，
+        主循环繁忙导致晚到时同样从设定时间算起，不知道触发时间时从现在算起。
+        排队到接近截止时间时只发送简单消息。开启错峰时先等待该提醒固定的偏移秒数。
+        '''
+        if not self._owns(unified_msg_origin):
+            # 租约已过期或分区已交给其他进程，由新的持有者执行
+            logger.info(f"会话 {unified_msg_origin} 不在当前进程持有的分区中，跳过执行: {reminder['text']}")
+            return
+        spread = self.spread_seconds
+        if reminder.repeat is Repeat.INTERVAL:
+            # 间隔提醒的错峰不超过间隔，保持触发顺序
+            spread = min(spread, reminder.interval.seconds)
+        offset = spread_offset(reminder.id, spread)
+        deadline = deadline_after(fire_at or datetime.datetime.now(), offset + MISFIRE_GRACE_TIME)
+        if offset:
+            await asyncio.sleep(offset)
+        await self.executor.submit(
+            reminder.platform,
+            self._deliver,
+            (unified_msg_origin, reminder),
+            priority=PRIORITY_TASK if reminder.is_task else PRIORITY_REMINDER,
+            deadline=deadline,
+            fallback=self._deliver_simple
+        )
+    
+    async def _deliver_simple(self, unified_msg_origin: str, reminder: Reminder):
+        '''不调用 LLM，直接发送简单消息'''
+        await self._deliver(unified_msg_origin, reminder, simple=True)
+    
+    async def _deliver(self, unified_msg_origin: str, reminder: Reminder, simple: bool = False):
+        '''执行提醒或任务并发送消息'''
+        await self.store.hydrate(unified_msg_origin)
         provider = self.context.get_using_provider()
         
         # 区分提醒和任务
-        is_task = reminder.get("is_task", False)
+        is_task = reminder.is_task
         
         logger.info(f"开始执行{'任务' if is_task else '提醒'}: {reminder['text']} 在 {unified_msg_origin}")
         
@@ -327,7 +910,9 @@ class ReminderScheduler:
         reminder_executor = ReminderExecutor(self.context, self.wechat_platforms)
         simple_sender = SimpleMessageSender(self.context, self.wechat_platforms)
         
-        if provider:
+        if simple:
+            await simple_sender.send_simple_message(unified_msg_origin, reminder, is_task)
+        elif provider:
             logger.info(f"使用提供商: {provider.meta().type}")
             if is_task:
                 # 任务模式：模拟用户发送消息，让AI执行任务
@@ -342,173 +927,95 @@ class ReminderScheduler:
             await simple_sender.send_simple_message(unified_msg_origin, reminder, is_task)
         
         # 如果是一次性任务（非重复任务），执行后从数据中删除
-        if reminder.get("repeat", "none") == "none":
-            if unified_msg_origin in self.reminder_data:
-                # 查找并删除这个提醒
-                for i, r in enumerate(self.reminder_data[unified_msg_origin]):
-                    if r == reminder:  # 比较整个字典
-                        self.reminder_data[unified_msg_origin].pop(i)
-                        logger.info(f"One-time {'task' if is_task else 'reminder'} removed: {reminder['text']}")
-                        await save_reminder_data(self.data_file, self.reminder_data)
-                        break
+        if reminder.once:
+            if await self.store.remove(unified_msg_origin, reminder):
+                logger.info(f"One-time {'task' if is_task else 'reminder'} removed: {reminder['text']}")
+    
+    def _interval_finished(self, unified_msg_origin: str, reminder: Reminder):
+        '''间隔提醒没有下一次触发时间时由分发器调用
+
+        有持续时间的间隔提醒在时间窗口结束后删除，不论最后一次是否执行（节假日跳过、错过触发、
+        加载时已经结束都会走到这里）；其余触发都不写数据文件。
+        '''
+        if reminder.repeat is not Repeat.INTERVAL or not reminder.interval.duration:
+            return
+        # 不带节假日数据再确认一次，超出节假日数据范围的提醒并没有结束
+        if next_occurrence(reminder, datetime.datetime.now() + self._lead(reminder)) is not None:
+            return
+        self.agenda.remove(reminder.id)
+        asyncio.ensure_future(self._remove_finished(unified_msg_origin, reminder))
+    
+    async def _remove_finished(self, unified_msg_origin: str, reminder: Reminder):
+        try:
+            if await self.store.remove(unified_msg_origin, reminder):
+                logger.info(f"间隔{'任务' if reminder.is_task else '提醒'}已结束并删除: {reminder['text']}")
+        except Exception as e:
+            logger.error(f"删除已结束的间隔提醒 {reminder['text']} 失败: {e}")
     
     def add_job(self, msg_origin, reminder, dt):
         '''添加定时任务'''
-        # 生成唯一的任务ID
-        job_id = f"reminder_{msg_origin}_{len(self.reminder_data[msg_origin])-1}"
-        
-        # 根据重复类型设置不同的触发器
-        if reminder.get("repeat") == "daily":
-            self.scheduler.add_job(
-                self._reminder_callback,
-                'cron',
-                args=[msg_origin, reminder],
-                hour=dt.hour,
-                minute=dt.minute,
-                misfire_grace_time=60,
-                id=job_id
-            )
-        elif reminder.get("repeat") == "daily_workday":
-            # 每个工作日重复
-            self.scheduler.add_job(
-                self._check_and_execute_workday,
-                'cron',
-                args=[msg_origin, reminder],
-                hour=dt.hour,
-                minute=dt.minute,
-                misfire_grace_time=60,
-                id=job_id
-            )
-        elif reminder.get("repeat") == "daily_holiday":
-            # 每个法定节假日重复
-            self.scheduler.add_job(
-                self._check_and_execute_holiday,
-                'cron',
-                args=[msg_origin, reminder],
-                hour=dt.hour,
-                minute=dt.minute,
-                misfire_grace_time=60,
-                id=job_id
-            )
-        elif reminder.get("repeat") == "weekly":
-            self.scheduler.add_job(
-                self._reminder_callback,
-                'cron',
-                args=[msg_origin, reminder],
-                day_of_week=dt.weekday(),
-                hour=dt.hour,
-                minute=dt.minute,
-                misfire_grace_time=60,
-                id=job_id
-            )
-        elif reminder.get("repeat") == "weekly_workday":
-            # 每周的这一天，但仅工作日执行
-            self.scheduler.add_job(
-                self._check_and_execute_workday,
-                'cron',
-                args=[msg_origin, reminder],
-                day_of_week=dt.weekday(),  # 保留这个限制，因为"每周"需要指定星期几
-                hour=dt.hour,
-                minute=dt.minute,
-                misfire_grace_time=60,
-                id=job_id
-            )
-        elif reminder.get("repeat") == "weekly_holiday":
-            # 每周的这一天，但仅法定节假日执行
-            self.scheduler.add_job(
-                self._check_and_execute_holiday,
-                'cron',
-                args=[msg_origin, reminder],
-                day_of_week=dt.weekday(),
-                hour=dt.hour,
-                minute=dt.minute,
-                misfire_grace_time=60,
-                id=job_id
-            )
-        elif reminder.get("repeat") == "monthly":
-            self.scheduler.add_job(
-                self._reminder_callback,
-                'cron',
-                args=[msg_origin, reminder],
-                day=dt.day,
-                hour=dt.hour,
-                minute=dt.minute,
-                misfire_grace_time=60,
-                id=job_id
-            )
-        elif reminder.get("repeat") == "monthly_workday":
-            # 每月的这一天，但仅工作日执行
-            self.scheduler.add_job(
-                self._check_and_execute_workday,
-                'cron',
-                args=[msg_origin, reminder],
-                day=dt.day,  # 保留这个限制，因为"每月"需要指定几号
-                hour=dt.hour,
-                minute=dt.minute,
-                misfire_grace_time=60,
-                id=job_id
-            )
-        elif reminder.get("repeat") == "monthly_holiday":
-            # 每月的这一天，但仅法定节假日执行
-            self.scheduler.add_job(
-                self._check_and_execute_holiday,
-                'cron',
-                args=[msg_origin, reminder],
-                day=dt.day,
-                hour=dt.hour,
-                minute=dt.minute,
-                misfire_grace_time=60,
-                id=job_id
-            )
-        elif reminder.get("repeat") == "yearly":
-            self.scheduler.add_job(
-                self._reminder_callback,
-                'cron',
-                args=[msg_origin, reminder],
-                month=dt.month,
-                day=dt.day,
-                hour=dt.hour,
-                minute=dt.minute,
-                misfire_grace_time=60,
-                id=job_id
-            )
-        elif reminder.get("repeat") == "yearly_workday":
-            # 每年的这一天，但仅工作日执行
-            self.scheduler.add_job(
-                self._check_and_execute_workday,
-                'cron',
-                args=[msg_origin, reminder],
-                month=dt.month,  # 保留这个限制，因为"每年"需要指定月份
-                day=dt.day,      # 保留这个限制，因为"每年"需要指定日期
-                hour=dt.hour,
-                minute=dt.minute,
-                misfire_grace_time=60,
-                id=job_id
-            )
-        elif reminder.get("repeat") == "yearly_holiday":
-            # 每年的这一天，但仅法定节假日执行
-            self.scheduler.add_job(
-                self._check_and_execute_holiday,
-                'cron',
-                args=[msg_origin, reminder],
-                month=dt.month,
-                day=dt.day,
-                hour=dt.hour,
-                minute=dt.minute,
-                misfire_grace_time=60,
-                id=job_id
-            )
-        else:
-            self.scheduler.add_job(
-                self._reminder_callback,
-                'date',
-                args=[msg_origin, reminder],
-                run_date=dt,
-                misfire_grace_time=60,
-                id=job_id
-            )
+        # 任务ID由提醒ID生成
+        job_id = self.job_id(reminder)
+        self.agenda.add(msg_origin, reminder)
+        
+        if not self._owns(msg_origin):
+            # 由持有该会话分区的进程在下次续租时发现并注册
+            return job_id
+        
+        if reminder.repeat is Repeat.INTERVAL:
+            self.ticker.add(msg_origin, reminder)
+            return job_id
+        
+        if self.dispatcher is not None:
+            self.dispatcher.add(msg_origin, reminder)
+            return job_id
+        
+        job_id, func, args, trigger = self._job_spec(msg_origin, reminder)
+        if self.coalesce and self.scheduler.get_job(job_id) is not None:
+            # 分钟桶已存在，记入桶中即可
+            return job_id
+        self.scheduler.add_job(
+            func,
+            trigger,
+            args=list(args),
+            misfire_grace_time=60,
+            id=job_id
+        )
         return job_id
     
+    def _register_recovered(self, session: str, reminders: list):
+        '''为数据存储恢复出的提醒注册定时任务'''
+        for reminder in reminders:
+            self.add_job(session, reminder, reminder.dt)
+
+    @staticmethod
+    def job_id(reminder: Reminder) -> str:
+        '''提醒对应的定时任务ID'''
+        return f"reminder_{reminder.id}"
+
+    def remove_reminder_job(self, reminder: Reminder):
+        '''删除提醒对应的定时任务'''
+        self.agenda.remove(reminder.id)
+        if reminder.repeat is Repeat.INTERVAL:
+            return self.ticker.remove(reminder.id)
+        if self.dispatcher is not None:
+            return self.dispatcher.remove(reminder.id)
+        if self.coalesce:
+            return self._bucket_remove(reminder.id)
+        return self.remove_job(self.job_id(reminder))
+    
+    def _bucket_remove(self, reminder_id: str) -> bool:
+        '''从分钟桶中移除提醒，桶空了才删除定时任务'''
+        bucket_id = self._bucket_of.pop(reminder_id, None)
+        if bucket_id is None:
+            return False
+        members = self._buckets.get(bucket_id, {})
+        members.pop(reminder_id, None)
+        if not members:
+            self._buckets.pop(bucket_id, None)
+            self.remove_job(bucket_id)
+        return True
+
     def remove_job(self, job_id):
         '''删除定时任务'''
         try:
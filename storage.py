@@ -0,0 +1,1044 @@
+import asyncio
+import datetime
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import sqlite3
+import time
+from types import MappingProxyType
+from astrbot.api import logger
+from .models import DATETIME_FORMAT, Reminder
+from .migrations import SCHEMA_VERSION, MigrationReport, upgrade_records
+from .triggers import MISFIRE_GRACE_TIME
+
+# 快照中保存元数据的保留键，不是会话ID
+META_KEY = "__meta__"
+
+
+class WriteBehindSaver:
+    """延迟写入器
+
+    修改数据时只标记为脏，防抖窗口内的所有修改合并成一次写入；
+    具体的序列化和写盘由 write_func 在工作线程中完成，不阻塞事件循环。
+    """
+
+    def __init__(self, write_func, debounce: float = 0.5):
+        self.write_func = write_func  # 协程函数，执行一次实际写入
+        self.debounce = debounce
+        self._dirty = False
+        self._timer = None
+        self._task = None
+        self._lock = asyncio.Lock()
+
+    def mark_dirty(self):
+        '''标记有未保存的修改，并在防抖窗口结束后写入'''
+        self._dirty = True
+        if self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.debounce, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        self._task = asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        '''立即写入所有未保存的修改，关闭时调用'''
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        async with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            try:
+                await self.write_func()
+            except Exception as e:
+                # 写入失败时保留脏标记，下次修改或关闭时重试
+                self._dirty = True
+                logger.error(f"保存提醒数据失败: {e}")
+
+
+async def run_in_thread(func, *args):
+    '''在默认线程池中执行阻塞的文件操作'''
+    return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+
+class ReminderStore:
+    """内存中的提醒数据 {会话ID: (Reminder, ...)}
+
+    负责查询和增删，修改通过 _changed 通知子类，由子类决定如何持久化。
+    一次性提醒的到期时间保存在最小堆中，清理时只弹出真正过期的条目。
+    所有提醒按 id 建有索引，触发和删除时不需要在列表中按内容查找。
+
+    会话的提醒列表是不可变的元组，修改时生成新元组整体替换（写时复制）。
+    get() 和 snapshot() 返回的数据不会再被修改，读取方跨 await 使用也不会看到修改了一半的数据。
+    """
+
+    def __init__(self, debounce: float = 0.5):
+        self.data = {}
+        self._snapshot = None  # 缓存的只读快照，数据变化后失效
+        self._by_id = {}  # 提醒ID -> Reminder
+        self.saver = WriteBehindSaver(self._persist, debounce)
+        self._expiry = []  # (到期时间, 序号, 会话ID, 提醒)
+        self._expiry_seq = itertools.count()
+        # 一次性提醒过了触发时间仍保留的秒数，晚到但仍在宽限期内的触发还能按ID找到它
+        self.expire_grace = MISFIRE_GRACE_TIME
+        # 停机补发进行中时不清理该时间之后触发的一次性提醒，None 表示没有进行中的补发
+        self.retain_since = None
+
+    def get(self, session: str) -> tuple:
+        '''获取会话下的提醒列表（不可变）'''
+        return self.data.get(session, ())
+
+    def peek(self, session: str) -> tuple:
+        '''获取会话下的提醒列表，延迟加载时尚未读取的会话只有触发信息，不会读取分片'''
+        return self.data.get(session, ())
+
+    def snapshot(self):
+        '''所有数据的只读快照 {会话ID: (Reminder, ...)}，两次修改之间多次获取只复制一次'''
+        if self._snapshot is None:
+            self._snapshot = MappingProxyType(dict(self.data))
+        return self._snapshot
+
+    def iter_sessions(self):
+        '''遍历所有 (会话ID, 提醒列表)
+
+        延迟加载时尚未读取的会话只有触发信息，需要内容时使用 get() 或 hydrate()
+        '''
+        return list(self.snapshot().items())
+
+    def _publish(self, session: str, reminders):
+        '''用新的元组替换会话的提醒列表'''
+        if reminders:
+            self.data[session] = tuple(reminders)
+        else:
+            self.data.pop(session, None)
+        self._snapshot = None
+
+    def find(self, session: str, is_task: bool = None, repeat: str = None, creator_id: str = None) -> list:
+        '''按条件筛选会话下的提醒'''
+        return [
+            r for r in self.data.get(session, ())
+            if (is_task is None or r.is_task == is_task)
+            and (repeat is None or r.repeat_name == repeat)
+            and (creator_id is None or r.creator_id == creator_id)
+        ]
+
+    def lookup(self, reminder_id: str):
+        '''按ID查找提醒'''
+        return self._by_id.get(reminder_id)
+
+    def count(self) -> int:
+        return sum(len(reminders) for reminders in self.data.values())
+
+    async def add(self, session: str, reminder: Reminder):
+        '''添加提醒'''
+        reminder.bind(session)
+        self._publish(session, self.data.get(session, ()) + (reminder,))
+        self._by_id[reminder.id] = reminder
+        self._track(session, reminder)
+        self._changed("add", session, reminder)
+
+    async def remove(self, session: str, reminder: Reminder) -> bool:
+        '''删除提醒'''
+        if not self._remove_from(session, reminder):
+            return False
+        self._changed("remove", session, reminder)
+        return True
+
+    async def remove_many(self, session: str, reminders: list) -> int:
+        '''批量删除同一会话下的多个提醒'''
+        removed = 0
+        for reminder in reminders:
+            if await self.remove(session, reminder):
+                removed += 1
+        return removed
+
+    def _remove_from(self, session: str, reminder: Reminder, by_content: bool = False) -> bool:
+        reminders = self.data.get(session)
+        if not reminders:
+            return False
+        # 按ID删除；没有ID的旧日志记录只能按内容比较
+        target = self._by_id.get(reminder.id, reminder)
+        for i, r in enumerate(reminders):
+            if r is target or r.id == reminder.id or (by_content and r.same_content(reminder)):
+                break
+        else:
+            return False
+        self._publish(session, reminders[:i] + reminders[i + 1:])
+        self._by_id.pop(r.id, None)
+        return True
+
+    def _track(self, session: str, reminder: Reminder):
+        '''把一次性提醒加入到期索引'''
+        if not reminder.once or reminder.dt is None:
+            return
+        heapq.heappush(self._expiry, (reminder.dt, next(self._expiry_seq), session, reminder))
+
+    @staticmethod
+    def _decode_list(reminders: list, session: str, version: int = SCHEMA_VERSION,
+                     report: MigrationReport = None) -> list:
+        '''把数据文件中的字典转换为 Reminder，旧版本的数据先逐条升级'''
+        if version < SCHEMA_VERSION:
+            reminders = upgrade_records(reminders, version, report)
+        return [Reminder.from_dict(r, session) for r in reminders]
+
+    def _decode(self, data: dict, version: int = SCHEMA_VERSION, report: MigrationReport = None) -> dict:
+        '''把数据文件中的 {会话ID: [字典, ...]} 转换为 Reminder'''
+        decoded = {}
+        for session, reminders in data.items():
+            reminders = self._decode_list(reminders, session, version, report)
+            if reminders:
+                decoded[session] = tuple(reminders)
+        return decoded
+
+    @staticmethod
+    def _encode(reminders: list) -> list:
+        return [r.to_dict() for r in reminders]
+
+    def _build_index(self):
+        '''加载完成后丢弃无效数据并建立ID索引和到期索引'''
+        self._expiry = []
+        self._by_id = {}
+        for group in list(self.data.keys()):
+            # 确保datetime字段存在且不为空
+            reminders = tuple(r for r in self.data[group] if r.get("datetime"))
+            self._publish(group, reminders)
+            for reminder in reminders:
+                self._by_id[reminder.id] = reminder
+                self._track(group, reminder)
+
+    def _purge_cutoff(self, now: datetime.datetime = None) -> datetime.datetime:
+        '''触发时间早于该时间的一次性提醒已经过期'''
+        cutoff = (now or datetime.datetime.now()) - datetime.timedelta(seconds=self.expire_grace)
+        if self.retain_since is not None:
+            cutoff = min(cutoff, self.retain_since)
+        return cutoff
+
+    def purge_expired(self, now: datetime.datetime = None) -> set:
+        '''从到期索引中弹出触发时间加宽限期已过的一次性提醒并删除，返回有变化的会话'''
+        cutoff = self._purge_cutoff(now)
+        expired = {}  # 会话ID -> 过期提醒的ID
+        while self._expiry and self._expiry[0][0] < cutoff:
+            _, _, group, reminder = heapq.heappop(self._expiry)
+            # 已被删除的提醒在这里自然跳过
+            if self._by_id.get(reminder.id) is reminder:
+                del self._by_id[reminder.id]
+                expired.setdefault(group, set()).add(reminder.id)
+        for group, ids in expired.items():
+            # 每个会话只替换一次，没有任何提醒的会话条目会被删除
+            self._publish(group, [r for r in self.data.get(group, ()) if r.id not in ids])
+        return set(expired)
+
+    async def hydrate(self, session: str):
+        '''确保会话的提醒内容已经加载，只有延迟加载的存储需要实现'''
+
+    def _changed(self, op: str, session: str, reminder: Reminder):
+        raise NotImplementedError
+
+    async def _persist(self):
+        raise NotImplementedError
+
+    async def flush(self):
+        '''立即写入所有未保存的修改'''
+        await self.saver.flush()
+
+    async def compact(self):
+        await self.flush()
+
+    async def close(self):
+        await self.flush()
+
+    def reopen(self):
+        '''关闭后重新打开（插件重载时由新实例调用），内存中的数据仍然有效，不重新读取'''
+
+
+class JournalReminderStore(ReminderStore):
+    """提醒数据存储：快照文件 + 追加日志
+
+    每次增删只生成一条日志记录，启动时在最近一次快照之上重放日志。
+    日志记录经 WriteBehindSaver 合并后在工作线程中追加写入；
+    日志超过大小或时间阈值后，在同一次写入中压缩成新的快照。
+    """
+
+    def __init__(self, data_file: str, journal_max_bytes: int = 1024 * 1024, journal_max_age: float = 3600,
+                 debounce: float = 0.5):
+        super().__init__(debounce)
+        self.data_file = data_file
+        self.journal_file = data_file + ".journal"
+        self.journal_max_bytes = journal_max_bytes
+        self.journal_max_age = journal_max_age
+
+        self._seq = 0  # 最后一条日志记录的序号
+        self._journal = None
+        self._journal_bytes = 0
+        self._journal_started = time.time()
+        self._pending = []  # 尚未写入日志文件的记录
+        self._force_compact = False
+        self._version = SCHEMA_VERSION  # 正在加载的数据的格式版本
+        self._report = None
+
+    def load(self) -> dict:
+        '''加载快照并重放日志，旧版本的数据在加载时升级一次并立即写回'''
+        snapshot_seq = 0
+        if os.path.exists(self.data_file):
+            with open(self.data_file, "r", encoding='utf-8') as f:
+                data = json.load(f)
+            meta = data.pop(META_KEY, {})
+            snapshot_seq = meta.get("journal_seq", 0)
+            # 日志与快照的格式版本相同，升级后会立即写成新快照
+            self._version = meta.get("schema_version", 1)
+            if self._version < SCHEMA_VERSION:
+                self._report = MigrationReport(self._version)
+            self.data = self._decode(data, self._version, self._report)
+        else:
+            with open(self.data_file, "w", encoding='utf-8') as f:
+                json.dump({META_KEY: self._meta(0)}, f)
+            self.data = {}
+        self._seq = snapshot_seq
+
+        replayed = 0
+        valid_bytes = 0
+        if os.path.exists(self.journal_file):
+            with open(self.journal_file, "rb") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line.decode('utf-8'))
+                    except ValueError:
+                        # 最后一行可能在写入时被中断，丢弃剩余内容
+                        logger.warning("提醒日志存在不完整的记录，已忽略其后的内容")
+                        break
+                    valid_bytes += len(line)
+                    seq = record.get("seq", 0)
+                    if seq <= snapshot_seq:
+                        # 已经包含在快照中
+                        continue
+                    self._apply(record)
+                    self._seq = seq
+                    replayed += 1
+            if valid_bytes != os.path.getsize(self.journal_file):
+                with open(self.journal_file, "rb+") as f:
+                    f.truncate(valid_bytes)
+        if replayed:
+            logger.info(f"已重放 {replayed} 条提醒日志记录")
+
+        self._journal = open(self.journal_file, "ab")
+        self._journal_bytes = valid_bytes
+        self._journal_started = time.time()
+        self._build_index()
+        if self._report is not None:
+            # 升级后的数据立即写成快照，之后启动不再重复
+            snapshot = dict(self.snapshot())
+            snapshot[META_KEY] = self._meta(self._seq)
+            self._write_snapshot(snapshot)
+            self._journal_bytes = 0
+            self._report.log(self.data_file)
+            self._version, self._report = SCHEMA_VERSION, None
+        return self.data
+
+    @staticmethod
+    def _meta(seq: int) -> dict:
+        return {"journal_seq": seq, "schema_version": SCHEMA_VERSION}
+
+    def _changed(self, op: str, session: str, reminder: Reminder):
+        self._append({"op": op, "session": session, "reminder": reminder.to_dict()})
+
+    def _apply(self, record: dict):
+        '''把一条日志记录应用到内存数据'''
+        op = record.get("op")
+        session = record.get("session")
+        if op == "add":
+            reminders = self._decode_list([record["reminder"]], session, self._version, self._report)
+            self._publish(session, self.data.get(session, ()) + tuple(reminders))
+        elif op == "remove":
+            # 删除记录按同样的步骤升级，但不计入统计
+            for reminder in self._decode_list([record["reminder"]], session, self._version,
+                                              MigrationReport(self._version)):
+                self._remove_from(session, reminder, by_content="id" not in record["reminder"])
+
+    def _append(self, record: dict):
+        '''生成一条日志记录，由延迟写入器合并写盘'''
+        self._seq += 1
+        record["seq"] = self._seq
+        self._pending.append((json.dumps(record, ensure_ascii=False) + "\n").encode('utf-8'))
+        self.saver.mark_dirty()
+
+    def _should_compact(self) -> bool:
+        if self._force_compact:
+            return True
+        if self._journal_bytes <= 0:
+            return False
+        if self._journal_bytes >= self.journal_max_bytes:
+            return True
+        return time.time() - self._journal_started >= self.journal_max_age
+
+    def _write_journal(self, payload: bytes):
+        self._journal.write(payload)
+        self._journal.flush()
+
+    async def _persist(self):
+        '''写入积压的日志记录，超过阈值时压缩快照
+
+        每次写入时清理过期的一次性提醒；清理不写日志，重新加载时按同样的规则再次清理，
+        压缩时写入快照后不再出现。
+        '''
+        self.purge_expired()
+        if self._pending:
+            count = len(self._pending)
+            payload = b"".join(self._pending)
+            await run_in_thread(self._write_journal, payload)
+            # 写入期间新增的记录排在后面，留到下一次写入
+            del self._pending[:count]
+            self._journal_bytes += len(payload)
+        if self._should_compact():
+            self._force_compact = False
+            await self._compact()
+
+    def _write_snapshot(self, snapshot: dict):
+        snapshot = {
+            group: value if group == META_KEY else self._encode(value)
+            for group, value in snapshot.items()
+        }
+        tmp_file = self.data_file + ".tmp"
+        with open(tmp_file, "w", encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False)
+        os.replace(tmp_file, self.data_file)
+        # 日志文件中的记录都已包含在快照中；尚未写入的记录仍在内存里，之后再追加
+        self._journal.seek(0)
+        self._journal.truncate()
+
+    async def _compact(self):
+        self.purge_expired()
+        # 各会话的元组不会被修改，复制一层字典即可得到一致的数据视图，序列化放到线程中执行
+        snapshot = dict(self.snapshot())
+        seq = self._seq
+        snapshot[META_KEY] = self._meta(seq)
+
+        await run_in_thread(self._write_snapshot, snapshot)
+        self._journal_bytes = 0
+        self._journal_started = time.time()
+        logger.info(f"提醒数据已压缩为快照，日志序号: {seq}")
+
+    async def compact(self):
+        '''把当前数据写成新快照'''
+        self._force_compact = True
+        self.saver.mark_dirty()
+        await self.saver.flush()
+
+    async def close(self):
+        '''关闭存储：写入所有积压的修改和最终快照'''
+        if self._journal is None:
+            return
+        if self._pending or self._journal_bytes > 0:
+            await self.compact()
+        self._journal.close()
+        self._journal = None
+
+    def reopen(self):
+        '''关闭时已写成最终快照，只需重新打开日志文件继续追加'''
+        if self._journal is not None:
+            return
+        self._journal = open(self.journal_file, "ab")
+        self._journal_bytes = os.path.getsize(self.journal_file)
+        self._journal_started = time.time()
+
+
+class ShardedReminderStore(ReminderStore):
+    """按会话分片的提醒数据存储
+
+    每个会话保存在 shards 目录下独立的分片文件中，manifest.json 记录会话与分片文件的对应关系。
+    只重写有修改的会话分片，写入量只与单个会话的大小有关；manifest 仅在会话增删时重写。
+
+    延迟加载模式下 index.json 按分片中的顺序记录每个提醒的时间、重复类型和ID，启动时只读取索引，
+    得到只含触发信息的提醒，足够注册定时任务；会话被查看、修改或有提醒触发时才读取该会话的分片，
+    并原地补全这些对象，已注册的定时任务引用的仍是同一个对象。
+    索引的修改按会话追加到 index.journal，读取时在 index.json 之上重放，
+    日志超过一定大小后才整体重写 index.json；不使用延迟加载时不维护索引。
+    """
+
+    MANIFEST = "manifest.json"
+    INDEX = "index.json"
+    INDEX_JOURNAL = "index.journal"
+    # 索引日志超过该字节数且大于 index.json 时重写索引
+    INDEX_COMPACT_BYTES = 64 * 1024
+
+    def __init__(self, shard_dir: str, legacy_file: str = None, debounce: float = 0.5, lazy: bool = False):
+        super().__init__(debounce)
+        self.shard_dir = shard_dir
+        self.legacy_file = legacy_file
+        self.lazy = lazy
+        self.manifest = {}  # 会话ID -> 分片文件名
+        self._triggers = {}  # 会话ID -> [[时间, 重复类型, ID, 是否任务], ...]，即索引内容
+        self._loaded = set()  # 已读取分片的会话
+        # 分片中有索引里没有的提醒时调用 on_recovered(会话ID, [提醒])，由调度器为它们注册定时任务
+        self.on_recovered = None
+        self._dirty = set()
+        self._index_bytes = 0  # index.json 的大小
+        self._index_journal_bytes = 0  # index.journal 的大小
+
+    @staticmethod
+    def shard_name(session: str) -> str:
+        return hashlib.sha1(session.encode('utf-8')).hexdigest()[:20] + ".json"
+
+    @staticmethod
+    def _entries(reminders: list) -> list:
+        return [[r.datetime_str, r.repeat_name, r.id, r.is_task] for r in reminders]
+
+    def load(self) -> dict:
+        '''读取 manifest 和分片（延迟加载时只读取索引），首次使用时从 JSON 数据导入'''
+        os.makedirs(self.shard_dir, exist_ok=True)
+        manifest_file = os.path.join(self.shard_dir, self.MANIFEST)
+        index_file = os.path.join(self.shard_dir, self.INDEX)
+        report = None
+        if os.path.exists(manifest_file):
+            with open(manifest_file, "r", encoding='utf-8') as f:
+                manifest_data = json.load(f)
+            self.manifest = manifest_data.get("sessions", {})
+            version = manifest_data.get("schema_version", 1)
+            if self.lazy and version == SCHEMA_VERSION and os.path.exists(index_file):
+                self._triggers = self._read_index()
+                for session, entries in self._triggers.items():
+                    # 旧索引没有是否任务一项，读取分片前按提醒处理
+                    self.data[session] = [
+                        Reminder.from_dict(
+                            {"datetime": entry[0], "repeat": entry[1], "id": entry[2],
+                             "is_task": entry[3] if len(entry) > 3 else False},
+                            session
+                        )
+                        for entry in entries
+                    ]
+                # manifest 中有而索引中没有的会话（写入分片后、追加索引前中断），直接读取分片并补写索引
+                missing = [session for session in self.manifest if session not in self._triggers]
+                for session in missing:
+                    reminders = self._read_shard(session)
+                    if reminders:
+                        self.data[session] = reminders
+                        self._triggers[session] = self._entries(reminders)
+                    if reminders is not None:
+                        self._loaded.add(session)
+                if missing:
+                    logger.warning(f"索引中缺少 {len(missing)} 个会话，已从分片读取")
+                    self._write_index(dict(self._triggers))
+                self._build_index()
+                logger.info(f"延迟加载：已从索引读取 {self.count()} 个提醒/任务的触发信息")
+                return self.data
+            if version < SCHEMA_VERSION:
+                report = MigrationReport(version)
+            failed = set()
+            for session in self.manifest:
+                reminders = self._read_shard(session, version, report)
+                if reminders is None:
+                    failed.add(session)
+                elif reminders:
+                    self.data[session] = reminders
+            if report is not None:
+                # 升级后的数据立即整体写回，之后启动不再重复
+                manifest = {s: name for s, name in self.manifest.items() if s in self.data or s in failed}
+                self._write_shards({s: self.data.get(s) for s in self.manifest if s not in failed}, manifest)
+                self.manifest = manifest
+                report.log(self.shard_dir)
+        elif self.legacy_file and os.path.exists(self.legacy_file):
+            legacy = JournalReminderStore(self.legacy_file)
+            self.data = legacy.load()
+            legacy._journal.close()
+            manifest = self._next_manifest(self.data.keys())
+            self._write_shards({s: list(r) for s, r in self.data.items()}, manifest or {})
+            self.manifest = manifest or {}
+            logger.info(f"已从 {self.legacy_file} 导入 {len(self.data)} 个会话到分片存储")
+        self._loaded = set(self.data)
+        if self.lazy:
+            self._triggers = {s: self._entries(r) for s, r in self.data.items()}
+            self._write_index(dict(self._triggers))
+        else:
+            # 不维护索引时删除旧索引，之后开启延迟加载会重新生成，不会读到过期的内容
+            for name in (self.INDEX, self.INDEX_JOURNAL):
+                if os.path.exists(os.path.join(self.shard_dir, name)):
+                    os.remove(os.path.join(self.shard_dir, name))
+        self._build_index()
+        return self.data
+
+    def _read_index(self) -> dict:
+        '''读取 index.json 并重放 index.journal 中之后的修改'''
+        index_file = os.path.join(self.shard_dir, self.INDEX)
+        with open(index_file, "r", encoding='utf-8') as f:
+            triggers = json.load(f).get("sessions", {})
+        self._index_bytes = os.path.getsize(index_file)
+        self._index_journal_bytes = 0
+        journal_file = os.path.join(self.shard_dir, self.INDEX_JOURNAL)
+        if os.path.exists(journal_file):
+            with open(journal_file, "rb") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line.decode('utf-8'))
+                    except ValueError:
+                        # 最后一行可能在写入时被中断，之后的修改在分片中仍然存在，读取分片时补全
+                        logger.warning("索引日志存在不完整的记录，已忽略其后的内容")
+                        break
+                    self._index_journal_bytes += len(line)
+                    if record["entries"] is None:
+                        triggers.pop(record["session"], None)
+                    else:
+                        triggers[record["session"]] = record["entries"]
+            if self._index_journal_bytes < os.path.getsize(journal_file):
+                # 截掉不完整的内容，之后追加的记录才能被读到
+                with open(journal_file, "r+b") as f:
+                    f.truncate(self._index_journal_bytes)
+        return triggers
+
+    def _read_shard(self, session: str, version: int = SCHEMA_VERSION, report: MigrationReport = None):
+        '''读取一个会话的分片，失败时返回 None'''
+        try:
+            with open(os.path.join(self.shard_dir, self.manifest[session]), "r", encoding='utf-8') as f:
+                reminders = json.load(f)["reminders"]
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"读取会话 {session} 的分片失败: {e}")
+            return None
+        return self._decode_list(reminders, session, version, report)
+
+    def _fill(self, session: str, reminders: list):
+        '''用分片中的内容补全只含触发信息的提醒，两者不一致时以分片为准
+
+        写入分片后、追加索引前中断时，分片中会有索引里没有的提醒：按分片中的顺序加入会话，
+        标记为脏以便重写索引，并通过 on_recovered 交给调度器注册。已过期被清理的一次性提醒不恢复；
+        索引中有而分片中没有的提醒被丢弃。
+        '''
+        stubs = {stub.id: stub for stub in self.data.get(session, ())}
+        cutoff = self._purge_cutoff()
+        merged = []
+        recovered = []
+        for reminder in reminders:
+            stub = stubs.pop(reminder.id, None)
+            if stub is not None:
+                stub.update_from(reminder)
+                merged.append(stub)
+            elif not (reminder.once and reminder.dt is not None and reminder.dt < cutoff):
+                merged.append(reminder)
+                recovered.append(reminder)
+        if stubs:
+            logger.warning(f"会话 {session} 的索引中有 {len(stubs)} 个提醒在分片中不存在，已忽略")
+            for stub_id in stubs:
+                self._by_id.pop(stub_id, None)
+        if recovered or stubs:
+            self._publish(session, merged)
+        for reminder in recovered:
+            self._by_id[reminder.id] = reminder
+            self._track(session, reminder)
+        self._loaded.add(session)
+        if recovered:
+            logger.warning(f"会话 {session} 的分片中有 {len(recovered)} 个提醒不在索引中，已按分片恢复")
+            self._dirty.add(session)
+            self.saver.mark_dirty()
+            if self.on_recovered is not None:
+                self.on_recovered(session, recovered)
+
+    def _ensure_loaded(self, session: str):
+        if session in self._loaded or session not in self.manifest:
+            return
+        reminders = self._read_shard(session)
+        if reminders is not None:
+            self._fill(session, reminders)
+
+    async def hydrate(self, session: str):
+        '''确保会话的提醒内容已经读取，文件读取在工作线程中进行'''
+        if session in self._loaded or session not in self.manifest:
+            return
+        reminders = await run_in_thread(self._read_shard, session)
+        if reminders is not None and session not in self._loaded:
+            self._fill(session, reminders)
+
+    def get(self, session: str) -> tuple:
+        self._ensure_loaded(session)
+        return super().get(session)
+
+    def find(self, session: str, is_task: bool = None, repeat: str = None, creator_id: str = None) -> list:
+        self._ensure_loaded(session)
+        return super().find(session, is_task, repeat, creator_id)
+
+    async def add(self, session: str, reminder: Reminder):
+        await self.hydrate(session)
+        self._loaded.add(session)
+        await super().add(session, reminder)
+
+    async def remove(self, session: str, reminder: Reminder) -> bool:
+        await self.hydrate(session)
+        return await super().remove(session, reminder)
+
+    def _changed(self, op: str, session: str, reminder: Reminder):
+        self._dirty.add(session)
+        self.saver.mark_dirty()
+
+    def _next_manifest(self, sessions):
+        '''会话有增删时返回新的 manifest，否则返回 None'''
+        added = [s for s in sessions if s in self.data and s not in self.manifest]
+        removed = [s for s in sessions if s not in self.data and s in self.manifest]
+        if not added and not removed:
+            return None
+        manifest = dict(self.manifest)
+        for session in added:
+            manifest[session] = self.shard_name(session)
+        for session in removed:
+            del manifest[session]
+        return manifest
+
+    def _write_index(self, triggers: dict):
+        '''整体重写 index.json 并清空索引日志'''
+        path = os.path.join(self.shard_dir, self.INDEX)
+        with open(path + ".tmp", "w", encoding='utf-8') as f:
+            json.dump({"sessions": triggers}, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(path + ".tmp", path)
+        self._index_bytes = os.path.getsize(path)
+        # 日志中的修改都已包含在新索引中，中途中断时重放它们结果也相同
+        with open(os.path.join(self.shard_dir, self.INDEX_JOURNAL), "wb"):
+            pass
+        self._index_journal_bytes = 0
+
+    def _append_index(self, changes: dict):
+        '''把有修改的会话的索引条目追加到索引日志（None 表示会话已删除）'''
+        lines = "".join(
+            json.dumps({"session": session, "entries": entries}, ensure_ascii=False, separators=(",", ":")) + "\n"
+            for session, entries in changes.items()
+        ).encode('utf-8')
+        with open(os.path.join(self.shard_dir, self.INDEX_JOURNAL), "ab") as f:
+            f.write(lines)
+        self._index_journal_bytes += len(lines)
+
+    def _write_shards(self, shards: dict, manifest, index: tuple = None):
+        '''写入分片（值为 None 表示删除该分片）、manifest 和索引
+
+        index 为 (有修改的会话的索引条目, 完整索引)，完整索引不为 None 时整体重写，否则只追加到索引日志。
+        '''
+        for session, reminders in shards.items():
+            path = os.path.join(self.shard_dir, self.shard_name(session))
+            if reminders is None:
+                if os.path.exists(path):
+                    os.remove(path)
+                continue
+            tmp_file = path + ".tmp"
+            with open(tmp_file, "w", encoding='utf-8') as f:
+                json.dump({"session": session, "reminders": self._encode(reminders)}, f, ensure_ascii=False)
+            os.replace(tmp_file, path)
+        if manifest is not None:
+            path = os.path.join(self.shard_dir, self.MANIFEST)
+            with open(path + ".tmp", "w", encoding='utf-8') as f:
+                json.dump({"schema_version": SCHEMA_VERSION, "sessions": manifest}, f, ensure_ascii=False)
+            os.replace(path + ".tmp", path)
+        if index is not None:
+            changes, triggers = index
+            if triggers is not None:
+                self._write_index(triggers)
+            elif changes:
+                self._append_index(changes)
+
+    async def _persist(self):
+        '''只重写有修改的会话分片'''
+        self._dirty |= self.purge_expired()
+        dirty, self._dirty = self._dirty, set()
+        # 分片只能整体重写，尚未读取的会话先补全内容
+        for session in dirty:
+            if session in self.data:
+                await self.hydrate(session)
+        shards = {}
+        for session in dirty:
+            if session not in self.data:
+                shards[session] = None
+            elif session in self._loaded:
+                shards[session] = self.data[session]
+            else:
+                logger.error(f"会话 {session} 的分片无法读取，跳过本次写入")
+        manifest = self._next_manifest(shards.keys())
+        index = None
+        if self.lazy:
+            changes = {}
+            for session, reminders in shards.items():
+                if reminders is None:
+                    self._triggers.pop(session, None)
+                else:
+                    self._triggers[session] = self._entries(reminders)
+                changes[session] = self._triggers.get(session)
+            compact = self._index_journal_bytes > max(self.INDEX_COMPACT_BYTES, self._index_bytes)
+            index = (changes, dict(self._triggers) if compact else None)
+        try:
+            await run_in_thread(self._write_shards, shards, manifest, index)
+        except Exception:
+            self._dirty |= dirty
+            raise
+        if manifest is not None:
+            self.manifest = manifest
+
+
+class SQLiteReminderStore:
+    """基于 SQLite 的提醒数据存储，接口与 ReminderStore 相同
+
+    会话、创建者、重复类型、是否任务和触发时间都建有索引，
+    查询和删除只涉及相关的行，单条增删也只修改对应的行；删除和按ID查找走 reminder_id 唯一索引。
+    """
+
+    def __init__(self, db_file: str, legacy_file: str = None):
+        self.db_file = db_file
+        self.legacy_file = legacy_file
+        self.conn = None
+        # 一次性提醒过了触发时间仍保留的秒数和补发期间的保留起点，与 ReminderStore 相同
+        self.expire_grace = MISFIRE_GRACE_TIME
+        self.retain_since = None
+        self._row_sessions = None  # 上次 changed_sessions 时的 {rid: 会话ID}
+
+    def _connect(self):
+        self.conn = sqlite3.connect(self.db_file)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+
+    def load(self):
+        '''打开数据库，首次使用时从 JSON 数据导入'''
+        self._connect()
+        created = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'reminders'"
+        ).fetchone() is None
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS reminders (
+                rid INTEGER PRIMARY KEY AUTOINCREMENT,
+                reminder_id TEXT,
+                session TEXT NOT NULL,
+                text TEXT,
+                datetime TEXT,
+                fire_at TEXT,
+                user_name TEXT,
+                repeat TEXT,
+                creator_id TEXT,
+                creator_name TEXT,
+                is_task INTEGER NOT NULL DEFAULT 0,
+                extra TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_reminders_session ON reminders(session);
+            CREATE INDEX IF NOT EXISTS idx_reminders_creator ON reminders(creator_id);
+            CREATE INDEX IF NOT EXISTS idx_reminders_repeat ON reminders(repeat);
+            CREATE INDEX IF NOT EXISTS idx_reminders_is_task ON reminders(is_task);
+            CREATE INDEX IF NOT EXISTS idx_reminders_fire_at ON reminders(fire_at);
+        """)
+        if created:
+            # 新建的表已经是当前格式，直接记录版本，不走升级流程
+            self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        else:
+            self._migrate()
+        self.conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_reminders_id ON reminders(reminder_id)")
+
+        empty = self.conn.execute("SELECT 1 FROM reminders LIMIT 1").fetchone() is None
+        if empty and self.legacy_file and os.path.exists(self.legacy_file):
+            legacy = JournalReminderStore(self.legacy_file)
+            data = legacy.load()
+            legacy._journal.close()
+            with self.conn:
+                for session, reminders in data.items():
+                    self.conn.executemany(self._insert_sql(), [self._to_row(session, r) for r in reminders])
+            logger.info(f"已从 {self.legacy_file} 导入 {legacy.count()} 个提醒/任务到 SQLite")
+
+        # 停机期间到期的一次性提醒留给停机补发，补发收集完之后再清理
+        self.conn.commit()
+
+    def _migrate(self):
+        '''按 PRAGMA user_version 记录的版本升级旧数据，只执行一次'''
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0] or 1
+        if version >= SCHEMA_VERSION:
+            return
+        report = MigrationReport(version)
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(reminders)")]
+        if "reminder_id" not in columns:
+            self.conn.execute("ALTER TABLE reminders ADD COLUMN reminder_id TEXT")
+        rows = self.conn.execute("SELECT rid, reminder_id, datetime FROM reminders").fetchall()
+        records = ({"rid": rid, "id": reminder_id, "datetime": dt} for rid, reminder_id, dt in rows)
+        kept = set()
+        with self.conn:
+            for record in upgrade_records(records, version, report):
+                kept.add(record["rid"])
+                self.conn.execute(
+                    "UPDATE reminders SET reminder_id = ?, datetime = ?, fire_at = ? WHERE rid = ?",
+                    (record["id"], record["datetime"], record["datetime"], record["rid"])
+                )
+            self.conn.executemany("DELETE FROM reminders WHERE rid = ?", [(row[0],) for row in rows if row[0] not in kept])
+            self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        report.log(self.db_file)
+
+    @staticmethod
+    def _to_row(session: str, reminder: Reminder) -> tuple:
+        # fire_at 是可排序的触发时间，无法解析时为 None
+        return (
+            reminder.id,
+            session,
+            reminder.text,
+            reminder.datetime_str,
+            reminder.dt.strftime(DATETIME_FORMAT) if reminder.dt is not None else None,
+            reminder.user_name,
+            reminder.repeat_name,
+            reminder.creator_id,
+            reminder.creator_name,
+            1 if reminder.is_task else 0,
+            json.dumps(reminder.extra, ensure_ascii=False) if reminder.extra else None,
+        )
+
+    @staticmethod
+    def _insert_sql() -> str:
+        return ("INSERT INTO reminders (reminder_id, session, text, datetime, fire_at, user_name, repeat, "
+                "creator_id, creator_name, is_task, extra) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)")
+
+    @staticmethod
+    def _from_row(session: str, row) -> Reminder:
+        reminder_id, text, dt, user_name, repeat, creator_id, creator_name, is_task, extra = row
+        reminder = {
+            "id": reminder_id,
+            "text": text,
+            "datetime": dt,
+            "user_name": user_name,
+            "repeat": repeat or "none",
+            "creator_id": creator_id,
+            "creator_name": creator_name,
+            "is_task": bool(is_task),
+        }
+        if extra:
+            reminder.update(json.loads(extra))
+        return Reminder.from_dict(reminder, session)
+
+    _SELECT = "SELECT reminder_id, text, datetime, user_name, repeat, creator_id, creator_name, is_task, extra FROM reminders"
+
+    def get(self, session: str) -> tuple:
+        '''获取会话下的提醒列表'''
+        rows = self.conn.execute(f"{self._SELECT} WHERE session = ? ORDER BY rid", (session,))
+        return tuple(self._from_row(session, row) for row in rows)
+
+    def peek(self, session: str) -> tuple:
+        '''与 get 相同，每次查询都返回完整内容'''
+        return self.get(session)
+
+    def find(self, session: str, is_task: bool = None, repeat: str = None, creator_id: str = None) -> list:
+        '''按条件查询会话下的提醒'''
+        sql = f"{self._SELECT} WHERE session = ?"
+        params = [session]
+        if is_task is not None:
+            sql += " AND is_task = ?"
+            params.append(1 if is_task else 0)
+        if repeat is not None:
+            sql += " AND repeat = ?"
+            params.append(repeat)
+        if creator_id is not None:
+            sql += " AND creator_id = ?"
+            params.append(creator_id)
+        rows = self.conn.execute(sql + " ORDER BY rid", params)
+        return [self._from_row(session, row) for row in rows]
+
+    def iter_sessions(self):
+        '''遍历所有 (会话ID, 提醒列表)'''
+        sessions = {}
+        rows = self.conn.execute("SELECT session, reminder_id, text, datetime, user_name, repeat, creator_id, creator_name, is_task, extra FROM reminders ORDER BY rid")
+        for row in rows:
+            sessions.setdefault(row[0], []).append(self._from_row(row[0], row[1:]))
+        return [(session, tuple(reminders)) for session, reminders in sessions.items()]
+
+    def snapshot(self):
+        '''所有数据的只读快照，每次调用都在一次查询中读取'''
+        return MappingProxyType(dict(self.iter_sessions()))
+
+    def lookup(self, reminder_id: str):
+        '''按ID查找提醒'''
+        row = self.conn.execute(
+            "SELECT session, reminder_id, text, datetime, user_name, repeat, creator_id, creator_name, is_task, extra "
+            "FROM reminders WHERE reminder_id = ?", (reminder_id,)
+        ).fetchone()
+        return self._from_row(row[0], row[1:]) if row else None
+
+    def count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM reminders").fetchone()[0]
+
+    def data_version(self) -> int:
+        '''其他进程提交修改后会变化的版本号，用于发现其他进程添加或删除的提醒'''
+        return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def sessions(self) -> list:
+        '''有提醒的会话ID，只读取会话索引'''
+        return [row[0] for row in self.conn.execute("SELECT DISTINCT session FROM reminders")]
+
+    def changed_sessions(self) -> set:
+        '''与上次调用相比增删过行的会话，第一次调用只记录当前的行
+
+        只读取 rid 和会话两列，不解析提醒内容；提醒只会整行插入和删除，比较 rid 即可发现所有修改。
+        '''
+        rows = dict(self.conn.execute("SELECT rid, session FROM reminders"))
+        previous, self._row_sessions = self._row_sessions, rows
+        if previous is None:
+            return set()
+        return {session for _, session in rows.items() ^ previous.items()}
+
+    async def hydrate(self, session: str):
+        '''每次查询都返回完整内容，无需处理'''
+
+    async def add(self, session: str, reminder: Reminder):
+        '''插入一行'''
+        reminder.bind(session)
+        with self.conn:
+            self.conn.execute(self._insert_sql(), self._to_row(session, reminder))
+
+    def _delete_one(self, session: str, reminder: Reminder) -> bool:
+        cursor = self.conn.execute(
+            "DELETE FROM reminders WHERE reminder_id = ? AND session = ?", (reminder.id, session)
+        )
+        return cursor.rowcount > 0
+
+    async def remove(self, session: str, reminder: Reminder) -> bool:
+        '''删除一行'''
+        with self.conn:
+            removed = self._delete_one(session, reminder)
+            self.purge_expired()
+        return removed
+
+    async def remove_many(self, session: str, reminders: list) -> int:
+        '''在同一个事务中删除多行'''
+        with self.conn:
+            removed = sum(1 for r in reminders if self._delete_one(session, r))
+            self.purge_expired()
+        return removed
+
+    def purge_expired(self):
+        '''借助触发时间索引清理触发时间加宽限期已过的一次性提醒'''
+        cutoff = datetime.datetime.now() - datetime.timedelta(seconds=self.expire_grace)
+        if self.retain_since is not None:
+            cutoff = min(cutoff, self.retain_since)
+        self.conn.execute(
+            "DELETE FROM reminders WHERE fire_at < ? AND IFNULL(repeat, 'none') = 'none'",
+            (cutoff.strftime(DATETIME_FORMAT),)
+        )
+
+    async def compact(self):
+        with self.conn:
+            self.purge_expired()
+
+    async def close(self):
+        if self.conn is not None:
+            self.conn.commit()
+            self.conn.close()
+            self.conn = None
+
+    def reopen(self):
+        '''关闭后重新连接数据库，不重新导入和清理'''
+        if self.conn is None:
+            self._connect()
+
+
+def create_reminder_store(reminders_dir: str, config: dict):
+    '''根据配置创建提醒数据存储'''
+    data_file = os.path.join(reminders_dir, "reminder_data.json")
+    backend = config.get("storage_backend", "json")
+    debounce = config.get("save_debounce_ms", 500) / 1000
+    if backend == "sqlite":
+        logger.info("使用 SQLite 存储提醒数据")
+        return SQLiteReminderStore(os.path.join(reminders_dir, "reminders.db"), legacy_file=data_file)
+    lazy = config.get("lazy_load", False)
+    if lazy and backend != "sharded":
+        logger.warning("延迟加载仅支持 sharded 存储方式，已忽略")
+    if backend == "sharded":
+        logger.info(f"使用按会话分片的文件存储提醒数据{'（延迟加载）' if lazy else ''}")
+        return ShardedReminderStore(os.path.join(reminders_dir, "shards"), legacy_file=data_file,
+                                    debounce=debounce, lazy=lazy)
+    return JournalReminderStore(
+        data_file,
+        journal_max_bytes=config.get("journal_max_kb", 1024) * 1024,
+        journal_max_age=config.get("journal_max_minutes", 60) * 60,
+        debounce=debounce
+    )
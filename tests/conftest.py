@@ -0,0 +1,12 @@
+import os
+import sys
+import types
+
+# 插件目录按安装到 AstrBot 后的包名导入，模块之间的相对导入才能生效
+PACKAGE = "astrbot_plugin_sy"
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if PACKAGE not in sys.modules:
+    package = types.ModuleType(PACKAGE)
+    package.__path__ = [ROOT]
+    sys.modules[PACKAGE] = package
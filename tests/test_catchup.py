@@ -0,0 +1,115 @@
+import asyncio
+import datetime
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("astrbot.api")
+pytest.importorskip("apscheduler")
+
+from astrbot_plugin_sy.catchup import LAST_ALIVE_FILE, MAX_MISSED_PER_REMINDER, compute_missed, save_last_alive
+from astrbot_plugin_sy.models import Reminder
+from astrbot_plugin_sy.scheduler import ReminderScheduler
+from astrbot_plugin_sy.storage import JournalReminderStore
+
+SESSION = "aiocqhttp:GroupMessage:1"
+
+
+@pytest.fixture(autouse=True)
+def fresh_registry(monkeypatch):
+    '''每个测试使用独立的全局注册表，调度器不跨事件循环复用'''
+    monkeypatch.setattr(sys, "_GLOBAL_SCHEDULER_REGISTRY", {
+        "scheduler": None, "dispatcher": None, "manager": None, "handoff": None, "drift": None, "ticker": None,
+    }, raising=False)
+
+
+def _minute(dt):
+    return dt.replace(second=0, microsecond=0)
+
+
+def _reminders(now):
+    return [
+        Reminder("一次", _minute(now - datetime.timedelta(hours=2))),
+        Reminder("每天", _minute(now - datetime.timedelta(hours=1)), repeat="daily"),
+        Reminder("间隔", _minute(now - datetime.timedelta(hours=2)), repeat="every_30m"),
+        Reminder("任务", _minute(now - datetime.timedelta(hours=1)), repeat="daily", is_task=True),
+    ]
+
+
+def test_compute_missed_counts_and_caps():
+    now = datetime.datetime.now()
+    once, daily, interval, task = _reminders(now)
+    missed = compute_missed([(SESSION, (once, daily, interval, task))], now - datetime.timedelta(days=3), now)
+    counts = {reminder.text: len(times) for _, reminder, times in missed}
+    assert counts["一次"] == 1
+    assert counts["每天"] == 3
+    assert counts["间隔"] == 5
+    long_ago = compute_missed([(SESSION, (daily,))], now - datetime.timedelta(days=30), now)
+    assert len(long_ago[0][2]) == MAX_MISSED_PER_REMINDER
+    assert compute_missed([(SESSION, (once,))], now - datetime.timedelta(hours=1), now) == []
+
+
+def _catch_up(tmp_path, monkeypatch, policies, since_days=3):
+    '''按上次存活时间启动调度器并等待补发结束，返回 (逐条补发的提醒, 汇总消息, 数据存储)'''
+    delivered = []
+    digests = []
+
+    async def deliver(self, session, reminder, simple=False):
+        # 补发期间过期的一次性提醒仍然保留在数据中
+        assert self.store.lookup(reminder.id) is not None
+        delivered.append(reminder.text)
+
+    async def send_digest(self, session, entries):
+        digests.append((session, sorted((reminder.text, len(times)) for reminder, times in entries)))
+
+    monkeypatch.setattr(ReminderScheduler, "_deliver", deliver)
+    monkeypatch.setattr(ReminderScheduler, "_send_digest", send_digest)
+
+    async def run():
+        now = datetime.datetime.now()
+        store = JournalReminderStore(str(tmp_path / "reminder_data.json"))
+        store.load()
+        for reminder in _reminders(now):
+            await store.add(SESSION, reminder)
+        save_last_alive(os.path.join(str(tmp_path), LAST_ALIVE_FILE), now - datetime.timedelta(days=since_days))
+        manager = ReminderScheduler(None, store, state_dir=str(tmp_path), catchup_policies=policies)
+        for _ in range(200):
+            if not manager._catch_up_windows:
+                break
+            await asyncio.sleep(0.01)
+        assert not manager._catch_up_windows
+        assert store.retain_since is None
+        await manager.shutdown()
+        manager.scheduler.shutdown(wait=False)
+        manager.ticker.stop()
+        await store.close()
+        return store
+
+    store = asyncio.run(run())
+    return sorted(delivered), digests, store
+
+
+def test_catch_up_once(tmp_path, monkeypatch):
+    delivered, digests, store = _catch_up(tmp_path, monkeypatch, {"reminder": "once", "task": "once"})
+    assert delivered == sorted(["一次", "每天", "间隔", "任务"])
+    assert digests == []
+    # 补发结束后清理已过期的一次性提醒
+    assert [r.text for r in store.get(SESSION)] == ["每天", "间隔", "任务"]
+
+
+def test_catch_up_all_replays_every_miss_but_intervals_once(tmp_path, monkeypatch):
+    delivered, digests, _ = _catch_up(tmp_path, monkeypatch, {"reminder": "all", "task": "off"})
+    assert delivered == sorted(["一次", "每天", "每天", "每天", "间隔"])
+    assert digests == []
+
+
+def test_catch_up_digest_sends_one_message_per_session(tmp_path, monkeypatch):
+    delivered, digests, _ = _catch_up(tmp_path, monkeypatch, {"reminder": "digest", "task": "once"})
+    assert delivered == ["任务"]
+    assert digests == [(SESSION, [("一次", 1), ("每天", 3), ("间隔", 5)])]
+
+
+def test_catch_up_off(tmp_path, monkeypatch):
+    delivered, digests, _ = _catch_up(tmp_path, monkeypatch, {"reminder": "off", "task": "off"})
+    assert delivered == [] and digests == []
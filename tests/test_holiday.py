@@ -0,0 +1,48 @@
+import datetime
+
+import pytest
+
+pytest.importorskip("astrbot.api")
+pytest.importorskip("aiohttp")
+
+from astrbot_plugin_sy.models import HolidayType, Reminder
+from astrbot_plugin_sy.triggers import next_occurrence
+from astrbot_plugin_sy.utils import HolidayManager
+
+D = datetime.datetime
+
+
+def _manager(holiday_data: dict) -> HolidayManager:
+    '''不读写缓存文件的 HolidayManager'''
+    manager = HolidayManager.__new__(HolidayManager)
+    manager.holiday_data = holiday_data
+    return manager
+
+
+# 2026-10-01（周四）法定节假日，2026-10-10（周六）调休上班
+CACHED = {"2026": {"data": {"10-01": True, "10-10": False}}}
+
+
+def test_check_cached_uses_cached_year():
+    manager = _manager(CACHED)
+    assert manager.check_cached(D(2026, 10, 10, 9), HolidayType.WORKDAY)
+    assert not manager.check_cached(D(2026, 10, 1, 9), HolidayType.WORKDAY)
+    assert manager.check_cached(D(2026, 10, 1, 9), HolidayType.HOLIDAY)
+    assert not manager.check_cached(D(2026, 10, 17, 9), HolidayType.WORKDAY)
+    assert manager.check_cached(D(2026, 10, 17, 9), HolidayType.HOLIDAY)
+
+
+def test_check_cached_does_not_skip_uncached_years():
+    # 没有缓存（或缓存已过期）时不知道调休和法定节假日，交给触发时的查询判断
+    for manager in (_manager(CACHED), _manager({})):
+        assert manager.check_cached(D(2027, 1, 2, 9), HolidayType.WORKDAY)
+        assert manager.check_cached(D(2027, 1, 4, 9), HolidayType.HOLIDAY)
+
+
+def test_next_occurrence_keeps_make_up_workdays():
+    manager = _manager(CACHED)
+    workday = Reminder("上班", D(2026, 10, 9, 9, 0), repeat="daily_workday")
+    assert next_occurrence(workday, D(2026, 10, 9, 10, 0), manager) == D(2026, 10, 10, 9, 0)
+    assert next_occurrence(workday, D(2026, 9, 30, 10, 0), manager) == D(2026, 10, 2, 9, 0)
+    holiday = Reminder("放假", D(2026, 9, 29, 9, 0), repeat="daily_holiday")
+    assert next_occurrence(holiday, D(2026, 9, 29, 10, 0), manager) == D(2026, 10, 1, 9, 0)
@@ -0,0 +1,125 @@
+import asyncio
+import datetime
+import json
+import os
+
+import pytest
+
+pytest.importorskip("astrbot.api")
+
+from astrbot_plugin_sy.models import Reminder
+from astrbot_plugin_sy.storage import JournalReminderStore
+
+
+def _future(hours=1):
+    return datetime.datetime.now().replace(second=0, microsecond=0) + datetime.timedelta(hours=hours)
+
+
+def _open(tmp_path, **kwargs):
+    store = JournalReminderStore(str(tmp_path / "reminder_data.json"), **kwargs)
+    store.load()
+    return store
+
+
+def _crash(store):
+    '''模拟进程崩溃：只关闭日志文件，不写最终快照'''
+    store._journal.close()
+    store._journal = None
+
+
+def test_replay_journal_on_top_of_snapshot(tmp_path):
+    async def run():
+        store = _open(tmp_path)
+        a = Reminder("A", _future(), repeat="daily")
+        b = Reminder("B", _future(2))
+        c = Reminder("C", _future(3), repeat="weekly")
+        for reminder in (a, b, c):
+            await store.add("s:1", reminder)
+        await store.remove("s:1", b)
+        await store.flush()
+        _crash(store)
+
+        # 快照仍为空，数据全部来自日志
+        with open(store.data_file, encoding="utf-8") as f:
+            assert [key for key in json.load(f) if not key.startswith("_")] == []
+        reloaded = _open(tmp_path)
+        assert [r.text for r in reloaded.get("s:1")] == ["A", "C"]
+        assert reloaded.lookup(a.id) == a
+        assert reloaded.lookup(b.id) is None
+        await reloaded.close()
+
+    asyncio.run(run())
+
+
+def test_truncated_journal_tail_is_dropped(tmp_path):
+    async def run():
+        store = _open(tmp_path)
+        await store.add("s:1", Reminder("A", _future(), repeat="daily"))
+        await store.flush()
+        _crash(store)
+        with open(store.journal_file, "ab") as f:
+            f.write(b'{"op": "add", "session": "s:1", "rem')
+        size = os.path.getsize(store.journal_file)
+
+        reloaded = _open(tmp_path)
+        assert [r.text for r in reloaded.get("s:1")] == ["A"]
+        assert os.path.getsize(reloaded.journal_file) < size
+        await reloaded.add("s:1", Reminder("B", _future(2), repeat="daily"))
+        await reloaded.flush()
+        _crash(reloaded)
+        assert [r.text for r in _open(tmp_path).get("s:1")] == ["A", "B"]
+
+    asyncio.run(run())
+
+
+def test_compaction_writes_snapshot_and_empties_journal(tmp_path):
+    async def run():
+        store = _open(tmp_path, journal_max_bytes=512)
+        for i in range(10):
+            await store.add(f"s:{i % 3}", Reminder(f"R{i}", _future(i + 1), repeat="daily"))
+            await store.flush()
+        assert os.path.getsize(store.journal_file) < 512
+        with open(store.data_file, encoding="utf-8") as f:
+            snapshot = json.load(f)
+        assert sum(len(v) for k, v in snapshot.items() if not k.startswith("_")) > 0
+        expected = {session: [r.text for r in reminders] for session, reminders in store.iter_sessions()}
+        _crash(store)
+
+        reloaded = _open(tmp_path)
+        assert {session: [r.text for r in reminders] for session, reminders in reloaded.iter_sessions()} == expected
+        assert reloaded.count() == 10
+        await reloaded.close()
+
+    asyncio.run(run())
+
+
+def test_close_compacts_into_final_snapshot(tmp_path):
+    async def run():
+        store = _open(tmp_path)
+        await store.add("s:1", Reminder("A", _future(), repeat="daily"))
+        await store.close()
+        assert os.path.getsize(store.journal_file) == 0
+        reloaded = _open(tmp_path)
+        assert [r.text for r in reloaded.get("s:1")] == ["A"]
+        await reloaded.close()
+
+    asyncio.run(run())
+
+
+def test_expired_one_shots_are_purged_on_every_write(tmp_path):
+    async def run():
+        store = _open(tmp_path)
+        await store.add("s:1", Reminder("old", datetime.datetime.now() - datetime.timedelta(minutes=5)))
+        await store.flush()
+        await store.add("s:1", Reminder("new", _future()))
+        await store.flush()
+        assert [r.text for r in store.get("s:1")] == ["new"]
+        _crash(store)
+        # 清理不写日志，重新加载时按同样的规则再次清理
+        reloaded = _open(tmp_path)
+        await reloaded.add("s:2", Reminder("other", _future()))
+        await reloaded.flush()
+        assert [r.text for r in reloaded.get("s:1")] == ["new"]
+        await reloaded.close()
+
+    asyncio.run(run())
@@ -0,0 +1,100 @@
+import asyncio
+import datetime
+import os
+
+import pytest
+
+pytest.importorskip("astrbot.api")
+
+from astrbot_plugin_sy.models import Reminder
+from astrbot_plugin_sy.storage import ShardedReminderStore
+
+
+def _future(minutes=0):
+    base = datetime.datetime.now().replace(second=0, microsecond=0) + datetime.timedelta(days=1)
+    return base + datetime.timedelta(minutes=minutes)
+
+
+def _open(path, lazy=True):
+    store = ShardedReminderStore(str(path), lazy=lazy)
+    store.load()
+    return store
+
+
+def _drop_last_index_record(path):
+    '''模拟索引日志最后一条记录没有写入（写分片后、写索引前崩溃）'''
+    journal = os.path.join(str(path), "index.journal")
+    with open(journal, "rb") as f:
+        lines = f.read().splitlines(True)
+    with open(journal, "wb") as f:
+        f.write(b"".join(lines[:-1]))
+
+
+def test_lazy_load_reads_only_index_until_session_is_used(tmp_path):
+    async def run():
+        store = _open(tmp_path)
+        a = Reminder("A", _future(), repeat="daily")
+        await store.add("s:1", a)
+        await store.add("s:2", Reminder("B", _future(1), repeat="weekly"))
+        await store.close()
+
+        lazy = _open(tmp_path)
+        assert lazy.count() == 2
+        # 索引中的触发信息足够计算触发时间，不读取分片
+        stub = lazy.peek("s:1")[0]
+        assert stub.id == a.id and stub.dt == a.dt
+        assert [r.text for r in lazy.get("s:1")] == ["A"]
+        await lazy.close()
+
+    asyncio.run(run())
+
+
+def test_shard_records_missing_from_index_are_recovered(tmp_path):
+    async def run():
+        store = _open(tmp_path)
+        a = Reminder("A", _future(), repeat="daily")
+        b = Reminder("B", _future(1), repeat="daily")
+        await store.add("s:1", a)
+        await store.flush()
+        await store.add("s:1", b)
+        await store.flush()
+        await store.close()
+        _drop_last_index_record(tmp_path)
+
+        lazy = _open(tmp_path)
+        recovered = []
+        lazy.on_recovered = lambda session, reminders: recovered.append((session, [r.id for r in reminders]))
+        assert lazy.count() == 1
+        # 分片中的内容优先于过时的索引
+        assert [r.text for r in lazy.get("s:1")] == ["A", "B"]
+        assert lazy.lookup(b.id) is not None
+        assert recovered == [("s:1", [b.id])]
+        await lazy.close()
+
+        # 恢复出的提醒写回索引，之后的启动直接从索引得到
+        again = _open(tmp_path)
+        assert again.count() == 2
+        assert sorted(r.text for r in again.get("s:1")) == ["A", "B"]
+        await again.close()
+        assert _open(tmp_path, lazy=False).count() == 2
+
+    asyncio.run(run())
+
+
+def test_session_missing_from_index_is_read_from_shard(tmp_path):
+    async def run():
+        store = _open(tmp_path)
+        await store.add("s:1", Reminder("A", _future(), repeat="daily"))
+        await store.flush()
+        await store.add("s:2", Reminder("B", _future(1), repeat="daily"))
+        await store.flush()
+        await store.close()
+        _drop_last_index_record(tmp_path)
+
+        lazy = _open(tmp_path)
+        assert lazy.count() == 2
+        assert lazy.peek("s:2")[0].text == "B"
+        await lazy.close()
+        assert _open(tmp_path).count() == 2
+
+    asyncio.run(run())
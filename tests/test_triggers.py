@@ -0,0 +1,133 @@
+import datetime
+
+import pytest
+
+pytest.importorskip("astrbot.api")
+pytest.importorskip("apscheduler")
+
+from astrbot_plugin_sy.models import HolidayType, Interval, Reminder, is_valid_repeat
+from astrbot_plugin_sy.triggers import next_occurrence
+
+D = datetime.datetime
+
+
+class WeekdayCalendar:
+    '''只按周末判断的节假日数据，代替 HolidayManager'''
+
+    def check_cached(self, date, holiday_type):
+        is_holiday = date.weekday() >= 5
+        return is_holiday if holiday_type is HolidayType.HOLIDAY else not is_holiday
+
+
+class NeverCalendar:
+    def check_cached(self, date, holiday_type):
+        return False
+
+
+def test_interval_parse_full_form():
+    interval, holiday = Interval.parse("every_15m_09:00-18:00_workday")
+    assert interval.seconds == 900
+    assert interval.duration is None
+    assert interval.window == (datetime.time(9, 0), datetime.time(18, 0))
+    assert holiday is HolidayType.WORKDAY
+    assert interval.name == "every_15m_09:00-18:00"
+
+
+def test_interval_parse_duration():
+    interval, holiday = Interval.parse("every_30s_for_5m")
+    assert (interval.seconds, interval.duration, interval.window) == (30, 300, None)
+    assert holiday is HolidayType.ANY
+    assert interval.name == "every_30s_for_5m"
+    assert Interval.parse("every_90m")[0].name == "every_90m"
+
+
+@pytest.mark.parametrize("text", [
+    "every_5s",  # 短于最短间隔
+    "every_0m",
+    "every_1m_for_0s",
+    "every_10m_18:00-09:00",  # 跨过零点
+    "every_10m_09:00-09:00",
+    "every_10m_25:00-26:00",
+    "every_10x",
+    "every_10m_weekend",
+    "daily",
+    "",
+    None,
+])
+def test_interval_parse_rejects_invalid(text):
+    assert Interval.parse(text) is None
+
+
+def test_is_valid_repeat():
+    for repeat in ("none", "daily", "weekly_workday", "monthly_holiday", "every_10m", "every_1h_for_3h_holiday"):
+        assert is_valid_repeat(repeat), repeat
+    for repeat in ("hourly", "every_1s", "daily_weekend"):
+        assert not is_valid_repeat(repeat), repeat
+
+
+def test_interval_reminder_round_trips_repeat_name():
+    reminder = Reminder("喝水", D(2026, 10, 16, 9, 0), repeat="every_15m_09:00-18:00_workday")
+    assert reminder.interval is not None
+    assert reminder.repeat_name == "every_15m_09:00-18:00_workday"
+    assert Reminder.from_dict(reminder.to_dict()) == reminder
+    other = Reminder.from_dict(dict(reminder.to_dict(), repeat="every_30m_09:00-18:00_workday"))
+    assert not reminder.same_content(other)
+
+
+def test_next_occurrence_once():
+    reminder = Reminder("一次", D(2026, 10, 16, 9, 0))
+    assert next_occurrence(reminder, D(2026, 10, 16, 8, 0)) == D(2026, 10, 16, 9, 0)
+    assert next_occurrence(reminder, D(2026, 10, 16, 9, 0)) is None
+
+
+def test_next_occurrence_daily_and_weekly():
+    daily = Reminder("每天", D(2026, 10, 16, 9, 0), repeat="daily")
+    assert next_occurrence(daily, D(2026, 10, 16, 8, 59)) == D(2026, 10, 16, 9, 0)
+    assert next_occurrence(daily, D(2026, 10, 16, 9, 0)) == D(2026, 10, 17, 9, 0)
+    weekly = Reminder("每周五", D(2026, 10, 16, 9, 0), repeat="weekly")
+    assert next_occurrence(weekly, D(2026, 10, 16, 9, 0)) == D(2026, 10, 23, 9, 0)
+    assert next_occurrence(weekly, D(2026, 10, 19, 0, 0)) == D(2026, 10, 23, 9, 0)
+
+
+def test_next_occurrence_monthly_and_yearly_skip_missing_days():
+    monthly = Reminder("月底", D(2026, 1, 31, 9, 0), repeat="monthly")
+    assert next_occurrence(monthly, D(2026, 1, 31, 10, 0)) == D(2026, 3, 31, 9, 0)
+    leap = Reminder("闰日", D(2024, 2, 29, 9, 0), repeat="yearly")
+    assert next_occurrence(leap, D(2024, 3, 1)) == D(2028, 2, 29, 9, 0)
+
+
+def test_next_occurrence_interval_without_window():
+    reminder = Reminder("间隔", D(2026, 10, 16, 9, 0), repeat="every_30s")
+    assert next_occurrence(reminder, D(2026, 10, 16, 8, 0)) == D(2026, 10, 16, 9, 0)
+    assert next_occurrence(reminder, D(2026, 10, 16, 9, 0)) == D(2026, 10, 16, 9, 0, 30)
+    assert next_occurrence(reminder, D(2026, 10, 16, 9, 0, 45)) == D(2026, 10, 16, 9, 1)
+
+
+def test_next_occurrence_interval_window_excludes_end():
+    reminder = Reminder("窗口", D(2026, 10, 16, 12, 0), repeat="every_15m_09:00-18:00")
+    # 设定时间只决定从哪一天开始，当天仍从设定时间之后算起
+    assert next_occurrence(reminder, D(2026, 10, 16, 8, 0)) == D(2026, 10, 16, 12, 0)
+    assert next_occurrence(reminder, D(2026, 10, 16, 12, 5)) == D(2026, 10, 16, 12, 15)
+    assert next_occurrence(reminder, D(2026, 10, 16, 17, 45)) == D(2026, 10, 17, 9, 0)
+    assert next_occurrence(reminder, D(2026, 10, 17, 7, 0)) == D(2026, 10, 17, 9, 0)
+
+
+def test_next_occurrence_finite_interval_ends():
+    reminder = Reminder("闹钟", D(2026, 10, 16, 9, 0), repeat="every_30s_for_5m")
+    assert next_occurrence(reminder, D(2026, 10, 16, 9, 4)) == D(2026, 10, 16, 9, 4, 30)
+    assert next_occurrence(reminder, D(2026, 10, 16, 9, 4, 30)) is None
+    assert next_occurrence(reminder, D(2026, 10, 17)) is None
+
+
+def test_next_occurrence_skips_dates_by_holiday_type():
+    workday = Reminder("上班", D(2026, 10, 16, 9, 0), repeat="daily_workday")
+    assert next_occurrence(workday, D(2026, 10, 16, 10, 0), WeekdayCalendar()) == D(2026, 10, 19, 9, 0)
+    # 不传节假日数据时不筛选
+    assert next_occurrence(workday, D(2026, 10, 16, 10, 0)) == D(2026, 10, 17, 9, 0)
+    holiday = Reminder("周末", D(2026, 10, 16, 9, 0), repeat="every_1h_09:00-12:00_holiday")
+    assert next_occurrence(holiday, D(2026, 10, 16, 9, 30), WeekdayCalendar()) == D(2026, 10, 17, 9, 0)
+
+
+def test_next_occurrence_gives_up_beyond_lookahead():
+    reminder = Reminder("不存在的日期", D(2026, 10, 16, 9, 0), repeat="daily_holiday")
+    assert next_occurrence(reminder, D(2026, 10, 16, 10, 0), NeverCalendar()) is None
@@ -0,0 +1,123 @@
+import asyncio
+import contextvars
+import datetime
+import sys
+import threading
+import time
+from apscheduler.executors.asyncio import AsyncIOExecutor
+from apscheduler.executors.base import BaseExecutor, run_coroutine_job
+from astrbot.api import logger
+
+# 触发延迟超过该秒数时记录警告
+DRIFT_WARN_SECONDS = 5
+
+# 同一类延迟警告的最小间隔（秒），避免主循环持续繁忙时刷屏
+DRIFT_WARN_INTERVAL = 60
+
+# 调度延迟：定时器线程（或主循环）实际取出任务的时间减去设定的触发时间
+STAGE_TIMER = "timer"
+# 移交延迟：主循环开始执行任务的时间减去定时器线程移交它的时间，只在独立线程模式下统计
+STAGE_HANDOFF = "handoff"
+
+# 正在执行的定时任务设定的触发时间（APScheduler 的 scheduled_run_time），执行队列按它计算截止时间
+SCHEDULED_FIRE_TIME = contextvars.ContextVar("scheduled_fire_time", default=None)
+
+
+def start_timer_loop() -> asyncio.AbstractEventLoop:
+    '''在独立的守护线程中运行一个事件循环，只用于调度器的计时和取出到期任务'''
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, name="reminder-scheduler", daemon=True)
+    thread.start()
+    return loop
+
+
+class DriftMonitor:
+    """统计定时任务实际触发时间与设定时间的偏差
+
+    记录可能来自定时器线程和主循环，统计数据由锁保护。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {stage: [0, 0.0, 0.0] for stage in (STAGE_TIMER, STAGE_HANDOFF)}  # [次数, 总和, 最大]
+        self._warned_at = {}
+
+    def record(self, stage: str, seconds: float, label: str = ""):
+        seconds = max(0.0, seconds)
+        with self._lock:
+            stats = self._stats[stage]
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+            warn = seconds > DRIFT_WARN_SECONDS and time.monotonic() - self._warned_at.get(stage, -DRIFT_WARN_INTERVAL) >= DRIFT_WARN_INTERVAL
+            if warn:
+                self._warned_at[stage] = time.monotonic()
+        if warn:
+            what = "调度" if stage == STAGE_TIMER else "移交主循环"
+            logger.warning(f"定时任务 {label} {what}延迟 {seconds:.2f} 秒，超过 {DRIFT_WARN_SECONDS} 秒")
+
+    def job_submitted(self, event):
+        '''APScheduler 的 EVENT_JOB_SUBMITTED 监听器，在调度器取出到期任务时调用'''
+        if event.scheduled_run_times:
+            scheduled = event.scheduled_run_times[-1]
+            self.record(STAGE_TIMER, (datetime.datetime.now(scheduled.tzinfo) - scheduled).total_seconds(), event.job_id)
+
+    def stats(self) -> dict:
+        '''{阶段: {"count", "avg", "max"}}'''
+        with self._lock:
+            return {
+                stage: {"count": count, "avg": total / count if count else 0.0, "max": peak}
+                for stage, (count, total, peak) in self._stats.items()
+            }
+
+
+class FireTimeExecutor(AsyncIOExecutor):
+    """调度器在主循环中计时时使用的执行器，执行任务时记录设定的触发时间"""
+
+    def _do_submit_job(self, job, run_times):
+        # 新建的 Task 复制当前上下文，任务中可以通过 SCHEDULED_FIRE_TIME 读取触发时间
+        token = SCHEDULED_FIRE_TIME.set(run_times[-1])
+        try:
+            super()._do_submit_job(job, run_times)
+        finally:
+            SCHEDULED_FIRE_TIME.reset(token)
+
+
+class MainLoopExecutor(BaseExecutor):
+    """调度器运行在独立线程时使用的执行器
+
+    定时器线程取出到期任务后，通过主事件循环的线程安全队列（run_coroutine_threadsafe）
+    把任务交给主循环执行，任务本身（LLM 调用、发送消息）仍然和插件其他代码运行在同一个循环中。
+    """
+
+    def __init__(self, main_loop: asyncio.AbstractEventLoop, drift: DriftMonitor = None):
+        super().__init__()
+        self.main_loop = main_loop
+        self.drift = drift
+
+    def _do_submit_job(self, job, run_times):
+        handed_at = time.monotonic()
+
+        async def run():
+            if self.drift is not None:
+                self.drift.record(STAGE_HANDOFF, time.monotonic() - handed_at, job.id)
+            SCHEDULED_FIRE_TIME.set(run_times[-1])
+            return await run_coroutine_job(job, job._jobstore_alias, run_times, self._logger.name)
+
+        def callback(f):
+            try:
+                events = f.result()
+            except BaseException:
+                self._run_job_error(job.id, *sys.exc_info()[1:])
+            else:
+                self._run_job_success(job.id, events)
+
+        coro = run()
+        try:
+            future = asyncio.run_coroutine_threadsafe(coro, self.main_loop)
+        except RuntimeError as e:
+            # 主事件循环已关闭
+            coro.close()
+            self._run_job_error(job.id, e, e.__traceback__)
+            return
+        future.add_done_callback(callback)
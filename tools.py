@@ -3,14 +3,15 @@ from typing import Union
 from astrbot.api.event import AstrMessageEvent
 from astrbot.api.star import Context
 from astrbot.api import logger
-from .utils import parse_datetime, save_reminder_data
+from .utils import parse_datetime
+from .models import DATETIME_FORMAT, MIN_INTERVAL_SECONDS, Reminder, is_valid_repeat
+from .agenda import format_agenda
 
 class ReminderTools:
     def __init__(self, star_instance):
         self.star = star_instance
         self.context = star_instance.context
-        self.reminder_data = star_instance.reminder_data
-        self.data_file = star_instance.data_file
+        self.store = star_instance.store
         self.scheduler_manager = star_instance.scheduler_manager
         self.unique_session = star_instance.unique_session
     
@@ -40,6 +41,14 @@ class ReminderTools:
                     return f"{parts[0]}:{parts[1]}_{creator_id}"
         
         return msg_origin
+
+    @staticmethod
+    def _invalid_repeat(final_repeat: str) -> str:
+        '''重复类型与节假日类型组合后不是有效规则时返回给 LLM 的错误信息'''
+        if final_repeat.startswith("every"):
+            return (f"间隔重复格式错误：{final_repeat}，应为 every_<间隔>[_for_<持续时间>][_<HH:MM>-<HH:MM>]，"
+                    f"单位为 s/m/h，最短间隔 {MIN_INTERVAL_SECONDS} 秒，节假日类型只能指定一次")
+        return f"重复类型错误：{final_repeat}，可选值为 daily/weekly/monthly/yearly 或间隔重复，节假日类型为 workday/holiday"
     
     async def set_reminder(self, event: Union[AstrMessageEvent, Context], text: str, datetime_str: str, user_name: str = "用户", repeat: str = None, holiday_type: str = None):
         '''设置一个提醒
@@ -48,7 +57,7 @@ class ReminderTools:
             text(string): 提醒内容
             datetime_str(string): 提醒时间，格式为 %Y-%m-%d %H:%M
             user_name(string): 提醒对象名称，默认为"用户"
-            repeat(string): 重复类型，可选值：daily(每天)，weekly(每周)，monthly(每月)，yearly(每年)，none(不重复)
+            repeat(string): 重复类型，可选值：daily(每天)，weekly(每周)，monthly(每月)，yearly(每年)，none(不重复)，或按间隔重复 every_<间隔>[_for_<持续时间>][_<HH:MM>-<HH:MM>]（单位 s/m/h，如 every_15m_09:00-18:00 表示每天9点到18点每15分钟，every_30s_for_5m 表示从设定时间起每30秒一次持续5分钟）
             holiday_type(string): 可选，节假日类型：workday(仅工作日执行)，holiday(仅法定节假日执行)
         '''
         try:
@@ -65,34 +74,31 @@ class ReminderTools:
                 # 使用会话隔离功能获取会话ID
                 msg_origin = self.get_session_id(raw_msg_origin, creator_id)
             
-            if msg_origin not in self.reminder_data:
-                self.reminder_data[msg_origin] = []
-            
             # 处理重复类型和节假日类型的组合
             final_repeat = repeat or "none"
             if repeat and holiday_type:
                 final_repeat = f"{repeat}_{holiday_type}"
+            if not is_valid_repeat(final_repeat):
+                return self._invalid_repeat(final_repeat)
             
-            reminder = {
-                "text": text,
-                "datetime": datetime_str,
-                "user_name": user_name,
-                "repeat": final_repeat,
-                "creator_id": creator_id,
-                "creator_name": creator_name,  # 添加创建者昵称
-                "is_task": False  # 标记为提醒，不是任务
-            }
+            # 解析时间
+            dt = datetime.datetime.strptime(datetime_str, DATETIME_FORMAT)
             
-            self.reminder_data[msg_origin].append(reminder)
+            reminder = Reminder(
+                text,
+                dt,
+                user_name=user_name,
+                repeat=final_repeat,
+                creator_id=creator_id,
+                creator_name=creator_name,  # 添加创建者昵称
+                is_task=False  # 标记为提醒，不是任务
+            )
             
-            # 解析时间
-            dt = datetime.datetime.strptime(datetime_str, "%Y-%m-%d %H:%M")
+            await self.store.add(msg_origin, reminder)
             
             # 设置定时任务
             self.scheduler_manager.add_job(msg_origin, reminder, dt)
             
-            await save_reminder_data(self.data_file, self.reminder_data)
-            
             # 构建提示信息
             repeat_str = ""
             if repeat == "daily" and not holiday_type:
@@ -119,6 +125,8 @@ class ReminderTools:
                 repeat_str = "，每年的这一天重复，但仅工作日触发"
             elif repeat == "yearly" and holiday_type == "holiday":
                 repeat_str = "，每年的这一天重复，但仅法定节假日触发"
+            elif reminder.interval is not None:
+                repeat_str = "，" + reminder.interval.describe(reminder.holiday)
             
             return f"已设置提醒:\n内容: {text}\n时间: {datetime_str}{repeat_str}\n\n使用 /rmd ls 查看所有提醒"
             
@@ -131,7 +139,7 @@ class ReminderTools:
         Args:
             text(string): 任务内容，AI将执行的操作
             datetime_str(string): 任务执行时间，格式为 %Y-%m-%d %H:%M
-            repeat(string): 重复类型，可选值：daily(每天)，weekly(每周)，monthly(每月)，yearly(每年)，none(不重复)
+            repeat(string): 重复类型，可选值：daily(每天)，weekly(每周)，monthly(每月)，yearly(每年)，none(不重复)，或按间隔重复 every_<间隔>[_for_<持续时间>][_<HH:MM>-<HH:MM>]（单位 s/m/h，如 every_15m_09:00-18:00 表示每天9点到18点每15分钟，every_30s_for_5m 表示从设定时间起每30秒一次持续5分钟）
             holiday_type(string): 可选，节假日类型：workday(仅工作日执行)，holiday(仅法定节假日执行)
         '''
         try:
@@ -148,34 +156,31 @@ class ReminderTools:
                 # 使用会话隔离功能获取会话ID
                 msg_origin = self.get_session_id(raw_msg_origin, creator_id)
             
-            if msg_origin not in self.reminder_data:
-                self.reminder_data[msg_origin] = []
-            
             # 处理重复类型和节假日类型的组合
             final_repeat = repeat or "none"
             if repeat and holiday_type:
                 final_repeat = f"{repeat}_{holiday_type}"
+            if not is_valid_repeat(final_repeat):
+                return self._invalid_repeat(final_repeat)
             
-            task = {
-                "text": text,
-                "datetime": datetime_str,
-                "user_name": "用户",  # 任务模式下不需要特别指定用户名
-                "repeat": final_repeat,
-                "creator_id": creator_id,
-                "creator_name": creator_name,  # 添加创建者昵称
-                "is_task": True  # 标记为任务，不是提醒
-            }
+            # 解析时间
+            dt = datetime.datetime.strptime(datetime_str, DATETIME_FORMAT)
             
-            self.reminder_data[msg_origin].append(task)
+            task = Reminder(
+                text,
+                dt,
+                user_name="用户",  # 任务模式下不需要特别指定用户名
+                repeat=final_repeat,
+                creator_id=creator_id,
+                creator_name=creator_name,  # 添加创建者昵称
+                is_task=True  # 标记为任务，不是提醒
+            )
             
-            # 解析时间
-            dt = datetime.datetime.strptime(datetime_str, "%Y-%m-%d %H:%M")
+            await self.store.add(msg_origin, task)
             
             # 设置定时任务
             self.scheduler_manager.add_job(msg_origin, task, dt)
             
-            await save_reminder_data(self.data_file, self.reminder_data)
-            
             # 构建提示信息
             repeat_str = ""
             if repeat == "daily" and not holiday_type:
@@ -202,12 +207,36 @@ class ReminderTools:
                 repeat_str = "，每年的这一天重复，但仅工作日触发"
             elif repeat == "yearly" and holiday_type == "holiday":
                 repeat_str = "，每年的这一天重复，但仅法定节假日触发"
+            elif task.interval is not None:
+                repeat_str = "，" + task.interval.describe(task.holiday)
             
             return f"已设置任务:\n内容: {text}\n时间: {datetime_str}{repeat_str}\n\n使用 /rmd ls 查看所有任务"
             
         except Exception as e:
             return f"设置任务时出错：{str(e)}"
     
+    async def list_upcoming(self, event: Union[AstrMessageEvent, Context], hours: int = 24):
+        '''查看当前会话接下来一段时间内将要触发的提醒和任务
+        
+        Args:
+            hours(number): 查看未来多少小时内的提醒和任务，默认24
+        '''
+        try:
+            if isinstance(event, Context):
+                msg_origin = self.context.get_event_queue()._queue[0].session_id
+            else:
+                msg_origin = self.get_session_id(event.unified_msg_origin, event.get_sender_id())
+            
+            hours = int(hours or 24)
+            items = self.scheduler_manager.agenda.upcoming(msg_origin, datetime.timedelta(hours=hours))
+            if not items:
+                return f"未来 {hours} 小时内没有将要触发的提醒或任务"
+            await self.scheduler_manager.agenda.hydrate(items)
+            return f"未来 {hours} 小时内将要触发的提醒和任务（按时间排序）：\n" + format_agenda(items)
+            
+        except Exception as e:
+            return f"查询将要触发的提醒时出错：{str(e)}"
+    
     async def delete_reminder(self, event: Union[AstrMessageEvent, Context], 
                             content: str = None,           # 任务内容关键词
                             time: str = None,              # 具体时间点 HH:MM
@@ -246,11 +275,11 @@ class ReminderTools:
             for job in self.scheduler_manager.scheduler.get_jobs():
                 logger.info(f"Job ID: {job.id}, Next run: {job.next_run_time}, Args: {job.args}")
             
-            reminders = self.reminder_data.get(msg_origin, [])
+            reminders = self.store.get(msg_origin)
             if not reminders:
                 return "当前没有任何提醒或任务。"
             
-            # 用于存储要删除的任务索引
+            # 用于存储要删除的提醒或任务
             to_delete = []
             
             # 验证星期格式
@@ -266,21 +295,25 @@ class ReminderTools:
             if repeat_type and repeat_type.lower() not in repeat_types:
                 return "重复类型错误，可选值：daily,weekly,monthly,yearly"
             
-            for i, reminder in enumerate(reminders):
-                dt = datetime.datetime.strptime(reminder["datetime"], "%Y-%m-%d %H:%M")
-                
-                # 检查是否只删除任务或只删除提醒
-                is_task_only = task_only and task_only.lower() == "yes"
-                is_reminder_only = reminder_only and reminder_only.lower() == "yes"
-                
-                if is_task_only and not reminder.get("is_task", False):
-                    continue
-                if is_reminder_only and reminder.get("is_task", False):
-                    continue
-                
+            # 检查是否只删除任务或只删除提醒
+            is_task_only = task_only and task_only.lower() == "yes"
+            is_reminder_only = reminder_only and reminder_only.lower() == "yes"
+            
+            # 类型和重复类型交给存储层筛选（SQLite 下走索引）
+            candidates = self.store.find(
+                msg_origin,
+                is_task=True if is_task_only else (False if is_reminder_only else None),
+                repeat=repeat_type.lower() if repeat_type else None
+            )
+            
+            for reminder in candidates:
                 # 如果指定删除所有，直接添加
                 if all and all.lower() == "yes":
-                    to_delete.append(i)
+                    to_delete.append(reminder)
+                    continue
+                
+                dt = reminder.dt
+                if dt is None:
                     continue
                 
                 # 检查各个条件，所有指定的条件都必须满足
@@ -307,10 +340,6 @@ class ReminderTools:
                         if dt.weekday() != week_map[weekday.lower()]:
                             match = False
                 
-                # 检查重复类型
-                if repeat_type and reminder.get("repeat") != repeat_type.lower():
-                    match = False
-                
                 # 检查具体日期
                 if date:
                     reminder_date = dt.strftime("%Y-%m-%d")
@@ -319,7 +348,7 @@ class ReminderTools:
                 
                 # 如果所有条件都满足，添加到删除列表
                 if match:
-                    to_delete.append(i)
+                    to_delete.append(reminder)
             
             if not to_delete:
                 conditions = []
@@ -339,40 +368,18 @@ class ReminderTools:
                     conditions.append("仅提醒")
                 return f"没有找到符合条件的提醒或任务：{', '.join(conditions)}"
             
-            # 从后往前删除，避免索引变化
             deleted_reminders = []
-            for i in sorted(to_delete, reverse=True):
-                reminder = reminders[i]
-                
+            for reminder in reversed(to_delete):
                 # 调试信息：打印正在删除的任务
-                logger.info(f"Attempting to delete {'task' if reminder.get('is_task', False) else 'reminder'}: {reminder}")
-                
-                # 尝试删除调度任务
-                job_id = f"reminder_{msg_origin}_{i}"
-                try:
-                    self.scheduler_manager.remove_job(job_id)
-                    logger.info(f"Successfully removed job: {job_id}")
-                except Exception as e:
-                    logger.error(f"Error removing job {job_id}: {str(e)}")
+                logger.info(f"Attempting to delete {'task' if reminder.is_task else 'reminder'}: {reminder}")
                 
-                # 以防万一，也检查其他可能的任务
-                for job in self.scheduler_manager.scheduler.get_jobs():
-                    if len(job.args) >= 2 and isinstance(job.args[1], dict):
-                        job_reminder = job.args[1]
-                        if (job_reminder.get('text') == reminder['text'] and 
-                            job_reminder.get('datetime') == reminder['datetime']):
-                            try:
-                                logger.info(f"Removing additional job: {job.id}")
-                                job.remove()
-                            except Exception as e:
-                                logger.error(f"Error removing additional job {job.id}: {str(e)}")
+                # 按提醒ID删除调度任务
+                self.scheduler_manager.remove_reminder_job(reminder)
                 
                 deleted_reminders.append(reminder)
-                reminders.pop(i)
             
             # 更新数据
-            self.reminder_data[msg_origin] = reminders
-            await save_reminder_data(self.data_file, self.reminder_data)
+            await self.store.remove_many(msg_origin, deleted_reminders)
             
             # 调试信息：打印剩余的调度任务
             logger.info("Remaining jobs in scheduler:")
@@ -0,0 +1,177 @@
+import datetime
+import hashlib
+import sys
+from apscheduler.triggers.base import BaseTrigger
+from .models import Repeat, HolidayType
+
+# 与 APScheduler 任务的 misfire_grace_time 相同：超过触发时间这么多秒仍未执行则跳过本次
+MISFIRE_GRACE_TIME = 60
+
+# 节假日类型的提醒最多向后查找的天数，找不到符合条件的日期时视为没有下一次
+HOLIDAY_LOOKAHEAD = datetime.timedelta(days=400)
+
+
+def next_occurrence(reminder, after: datetime.datetime, calendar=None):
+    '''计算提醒在 after 之后（不含）的下一次触发时间，没有下一次时返回 None
+
+    与 APScheduler 的 cron 触发器规则一致：每天/每周/每月/每年在 reminder.dt 的时分触发，
+    每月的 31 日等不存在的日期跳过。传入 calendar（HolidayManager）时按已缓存的节假日数据
+    跳过不符合节假日类型的日期，触发时仍会再检查一次；向后 HOLIDAY_LOOKAHEAD 内都没有
+    符合条件的日期时返回 None，不把不符合条件的时间当作下一次。
+    '''
+    fire_at = _next_cron_time(reminder, after)
+    if calendar is None or reminder.holiday is HolidayType.ANY:
+        return fire_at
+    first = fire_at
+    while fire_at is not None and not calendar.check_cached(fire_at, reminder.holiday):
+        if fire_at - first > HOLIDAY_LOOKAHEAD:
+            return None
+        after = fire_at
+        if reminder.repeat is Repeat.INTERVAL:
+            # 同一天的其他时间点结果相同，直接跳到下一天
+            after = datetime.datetime.combine(fire_at.date(), datetime.time.max)
+        fire_at = _next_cron_time(reminder, after)
+    return fire_at
+
+
+def spread_offset(reminder_id: str, window: int) -> int:
+    '''由提醒ID得到 [0, window) 内固定不变的秒数偏移'''
+    if window <= 0:
+        return 0
+    return int(hashlib.md5(reminder_id.encode("utf-8")).hexdigest()[:8], 16) % window
+
+
+def _next_cron_time(reminder, after: datetime.datetime):
+    dt = reminder.dt
+    if dt is None:
+        return None
+    repeat = reminder.repeat
+    if repeat is Repeat.NONE:
+        return dt if dt > after else None
+    if repeat is Repeat.INTERVAL:
+        return _next_interval_time(reminder.interval, dt, after)
+
+    candidate = after.replace(hour=dt.hour, minute=dt.minute, second=0, microsecond=0)
+    if repeat is Repeat.DAILY:
+        if candidate <= after:
+            candidate += datetime.timedelta(days=1)
+        return candidate
+    if repeat is Repeat.WEEKLY:
+        candidate += datetime.timedelta(days=(dt.weekday() - candidate.weekday()) % 7)
+        if candidate <= after:
+            candidate += datetime.timedelta(days=7)
+        return candidate
+    if repeat is Repeat.MONTHLY:
+        year, month = after.year, after.month
+        for _ in range(13):
+            try:
+                candidate = datetime.datetime(year, month, dt.day, dt.hour, dt.minute)
+            except ValueError:
+                candidate = None
+            if candidate is not None and candidate > after:
+                return candidate
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        return None
+    if repeat is Repeat.YEARLY:
+        # 2月29日最多隔8年才出现一次
+        for year in range(after.year, after.year + 9):
+            try:
+                candidate = datetime.datetime(year, dt.month, dt.day, dt.hour, dt.minute)
+            except ValueError:
+                continue
+            if candidate > after:
+                return candidate
+    return None
+
+
+def _next_interval_time(interval, start: datetime.datetime, after: datetime.datetime):
+    '''间隔重复在 after 之后（不含）的下一次触发时间，不早于 start，超过持续时间后返回 None'''
+    step = datetime.timedelta(seconds=interval.seconds)
+    after = max(after, start - datetime.timedelta(microseconds=1))
+    if interval.window is None:
+        candidate = start + step * ((after - start) // step + 1) if after >= start else start
+    else:
+        day = after.date()
+        while True:
+            opens = datetime.datetime.combine(day, interval.window[0])
+            if after < opens:
+                candidate = opens
+            else:
+                candidate = opens + step * ((after - opens) // step + 1)
+            if candidate < datetime.datetime.combine(day, interval.window[1]):
+                break
+            day += datetime.timedelta(days=1)
+    if interval.duration and candidate >= start + datetime.timedelta(seconds=interval.duration):
+        return None
+    return candidate
+
+
+class HolidayCronTrigger(BaseTrigger):
+    """只在工作日或法定节假日触发的 cron 触发器
+
+    计算下一次触发时间时按已缓存的节假日数据跳过不符合条件的日期，
+    不会在每个不符合条件的日子唤醒一次再什么都不做。
+    HOLIDAY_LOOKAHEAD 内没有符合条件的日期时返回 None，任务随之结束。
+    """
+
+    __slots__ = ("cron", "holiday", "calendar")
+
+    def __init__(self, cron, holiday: HolidayType, calendar):
+        self.cron = cron
+        self.holiday = holiday
+        self.calendar = calendar  # HolidayManager
+
+    def get_next_fire_time(self, previous_fire_time, now):
+        first = fire_time = self.cron.get_next_fire_time(previous_fire_time, now)
+        if self.calendar is None:
+            return fire_time
+        while fire_time is not None and not self.calendar.check_cached(fire_time, self.holiday):
+            if fire_time - first > HOLIDAY_LOOKAHEAD:
+                return None
+            fire_time = self.cron.get_next_fire_time(fire_time, fire_time + datetime.timedelta(seconds=1))
+        return fire_time
+
+    def __getstate__(self):
+        # 持久化的任务存储只保存规则，节假日数据在读取时取当前实例的
+        return {"version": 1, "cron": self.cron, "holiday": self.holiday.value}
+
+    def __setstate__(self, state):
+        self.cron = state["cron"]
+        self.holiday = HolidayType(state["holiday"])
+        manager = getattr(sys, "_GLOBAL_SCHEDULER_REGISTRY", {}).get("manager")
+        self.calendar = manager.holiday_manager if manager is not None else None
+
+    def __str__(self):
+        return f"{self.holiday.value}[{self.cron}]"
+
+    def __repr__(self):
+        return f"<HolidayCronTrigger ({self.holiday.value}, {self.cron!r})>"
+
+
+class LeadTrigger(BaseTrigger):
+    """比内部触发器提前 lead 触发，用于提前执行任务"""
+
+    __slots__ = ("trigger", "lead")
+
+    def __init__(self, trigger, lead: datetime.timedelta):
+        self.trigger = trigger
+        self.lead = lead
+
+    def get_next_fire_time(self, previous_fire_time, now):
+        if previous_fire_time is not None:
+            previous_fire_time += self.lead
+        fire_time = self.trigger.get_next_fire_time(previous_fire_time, now + self.lead)
+        return fire_time - self.lead if fire_time is not None else None
+
+    def __getstate__(self):
+        return {"version": 1, "trigger": self.trigger, "lead": self.lead}
+
+    def __setstate__(self, state):
+        self.trigger = state["trigger"]
+        self.lead = state["lead"]
+
+    def __str__(self):
+        return f"lead{int(self.lead.total_seconds())}s[{self.trigger}]"
+
+    def __repr__(self):
+        return f"<LeadTrigger ({self.lead}, {self.trigger!r})>"
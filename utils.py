@@ -4,6 +4,7 @@ import os
 import re
 import aiohttp
 from astrbot.api import logger
+from .models import HolidayType, Reminder
 
 def parse_datetime(datetime_str: str) -> str:
     '''解析时间字符串，支持简单时间格式，可选择星期'''
@@ -44,6 +45,9 @@ def parse_datetime(datetime_str: str) -> str:
 
 def is_outdated(reminder: dict) -> bool:
     '''检查提醒是否过期'''
+    if isinstance(reminder, Reminder):
+        # 时间已在创建时解析
+        return reminder.dt is not None and reminder.dt < datetime.datetime.now()
     if "datetime" in reminder and reminder["datetime"]:  # 确保datetime存在且不为空
         try:
             return datetime.datetime.strptime(reminder["datetime"], "%Y-%m-%d %H:%M") < datetime.datetime.now()
@@ -53,30 +57,6 @@ def is_outdated(reminder: dict) -> bool:
             return False
     return False
 
-def load_reminder_data(data_file: str) -> dict:
-    '''加载提醒数据'''
-    if not os.path.exists(data_file):
-        with open(data_file, "w", encoding='utf-8') as f:
-            f.write("{}")
-    with open(data_file, "r", encoding='utf-8') as f:
-        return json.load(f)
-
-async def save_reminder_data(data_file: str, reminder_data: dict):
-    '''保存提醒数据'''
-    # 在保存前清理过期的一次性任务和无效数据
-    for group in list(reminder_data.keys()):
-        reminder_data[group] = [
-            r for r in reminder_data[group] 
-            if "datetime" in r and r["datetime"] and  # 确保datetime字段存在且不为空
-               not (r.get("repeat", "none") == "none" and is_outdated(r))
-        ]
-        # 如果群组没有任何提醒了，删除这个群组的条目
-        if not reminder_data[group]:
-            del reminder_data[group]
-            
-    with open(data_file, "w", encoding='utf-8') as f:
-        json.dump(reminder_data, f, ensure_ascii=False)
-
 def filter_thinking_content(completion_text: str) -> str:
     """过滤掉思考链标签和内容"""
     if not isinstance(completion_text, str):
@@ -218,6 +198,23 @@ class HolidayManager:
             
         return False
     
+    def check_cached(self, date: datetime.datetime, holiday_type: HolidayType) -> bool:
+        """只用已缓存的节假日数据判断日期是否符合节假日类型，不发起网络请求
+        
+        用于计算下一次触发时间。该年份还没有缓存（或缓存已过期）时无法知道调休和法定节假日，
+        不跳过任何日期，由触发时的 is_workday/is_holiday 查询决定是否执行。
+        """
+        year_data = self.holiday_data.get(str(date.year))
+        if not isinstance(year_data, dict) or "data" not in year_data:
+            return True
+        holiday_data = year_data["data"]
+        short_date_str = date.strftime("%m-%d")
+        if short_date_str in holiday_data:
+            is_holiday = holiday_data[short_date_str] == True
+        else:
+            is_holiday = date.weekday() >= 5
+        return is_holiday if holiday_type is HolidayType.HOLIDAY else not is_holiday
+    
     async def is_workday(self, date: datetime.datetime = None) -> bool:
         """判断指定日期是否为工作日
         